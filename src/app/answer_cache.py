@@ -0,0 +1,100 @@
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# 검색된 청크 집합 식별자(순서 무관)
+def chunk_key(docs: List[Dict[str, Any]]) -> str:
+    parts = sorted(
+        "{}|{}|{}".format(
+            d.get("source") or "",
+            d.get("path") or "",
+            hashlib.sha1((d.get("content") or "").encode("utf-8")).hexdigest(),
+        )
+        for d in docs
+    )
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+# 대화 히스토리 식별자(같은 질문이라도 맥락이 다르면 다른 답변)
+def history_key(history: List[Dict[str, str]] | None) -> str:
+    items = [[m.get("role") or "", m.get("content") or ""] for m in (history or [])]
+    raw = json.dumps(items, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _unit(vec: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+# 의미 기반 답변 캐시: 같은 청크 집합 + 히스토리 버킷 안에서 질문 벡터 코사인 유사도로 매칭
+class AnswerCache:
+    def __init__(self, maxsize: int = 256, ttl: float = 600, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, str], List[int]] = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, eid: int) -> None:
+        entry = self._entries.pop(eid, None)
+        if entry is None:
+            return
+        bucket = self._buckets.get(entry["bucket"], [])
+        if eid in bucket:
+            bucket.remove(eid)
+        if not bucket:
+            self._buckets.pop(entry["bucket"], None)
+
+    def lookup(
+        self, qvec: List[float], ckey: str, hkey: str
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        q = _unit(qvec)
+        now = time.time()
+        with self._lock:
+            best, best_sim = None, -1.0
+            for eid in list(self._buckets.get((ckey, hkey), [])):
+                entry = self._entries[eid]
+                if entry["expires"] < now:
+                    self._drop(eid)
+                    continue
+                sim = sum(a * b for a, b in zip(q, entry["qvec"]))
+                if sim > best_sim:
+                    best, best_sim = eid, sim
+            if best is not None and best_sim >= self.threshold:
+                self._entries.move_to_end(best)
+                self.hits += 1
+                return self._entries[best], best_sim
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        qvec: List[float],
+        ckey: str,
+        hkey: str,
+        answer: str,
+        citations: List[Dict[str, Any]],
+        ttl: float | None = None,
+    ) -> None:
+        with self._lock:
+            self._seq += 1
+            eid = self._seq
+            self._entries[eid] = {
+                "bucket": (ckey, hkey),
+                "qvec": _unit(qvec),
+                "answer": answer,
+                "citations": citations,
+                "expires": time.time() + (self.ttl if ttl is None else ttl),
+            }
+            self._buckets.setdefault((ckey, hkey), []).append(eid)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,292 @@
+import asyncio
+import contextlib
+import json
+import time
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from .config import settings
+from .startup import readiness
+from .retriever import aretrieve, embedCache, warm_embed_cache
+from .clients import aclose_clients
+from .condense import acondense_question
+from .answer_cache import chunk_key, history_key
+from .pipeline import (
+    UnknownSessionError, afaq_lookup, agenerate_once, answerCache, aparse_ask, aremember, astream_once, degraded_answer, build_citations,
+    sse_event, stats_metrics,
+)
+from .resilience import error_status, stats as resilience_stats
+from .faq import faqIndex, start_refresh
+from .sessions import sessionStore
+from .embed_service import get_embed_service
+from .batch import arun_batch, jsonl_line, parse_batch
+from .metrics import (
+    begin_request, current_timings, end_request, observe_cache, observe_request,
+    render, server_timing, start_profiler, stage,
+)
+
+# asyncio 기반 서빙 모드: Flask(main.py)와 동일한 /health, /ask, /ask/stream 계약
+# 실행: uvicorn src.app.asgi:app --host 0.0.0.0 --port 8000
+
+profiler = start_profiler(settings.profiler_interval_ms) if settings.profiler else None
+
+# 요청별 단계 시간을 모아 Server-Timing 헤더로 내보내는 ASGI 미들웨어(스트리밍 응답도 헤더 시점까지 측정)
+class ServerTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        token = begin_request()
+        timings = current_timings()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - t0
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", server_timing(timings, total))
+                route = scope["path"] if scope["path"] in _ROUTES else "other"
+                observe_request(route, message["status"], total)
+                if "x-cache" in headers:
+                    observe_cache(headers["x-cache"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_request(token)
+
+#헬스체크용
+async def health(request: Request):
+    return JSONResponse({
+        "status": "ok",
+        "embed_cache": embedCache.stats(),
+        "answer_cache": answerCache.stats(),
+        "faq": faqIndex.stats(),
+        "embed_service": get_embed_service().stats(),
+        "startup": {"ready": readiness.ready, "ready_ms": readiness.ready_ms, "budget_ms": readiness.budget_ms},
+        "circuits": resilience_stats(),
+    })
+
+# 준비 상태 확인용 - 예열이 끝나기 전에는 503
+async def ready(request: Request):
+    return JSONResponse(readiness.status(), status_code=200 if readiness.ready else 503)
+
+# Prometheus 지표
+async def metrics(request: Request):
+    return PlainTextResponse(render(stats_metrics()), media_type="text/plain; version=0.0.4")
+
+# 프로파일러 샘플(collapsed stack, ?reset=1 이면 조회 후 초기화)
+async def debug_profile(request: Request):
+    if profiler is None:
+        return JSONResponse({"error": "profiler disabled (PROFILER=true)"}, status_code=404)
+    return PlainTextResponse(profiler.collapsed(reset=request.query_params.get("reset") == "1"))
+
+# 요청 본문 파싱(Flask 와 동일): 잘못된 JSON/파라메터는 400, 다른 인스턴스에서 이어진 세션이면 409
+async def _parse_request(request: Request):
+    body = await request.body()
+    try:
+        payload = json.loads(body) if body.strip() else None
+    except ValueError:
+        return None, JSONResponse({"error": "invalid JSON body"}, status_code=400)
+    try:
+        return await aparse_ask({} if payload is None else payload), None
+    except UnknownSessionError:
+        return None, JSONResponse({"error": "unknown_session"}, status_code=409)
+    except ValueError as e:
+        return None, JSONResponse({"error": str(e)}, status_code=400)
+
+# 질문 처리 API
+async def ask(request: Request):
+    try:
+        req, error = await _parse_request(request)
+        if error:
+            return error
+        question, history = req.question, req.history
+
+        if not question:
+            return JSONResponse({"error": "question required"}, status_code=400)
+
+        # 0) FAQ 사전 계산 답변
+        faq = await afaq_lookup(req)
+        if faq:
+            entry, sim = faq
+            await aremember(req, entry["answer"])
+            return JSONResponse(
+                {"answer": entry["answer"], "citations": entry["citations"]},
+                headers={"X-Cache": "FAQ", "X-Cache-Similarity": f"{sim:.4f}"},
+            )
+
+        # 1) 검색 (하이브리드, 후속 질문은 독립 질의로 재작성 후 검색)
+        try:
+            docs, qvec = await aretrieve(await acondense_question(question, history), k=req.k)
+        except Exception as e:
+            return JSONResponse({"error": f"search_failed: {e}"}, status_code=error_status(e))
+
+        # 2) 답변 캐시 조회
+        ckey, hkey = chunk_key(docs), history_key(history[-8:])
+        if not req.no_cache and qvec is not None:
+            with stage("cache"):
+                hit = answerCache.lookup(qvec, ckey, hkey)
+            if hit:
+                entry, sim = hit
+                await aremember(req, entry["answer"])
+                return JSONResponse(
+                    {"answer": entry["answer"], "citations": entry["citations"], "k": len(docs)},
+                    headers={"X-Cache": "HIT", "X-Cache-Similarity": f"{sim:.4f}"},
+                )
+
+        # 3) 생성 (LLM)
+        try:
+            answer = await agenerate_once(req, docs, qvec, ckey, hkey)
+        except Exception as e:
+            fallback = degraded_answer(docs, e)
+            if fallback is None:
+                return JSONResponse({"error": f"llm_failed: {e}"}, status_code=error_status(e))
+            return JSONResponse(
+                {"answer": fallback, "citations": build_citations(docs), "k": len(docs), "degraded": "llm"},
+                headers={"X-Degraded": "llm"},
+            )
+
+        # 4) 인용 정보 구성 및 응답 반환
+        citations = build_citations(docs)
+        await aremember(req, answer)
+        return JSONResponse(
+            {"answer": answer, "citations": citations, "k": len(docs)},
+            headers={"X-Cache": "BYPASS" if req.no_cache else "MISS"},
+        )
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+# 스트리밍 질문 처리 API (SSE: citations → token* → done)
+async def ask_stream(request: Request):
+    req, error = await _parse_request(request)
+    if error:
+        return error
+    question, history = req.question, req.history
+
+    if not question:
+        return JSONResponse({"error": "question required"}, status_code=400)
+
+    faq = hit = await afaq_lookup(req)
+    if not faq:
+        try:
+            docs, qvec = await aretrieve(await acondense_question(question, history), k=req.k)
+        except Exception as e:
+            return JSONResponse({"error": f"search_failed: {e}"}, status_code=error_status(e))
+
+        ckey, hkey = chunk_key(docs), history_key(history[-8:])
+        with stage("cache"):
+            hit = None if req.no_cache or qvec is None else answerCache.lookup(qvec, ckey, hkey)
+
+    async def events():
+        if hit:
+            entry, _ = hit
+            await aremember(req, entry["answer"])
+            yield sse_event("citations", entry["citations"])
+            yield sse_event("token", {"t": entry["answer"]})
+            yield sse_event("done", {})
+            return
+
+        citations = build_citations(docs)
+        yield sse_event("citations", citations)
+        parts = []
+        try:
+            async for token in astream_once(req, docs, qvec, ckey, hkey):
+                parts.append(token)
+                yield sse_event("token", {"t": token})
+        except Exception as e:
+            fallback = None if parts else degraded_answer(docs, e)
+            if fallback is None:
+                yield sse_event("error", {"error": f"llm_failed: {e}"})
+            else:
+                yield sse_event("token", {"t": fallback})
+                yield sse_event("done", {"degraded": "llm"})
+            return
+        await aremember(req, "".join(parts))
+        yield sse_event("done", {})
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "X-Cache": "FAQ" if faq else "HIT" if hit else ("BYPASS" if req.no_cache else "MISS"),
+    }
+    if not faq:
+        headers["X-Retrieval-K"] = str(len(docs))
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+# 서버 측 세션 조회/삭제(sqlite 접근은 스레드에서)
+async def get_session(request: Request):
+    sid = request.path_params["sid"]
+    history = await asyncio.to_thread(sessionStore.history, sid)
+    return JSONResponse({"session_id": sid, "messages": [
+        {"role": m["role"], "content": m["content"]} for m in history
+    ]})
+
+async def delete_session(request: Request):
+    sid = request.path_params["sid"]
+    await asyncio.to_thread(sessionStore.delete, sid)
+    return JSONResponse({"session_id": sid, "deleted": True})
+
+# 일괄 질의 API: JSONL 또는 {"items": [...]} 를 받아 끝나는 순서대로 JSONL 스트리밍
+async def ask_batch(request: Request):
+    try:
+        items, concurrency, skip = parse_batch(await request.body())
+    except ValueError as e:
+        return JSONResponse({"error": f"invalid batch: {e}"}, status_code=400)
+    if len(items) > settings.batch_max_items:
+        return JSONResponse({"error": f"too many items (max {settings.batch_max_items})"}, status_code=413)
+
+    async def lines():
+        async for r in arun_batch(items, concurrency, skip):
+            yield jsonl_line(r)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+# 기동/종료 처리: 클라이언트·커넥션 예열, 임베딩 캐시 예열, FAQ 갱신 스레드, 비동기 클라이언트 정리
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    readiness.astart()
+    if settings.embed_cache_warm_file:
+        asyncio.get_running_loop().run_in_executor(
+            None, warm_embed_cache, settings.embed_cache_warm_file
+        )
+    if settings.faq_index:
+        start_refresh(settings.faq_index, settings.faq_refresh_seconds)
+    yield
+    await aclose_clients()
+
+routes = [
+    Route("/health", health, methods=["GET"]),
+    Route("/ready", ready, methods=["GET"]),
+    Route("/metrics", metrics, methods=["GET"]),
+    Route("/debug/profile", debug_profile, methods=["GET"]),
+    Route("/ask", ask, methods=["POST"]),
+    Route("/ask/stream", ask_stream, methods=["POST"]),
+    Route("/ask/batch", ask_batch, methods=["POST"]),
+    Route("/session/{sid}", get_session, methods=["GET"]),
+    Route("/session/{sid}", delete_session, methods=["DELETE"]),
+]
+_ROUTES = {r.path for r in routes}
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(ServerTimingMiddleware),
+    ],
+    lifespan=lifespan,
+)
+readiness.mark_imported()
+
+# 메인
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=settings.host, port=settings.port)
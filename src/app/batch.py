@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Set
+from .config import settings
+from .answer_cache import chunk_key, history_key
+from .condense import acondense_question, condense_question
+from .embed_cache import normalize_query
+from .pipeline import AskRequest, afaq_lookup, agenerate_once, answerCache, build_citations, faq_lookup, generate_once, parse_ask
+from .retriever import aretrieve, prefetch_embeddings, retrieve
+
+# 일괄 질의(회귀 평가용): 중복 질문은 한 번만 처리하고, 임베딩은 배치로 미리 계산,
+# 검색/생성은 동시성 제한 안에서 실행하며 끝나는 순서대로 JSONL 한 줄씩 반환한다.
+# 실행: python -m src.app.batch questions.jsonl --out results.jsonl [--url http://localhost:8000]
+#       (같은 --out 으로 다시 실행하면 성공한 id 는 건너뛰고 이어서 처리)
+
+_WAVE = 256  # 임베딩 선계산 단위(임베딩 캐시에서 밀려나지 않도록 나눠서 처리)
+
+# 결과 식별자: 입력에 id 가 있으면 그대로, 없으면 질문/k/히스토리 해시(재실행해도 같은 값)
+def item_id(item: Dict[str, Any]) -> str:
+    if item.get("id") is not None:
+        return str(item["id"])
+    raw = json.dumps([item.get("question") or "", item.get("k") or 5, item.get("history") or []], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+# JSONL 한 줄: JSON 객체 또는 질문 텍스트(JSON 배열로 시작하는 줄은 JSON 으로 읽어 이후 검사에서 거절)
+def parse_line(line: str) -> Dict[str, Any]:
+    line = line.strip()
+    return json.loads(line) if line.startswith(("{", "[")) else {"question": line}
+
+# (id, 요청) 목록을 같은 질문끼리 묶음: 정규화 질문 + k + 히스토리 + no_cache.
+# 처리할 수 없는 항목(질문 없음, 잘못된 k 등)은 (id, 오류) 목록으로 따로 반환
+def group_items(items: Iterable[Dict[str, Any]], skip: Set[str] = frozenset()) -> tuple:
+    groups: Dict[tuple, tuple] = {}
+    invalid: List[tuple] = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            invalid.append((f"#{i}", "invalid item: expected an object"))
+            continue
+        iid = item_id(item)
+        if iid in skip:
+            continue
+        try:
+            req = parse_ask(item)
+        except ValueError as e:
+            invalid.append((iid, f"invalid item: {e}"))
+            continue
+        if not req.question:
+            invalid.append((iid, "question required"))
+            continue
+        key = (normalize_query(req.question), req.k, history_key(req.history[-8:]), req.no_cache)
+        groups.setdefault(key, (req, []))[1].append(iid)
+    return list(groups.values()), invalid
+
+def _timed(out: Dict[str, Any], t0: float) -> Dict[str, Any]:
+    out["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return out
+
+# /ask 와 같은 순서(FAQ → 검색 → 답변 캐시 → 생성)로 한 건 처리
+def answer_one(req: AskRequest) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    try:
+        faq = faq_lookup(req)
+        if faq:
+            return _timed({"answer": faq[0]["answer"], "citations": faq[0]["citations"], "cache": "FAQ"}, t0)
+        docs, qvec = retrieve(condense_question(req.question, req.history), k=req.k)
+        ckey, hkey = chunk_key(docs), history_key(req.history[-8:])
+        hit = None if req.no_cache or qvec is None else answerCache.lookup(qvec, ckey, hkey)
+        if hit:
+            out = {"answer": hit[0]["answer"], "citations": hit[0]["citations"], "cache": "HIT"}
+        else:
+            answer = generate_once(req, docs, qvec, ckey, hkey)
+            out = {"answer": answer, "citations": build_citations(docs), "cache": "BYPASS" if req.no_cache else "MISS"}
+        out["k"] = len(docs)
+    except Exception as e:
+        out = {"error": str(e)}
+    return _timed(out, t0)
+
+async def aanswer_one(req: AskRequest) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    try:
+        faq = await afaq_lookup(req)
+        if faq:
+            return _timed({"answer": faq[0]["answer"], "citations": faq[0]["citations"], "cache": "FAQ"}, t0)
+        docs, qvec = await aretrieve(await acondense_question(req.question, req.history), k=req.k)
+        ckey, hkey = chunk_key(docs), history_key(req.history[-8:])
+        hit = None if req.no_cache or qvec is None else answerCache.lookup(qvec, ckey, hkey)
+        if hit:
+            out = {"answer": hit[0]["answer"], "citations": hit[0]["citations"], "cache": "HIT"}
+        else:
+            answer = await agenerate_once(req, docs, qvec, ckey, hkey)
+            out = {"answer": answer, "citations": build_citations(docs), "cache": "BYPASS" if req.no_cache else "MISS"}
+        out["k"] = len(docs)
+    except Exception as e:
+        out = {"error": str(e)}
+    return _timed(out, t0)
+
+def _lines(req: AskRequest, ids: List[str], out: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for iid in ids:
+        yield {"id": iid, "question": req.question, **out}
+
+# 요청한 동시성은 BATCH_CONCURRENCY 를 넘지 않게 제한
+def _workers(concurrency: int | None) -> int:
+    return max(1, min(int(concurrency or settings.batch_concurrency), settings.batch_concurrency))
+
+def run_batch(items: Iterable[Dict[str, Any]], concurrency: int | None = None, skip: Set[str] = frozenset()) -> Iterator[Dict[str, Any]]:
+    groups, invalid = group_items(items, skip)
+    for iid, error in invalid:
+        yield {"id": iid, "error": error}
+    with ThreadPoolExecutor(max_workers=_workers(concurrency), thread_name_prefix="batch") as pool:
+        for i in range(0, len(groups), _WAVE):
+            wave = groups[i:i + _WAVE]
+            try:
+                prefetch_embeddings([req.question for req, _ in wave])
+            except Exception:
+                pass  # 배치 임베딩 실패 시 건별 임베딩으로 진행(오류는 각 결과에 기록)
+            futs = {pool.submit(answer_one, req): (req, ids) for req, ids in wave}
+            for fut in as_completed(futs):
+                req, ids = futs[fut]
+                yield from _lines(req, ids, fut.result())
+
+async def arun_batch(items: Iterable[Dict[str, Any]], concurrency: int | None = None, skip: Set[str] = frozenset()) -> AsyncIterator[Dict[str, Any]]:
+    groups, invalid = group_items(items, skip)
+    for iid, error in invalid:
+        yield {"id": iid, "error": error}
+    sem = asyncio.Semaphore(_workers(concurrency))
+    loop = asyncio.get_running_loop()
+
+    async def one(req: AskRequest, ids: List[str]):
+        async with sem:
+            return req, ids, await aanswer_one(req)
+
+    for i in range(0, len(groups), _WAVE):
+        wave = groups[i:i + _WAVE]
+        try:
+            await loop.run_in_executor(None, prefetch_embeddings, [req.question for req, _ in wave])
+        except Exception:
+            pass
+        for fut in asyncio.as_completed([one(req, ids) for req, ids in wave]):
+            req, ids, out = await fut
+            for line in _lines(req, ids, out):
+                yield line
+
+# 요청 본문 파싱: {"items": [...], "concurrency": n, "skip": [...]}(여러 줄 JSON 포함) 또는 JSONL(한 줄에 질문 하나)
+# 항목은 스트리밍 응답을 시작하기 전에 모두 검사(잘못된 항목이 있으면 ValueError → 400)
+def parse_batch(body: bytes) -> tuple:
+    text = body.decode("utf-8").strip()
+    try:
+        payload = json.loads(text) if text.startswith(("{", "[")) else None
+    except json.JSONDecodeError:
+        payload = None  # 여러 줄 JSONL
+    if payload is not None and not isinstance(payload, dict):
+        raise ValueError("body must be a JSON object or JSONL")
+    if isinstance(payload, dict) and "items" in payload:
+        items, concurrency, skip = payload["items"] or [], payload.get("concurrency"), set(payload.get("skip") or [])
+    elif isinstance(payload, dict):
+        items, concurrency, skip = [payload], None, set()  # 질문 하나짜리 JSON 객체
+    else:
+        items, concurrency, skip = [parse_line(line) for line in text.splitlines() if line.strip()], None, set()
+    if not isinstance(items, list):
+        raise ValueError("items must be a list")
+    if concurrency is not None:
+        try:
+            concurrency = int(concurrency)
+        except (TypeError, ValueError):
+            raise ValueError("concurrency must be an integer") from None
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"item {i}: expected an object")
+        try:
+            parse_ask(item)
+        except ValueError as e:
+            raise ValueError(f"item {i}: {e}") from None
+    return items, concurrency, skip
+
+def jsonl_line(obj: Dict[str, Any]) -> str:
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+# 이전 실행 결과에서 오류 없이 끝난 id(오류였던 id 는 다시 실행, 같은 id 는 마지막 줄이 최신)
+def done_ids(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 중단 시 마지막 줄이 잘렸을 수 있음
+            if "error" not in rec:
+                done.add(rec["id"])
+    return done
+
+# 서버의 /ask/batch 로 전송하고 스트리밍 결과를 줄 단위로 받음
+def _remote(url: str, items: List[Dict[str, Any]], concurrency: int | None) -> Iterator[Dict[str, Any]]:
+    import httpx
+
+    body = {"items": [{**it, "id": item_id(it)} for it in items], "concurrency": concurrency}
+    with httpx.stream("POST", url.rstrip("/") + "/ask/batch", json=body, timeout=None) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="batch question answering (JSONL in → JSONL out)")
+    parser.add_argument("questions", help="질문 JSONL({question, id?, k?, history?, no_cache?}) 또는 한 줄 한 질문 텍스트")
+    parser.add_argument("--out", required=True, help="결과 JSONL(이미 있으면 성공한 id 는 건너뜀)")
+    parser.add_argument("--url", default=None, help="API 서버 주소(생략 시 현재 프로세스에서 실행)")
+    parser.add_argument("--concurrency", type=int, default=None)
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        items = [parse_line(line) for line in f if line.strip()]
+    skip = done_ids(args.out)
+    todo = [it for it in items if item_id(it) not in skip]
+    print(json.dumps({"total": len(items), "done": len(items) - len(todo), "todo": len(todo)}), file=sys.stderr)
+
+    t0, n, errors = time.perf_counter(), 0, 0
+    results = _remote(args.url, todo, args.concurrency) if args.url else run_batch(todo, args.concurrency)
+    with open(args.out, "a", encoding="utf-8") as out:
+        for rec in results:
+            out.write(jsonl_line(rec))
+            out.flush()  # 중단돼도 끝난 결과는 남도록
+            n += 1
+            errors += "error" in rec
+    print(json.dumps({"written": n, "errors": errors, "seconds": round(time.perf_counter() - t0, 1)}), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
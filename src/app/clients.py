@@ -0,0 +1,149 @@
+import importlib.util
+from functools import lru_cache
+from typing import TYPE_CHECKING
+from .config import settings
+
+if TYPE_CHECKING:
+    import httpx
+    from azure.search.documents import SearchClient
+    from azure.search.documents.aio import SearchClient as AsyncSearchClient
+    from langchain_core.embeddings import Embeddings
+    from langchain_openai import AzureChatOpenAI
+
+# 프로세스 단위로 공유하는 Azure 클라이언트(요청마다 TLS/커넥션을 새로 맺지 않도록 재사용)
+# SDK(langchain_openai ≈ 1.5s, azure.search) import 는 처음 사용할 때로 미뤄 기동 시간을 줄인다.
+
+# h2 패키지가 설치된 경우에만 HTTP/2 사용
+def _use_http2() -> bool:
+    return settings.http2 and importlib.util.find_spec("h2") is not None
+
+def _limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=settings.http_pool_size,
+        max_keepalive_connections=settings.http_pool_size,
+        keepalive_expiry=settings.http_keepalive,
+    )
+
+def _timeout(read: float) -> "httpx.Timeout":
+    import httpx
+
+    return httpx.Timeout(read, connect=settings.http_connect_timeout)
+
+# Azure OpenAI 공용 HTTP 커넥션 풀(동기/비동기)
+@lru_cache(maxsize=None)
+def http_client() -> "httpx.Client":
+    import httpx
+
+    return httpx.Client(http2=_use_http2(), limits=_limits(), timeout=_timeout(settings.llm_timeout))
+
+@lru_cache(maxsize=None)
+def async_http_client() -> "httpx.AsyncClient":
+    import httpx
+
+    return httpx.AsyncClient(http2=_use_http2(), limits=_limits(), timeout=_timeout(settings.llm_timeout))
+
+# Chat 모델
+@lru_cache(maxsize=None)
+def get_llm() -> "AzureChatOpenAI":
+    from langchain_openai import AzureChatOpenAI
+
+    return AzureChatOpenAI(
+        azure_endpoint=settings.aoai_endpoint,
+        api_key=settings.aoai_key,
+        azure_deployment=settings.aoai_chat,
+        api_version=settings.aoai_api_version,
+        temperature=0.2,
+        stream_usage=True,  # 스트리밍 응답에도 토큰 사용량 포함(/metrics)
+        timeout=_timeout(settings.llm_timeout),
+        max_retries=settings.http_max_retries,
+        http_client=http_client(),
+        http_async_client=async_http_client(),
+    )
+
+# 보조 작업(대화 요약 등)용 Chat 모델: 저비용 배포, 결정적 출력
+@lru_cache(maxsize=None)
+def get_aux_llm() -> "AzureChatOpenAI":
+    from langchain_openai import AzureChatOpenAI
+
+    return AzureChatOpenAI(
+        azure_endpoint=settings.aoai_endpoint,
+        api_key=settings.aoai_key,
+        azure_deployment=settings.aoai_aux_chat or settings.aoai_chat,
+        api_version=settings.aoai_api_version,
+        temperature=0,
+        timeout=_timeout(settings.llm_timeout),
+        max_retries=settings.http_max_retries,
+        http_client=http_client(),
+        http_async_client=async_http_client(),
+    )
+
+# Embedding 모델(EMBEDDER=hash 이면 오프라인 해시 임베딩)
+@lru_cache(maxsize=None)
+def get_embeddings() -> "Embeddings":
+    if settings.embedder == "hash":
+        from .local_index import HashEmbeddings
+
+        return HashEmbeddings()
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    return AzureOpenAIEmbeddings(
+        azure_endpoint=settings.aoai_endpoint,
+        api_key=settings.aoai_key,
+        azure_deployment=settings.aoai_embed,
+        api_version=settings.aoai_api_version,
+        # 질문/청크(최대 2000자)는 모델 한도보다 훨씬 짧아 클라이언트 측 tiktoken 분할 검사를 생략
+        check_embedding_ctx_length=False,
+        timeout=_timeout(settings.embed_timeout),
+        max_retries=0,  # 재시도는 임베딩 서비스가 담당(EMBED_MAX_RETRIES, 중복 재시도 방지)
+        http_client=http_client(),
+        http_async_client=async_http_client(),
+    )
+
+# Azure AI Search (requests 세션 풀 크기 지정)
+@lru_cache(maxsize=None)
+def get_search_client() -> "SearchClient":
+    import requests
+    from requests.adapters import HTTPAdapter
+    from azure.core.credentials import AzureKeyCredential
+    from azure.core.pipeline.transport import RequestsTransport
+    from azure.search.documents import SearchClient
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=settings.http_pool_size, pool_maxsize=settings.http_pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    transport = RequestsTransport(
+        session=session,
+        session_owner=False,
+        connection_timeout=settings.http_connect_timeout,
+        read_timeout=settings.search_timeout,
+    )
+    return SearchClient(
+        settings.search_endpoint,
+        settings.search_index,
+        AzureKeyCredential(settings.search_key),
+        transport=transport,
+    )
+
+# Azure AI Search 비동기 클라이언트(ASGI 모드, aiohttp 세션은 첫 호출 시 생성)
+@lru_cache(maxsize=None)
+def get_async_search_client() -> "AsyncSearchClient":
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents.aio import SearchClient as AsyncSearchClient
+
+    return AsyncSearchClient(
+        settings.search_endpoint,
+        settings.search_index,
+        AzureKeyCredential(settings.search_key),
+        connection_timeout=settings.http_connect_timeout,
+        read_timeout=settings.search_timeout,
+    )
+
+# 비동기 클라이언트 정리(ASGI 종료 시)
+async def aclose_clients() -> None:
+    if get_async_search_client.cache_info().currsize:
+        await get_async_search_client().close()
+    if async_http_client.cache_info().currsize:
+        await async_http_client().aclose()
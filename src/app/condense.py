@@ -0,0 +1,156 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from .config import settings
+from .answer_cache import history_key
+from .clients import get_aux_llm
+from .embed_cache import normalize_query
+from .metrics import stage
+from .rag_chain import load_prompt
+from .resilience import auxGuard
+
+# 후속 질문 재작성(condense question): "그 예제 코드 보여줘" 같은 질문은 그대로 검색하면
+# 엉뚱한 청크가 나오므로, 히스토리를 참고해 독립적인 검색 질의로 바꾼 뒤 검색에 사용한다.
+# - 히스토리가 없거나 지시어 없이 충분히 구체적인 질문은 재작성하지 않음(추가 지연 0)
+# - CONDENSE_MODE=llm: 보조 배포로 재작성, heuristic: 직전 사용자 질문을 앞에 붙임(LLM 호출 없음), off: 사용 안 함
+# - 결과는 (히스토리 해시, 정규화 질문) 단위로 캐시
+
+log = logging.getLogger(__name__)
+
+_CONTEXT_MESSAGES = 4  # 재작성에 참고할 최근 메시지 수(두 턴)
+_MAX_TOKENS = 96
+
+# 앞 대화를 가리키는 표현: 질문 첫 단어가 지시어/접속어일 때만(단어 전체 일치, "그래프" 같은 명사는 제외)
+# - 지시어(+조사): 그/이/저, 그거·이것·저건, 그런·이렇게, 그럼·그러면·그래서 …
+# - 후속 요청: 아까, 방금, 위에서, 앞에서, 마찬가지로, 또, 다시, 더
+# - 영어: it, this, that, these, those, they, them, and, also, then, so, what/how about
+_FOLLOWUP_RE = re.compile(
+    r"^(?:"
+    r"(?:그|이|저)(?:거|것|게|걸|건|런|렇게|럼|러면|렇다면|래서)?(?:은|는|이|가|을|를|도|만|로|으로|에|에서|의)?"
+    r"|아까|방금|위에서?|앞에서?|마찬가지로|또|다시|더"
+    r"|it|this|that|these|those|they|them|and|also|then|so|what about|how about"
+    r")(?=[\s?!.,]|$)",
+    re.IGNORECASE,
+)
+_MIN_WORDS = 2  # 한 단어 질문("예제는?")은 맥락 의존으로 간주
+
+# 히스토리 없이도 검색 가능한 질문인지(로컬 휴리스틱)
+def is_standalone(question: str, history: List[Dict[str, Any]] | None) -> bool:
+    if not _recent(history):
+        return True
+    question = question.strip()
+    return len(question.split()) >= _MIN_WORDS and not _FOLLOWUP_RE.match(question)
+
+# 요약 메시지를 제외한 최근 대화
+def _recent(history: List[Dict[str, Any]] | None) -> List[Dict[str, Any]]:
+    return [m for m in (history or []) if m.get("role") in ("user", "assistant")][-_CONTEXT_MESSAGES:]
+
+def _summary(history: List[Dict[str, Any]] | None) -> str:
+    return next((m.get("content") or "" for m in (history or []) if m.get("role") == "summary"), "")
+
+# 재작성 결과 캐시: 프로세스 내 LRU + TTL
+class CondenseCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._mem: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(question: str, history: List[Dict[str, Any]] | None) -> str:
+        raw = f"{history_key(_recent(history))}\x00{_summary(history)}\x00{normalize_query(question)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit and (self.ttl <= 0 or time.time() - hit[0] <= self.ttl):
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+            if hit:
+                del self._mem[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, query: str) -> None:
+        with self._lock:
+            self._mem[key] = (time.time(), query)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.maxsize:
+                self._mem.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._mem), "hits": self.hits, "misses": self.misses}
+
+condenseCache = CondenseCache(maxsize=settings.condense_cache_size, ttl=settings.condense_cache_ttl)
+
+# LLM 없이 재작성: 직전 사용자 질문을 앞에 붙여 검색어에 맥락 키워드를 보탬
+def heuristic_condense(question: str, history: List[Dict[str, Any]] | None) -> str:
+    prev = next((m.get("content") or "" for m in reversed(_recent(history)) if m.get("role") == "user"), "")
+    return f"{prev} {question}".strip()
+
+def _messages(question: str, history: List[Dict[str, Any]] | None) -> List[BaseMessage]:
+    lines = []
+    if _summary(history):
+        lines.append(f"[이전 요약] {_summary(history)}")
+    for m in _recent(history):
+        lines.append(f"[{'사용자' if m['role'] == 'user' else '도우미'}] {m.get('content') or ''}")
+    body = "대화:\n" + "\n\n".join(lines) + f"\n\n후속 질문: {question}"
+    return [SystemMessage(content=load_prompt("condense_ko.md")), HumanMessage(content=body)]
+
+# 모델 출력 정리: 첫 줄만, 비었거나 지나치게 길면 휴리스틱으로 대체
+def _clean(text: str, question: str, history: List[Dict[str, Any]] | None) -> str:
+    lines = [line.strip().strip("\"'") for line in (text or "").strip().splitlines() if line.strip()]
+    query = lines[0] if lines else ""
+    if query.startswith("후속 질문:"):
+        query = query[len("후속 질문:"):].strip()
+    if not query or len(query) > max(4 * len(question), 300):
+        return heuristic_condense(question, history)
+    return query
+
+def _cached(question: str, history: List[Dict[str, Any]] | None) -> tuple:
+    if settings.condense_mode == "off" or is_standalone(question, history):
+        return question, None
+    if settings.condense_mode == "heuristic":
+        return heuristic_condense(question, history), None
+    key = CondenseCache.key(question, history)
+    return condenseCache.get(key), key
+
+# 검색에 쓸 질의 반환(독립 질문이면 원문 그대로, 실패·마감 초과·브레이커 열림 시 휴리스틱)
+def condense_question(question: str, history: List[Dict[str, Any]] | None) -> str:
+    query, key = _cached(question, history)
+    if key is None or query is not None:
+        return query
+    llm = get_aux_llm().bind(max_tokens=_MAX_TOKENS)
+    try:
+        with stage("condense"):
+            resp = auxGuard.call(lambda: llm.invoke(_messages(question, history)))
+        query = _clean(resp.content, question, history)
+    except Exception:
+        log.exception("condense failed")
+        return heuristic_condense(question, history)
+    condenseCache.put(key, query)
+    return query
+
+async def acondense_question(question: str, history: List[Dict[str, Any]] | None) -> str:
+    query, key = _cached(question, history)
+    if key is None or query is not None:
+        return query
+    llm = get_aux_llm().bind(max_tokens=_MAX_TOKENS)
+    try:
+        with stage("condense"):
+            resp = await auxGuard.acall(lambda: llm.ainvoke(_messages(question, history)))
+        query = _clean(resp.content, question, history)
+    except Exception:
+        log.exception("condense failed")
+        return heuristic_condense(question, history)
+    condenseCache.put(key, query)
+    return query
@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from dotenv import load_dotenv
 import os
+import tempfile
 
 load_dotenv()
 
@@ -11,11 +12,127 @@ class Settings:
     aoai_api_version: str = os.getenv("AZURE_OPENAI_API_VERSION", "2024-12-01-preview")
     aoai_chat: str = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT", "gpt-4.1-mini")
     aoai_embed: str = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-3-small")
+    # 요약/질문 재작성 등 보조 작업용 저비용 배포(비우면 채팅 배포 사용)
+    aoai_aux_chat: str = os.getenv("AZURE_OPENAI_AUX_CHAT_DEPLOYMENT", "")
 
     search_endpoint: str = os.getenv("AZURE_SEARCH_ENDPOINT", "")
     search_key: str = os.getenv("AZURE_SEARCH_API_KEY", "")
     search_index: str = os.getenv("AZURE_SEARCH_INDEX", "rag-1759110249946")
 
+    search_key_field: str = os.getenv("AZURE_SEARCH_KEY_FIELD", "chunk_id")
+
+    # 색인(ingestion) 파이프라인
+    ingest_manifest: str = os.getenv("INGEST_MANIFEST", ".ingest_manifest.json")
+    ingest_upload_batch: int = int(os.getenv("INGEST_UPLOAD_BATCH", "500"))
+
+    # 검색 엔진 선택: azure(Azure AI Search) | local(로컬 BM25 + 벡터 인덱스)
+    retriever_backend: str = os.getenv("RETRIEVER_BACKEND", "azure").lower()
+    local_index_dir: str = os.getenv("LOCAL_INDEX_DIR", ".local_index")
+    # 임베딩 모델: azure(Azure OpenAI 배포) | hash(오프라인 해시 임베딩)
+    embedder: str = os.getenv("EMBEDDER", "azure").lower()
+
+    # 검색 모드: hybrid(임베딩 후 하이브리드 질의) | parallel(키워드 즉시 + 임베딩 병렬, 클라이언트 RRF)
+    retrieval_mode: str = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+    embed_budget_ms: float = float(os.getenv("EMBED_BUDGET_MS", "800"))  # parallel 모드 임베딩 대기 한도
+
+    # 적응형 k: 점수 분포로 LLM 에 넘길 청크 수 결정(k 를 기준으로 최소/최대, 급락 비율, 누적 점수 비율, 평탄 판정 비율)
+    adaptive_k: bool = os.getenv("ADAPTIVE_K", "false").lower() in ("1", "true", "yes")
+    adaptive_k_min: int = int(os.getenv("ADAPTIVE_K_MIN", "2"))
+    adaptive_k_max: int = int(os.getenv("ADAPTIVE_K_MAX", "10"))
+    adaptive_gap: float = float(os.getenv("ADAPTIVE_GAP", "0.4"))
+    adaptive_mass: float = float(os.getenv("ADAPTIVE_MASS", "0.9"))
+    adaptive_flat: float = float(os.getenv("ADAPTIVE_FLAT", "0.85"))
+
+    # 재순위: off | fusion(어휘+검색 순위 융합) | onnx(cross-encoder, RERANK_MODEL_DIR), 후보 수, 지연 한도
+    rerank_mode: str = os.getenv("RERANK_MODE", "off").lower()
+    rerank_candidates: int = int(os.getenv("RERANK_CANDIDATES", "30"))
+    rerank_budget_ms: float = float(os.getenv("RERANK_BUDGET_MS", "150"))
+    rerank_model_dir: str = os.getenv("RERANK_MODEL_DIR", "")
+
+    # 서버 측 대화 세션
+    session_store_size: int = int(os.getenv("SESSION_STORE_SIZE", "1000"))
+    session_ttl: float = float(os.getenv("SESSION_TTL", "86400"))
+    # sqlite 경로. 기본은 로컬 임시 디렉터리(같은 호스트의 워커들이 세션 공유), memory 면 워커 메모리만
+    # (WAL 은 네트워크 파일시스템(Azure Files/NFS/SMB)에서 동작하지 않으므로 /home 등 공유 마운트는 지정하지 않음)
+    session_db: str = os.getenv("SESSION_DB", os.path.join(tempfile.gettempdir(), "stb-sessions.db"))
+    session_max_messages: int = int(os.getenv("SESSION_MAX_MESSAGES", "40"))
+
+    # 대화 요약: 요약되지 않은 히스토리가 이 토큰 수를 넘으면 마지막 턴을 뺀 나머지를 백그라운드에서 요약
+    summary_trigger_tokens: int = int(os.getenv("SUMMARY_TRIGGER_TOKENS", "1200"))
+    summary_max_tokens: int = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+
+    # FAQ 사전 계산 답변: 인덱스 파일(비우면 사용 안 함), 유사도 임계값, 재생성 주기(초, 0 이면 파일 변경만 반영)
+    faq_index: str = os.getenv("FAQ_INDEX", "")
+    faq_threshold: float = float(os.getenv("FAQ_THRESHOLD", "0.92"))
+    faq_refresh_seconds: float = float(os.getenv("FAQ_REFRESH_SECONDS", "0"))
+
+    # 후속 질문 재작성: llm(보조 배포) | heuristic(직전 질문 덧붙임) | off, 결과 캐시
+    condense_mode: str = os.getenv("CONDENSE_MODE", "llm").lower()
+    condense_cache_size: int = int(os.getenv("CONDENSE_CACHE_SIZE", "1024"))
+    condense_cache_ttl: float = float(os.getenv("CONDENSE_CACHE_TTL", "3600"))
+
+    # 일괄 질의(/ask/batch)
+    batch_concurrency: int = int(os.getenv("BATCH_CONCURRENCY", "8"))
+    batch_max_items: int = int(os.getenv("BATCH_MAX_ITEMS", "2000"))
+
+    # 프롬프트 컨텍스트 토큰 예산
+    context_max_tokens: int = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+    context_min_tokens: int = int(os.getenv("CONTEXT_MIN_TOKENS", "64"))  # 잘라서라도 넣을 최소 남은 예산
+    context_dedup_threshold: float = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+    history_max_tokens: int = int(os.getenv("HISTORY_MAX_TOKENS", "1000"))
+    context_token_model: str = os.getenv("CONTEXT_TOKEN_MODEL", "")  # 비우면 채팅 배포 이름으로 tiktoken 인코딩 선택
+
+    # 샘플링 프로파일러(/debug/profile 에서 collapsed stack 조회)
+    profiler: bool = os.getenv("PROFILER", "false").lower() in ("1", "true", "yes")
+    profiler_interval_ms: float = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+
+    # 공용 HTTP 커넥션 풀/타임아웃(초)
+    http_pool_size: int = int(os.getenv("HTTP_POOL_SIZE", "20"))
+    http_keepalive: float = float(os.getenv("HTTP_KEEPALIVE", "60"))
+    http2: bool = os.getenv("HTTP2", "true").lower() in ("1", "true", "yes")
+    http_max_retries: int = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+    http_connect_timeout: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    llm_timeout: float = float(os.getenv("LLM_TIMEOUT", "60"))
+    embed_timeout: float = float(os.getenv("EMBED_TIMEOUT", "10"))
+    search_timeout: float = float(os.getenv("SEARCH_TIMEOUT", "10"))
+
+    # 임베딩 서비스(마이크로 배치, 병렬도, 분당 요청/토큰 예산 - 0 이면 무제한)
+    embed_batch_window_ms: float = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+    embed_max_batch: int = int(os.getenv("EMBED_MAX_BATCH", "16"))
+    embed_max_parallel: int = int(os.getenv("EMBED_MAX_PARALLEL", "4"))
+    embed_bulk_parallel: int = int(os.getenv("EMBED_BULK_PARALLEL", "2"))  # 대량 임베딩(색인/예열/일괄) 전용
+    embed_rpm: int = int(os.getenv("EMBED_RPM", "0"))
+    embed_tpm: int = int(os.getenv("EMBED_TPM", "0"))
+    embed_max_retries: int = int(os.getenv("EMBED_MAX_RETRIES", "5"))  # 429/5xx 재시도(SDK 재시도는 끔)
+
+    # 질의 임베딩 캐시
+    embed_cache_size: int = int(os.getenv("EMBED_CACHE_SIZE", "1024"))
+    embed_cache_ttl: int = int(os.getenv("EMBED_CACHE_TTL", "86400"))
+    embed_cache_path: str = os.getenv("EMBED_CACHE_PATH", "")
+    embed_cache_warm_file: str = os.getenv("EMBED_CACHE_WARM_FILE", "")
+
+    # 의미 기반 답변 캐시
+    answer_cache_size: int = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+    answer_cache_ttl: int = int(os.getenv("ANSWER_CACHE_TTL", "600"))
+    answer_cache_threshold: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+    # 복원력: 호출별 마감 시간(ms, 0 이면 없음), 헤지할 호출과 헤지 예산, 서킷 브레이커, 저하 모드
+    embed_deadline_ms: float = float(os.getenv("EMBED_DEADLINE_MS", "3000"))
+    search_deadline_ms: float = float(os.getenv("SEARCH_DEADLINE_MS", "5000"))
+    llm_deadline_ms: float = float(os.getenv("LLM_DEADLINE_MS", "45000"))
+    llm_ttft_deadline_ms: float = float(os.getenv("LLM_TTFT_DEADLINE_MS", "15000"))  # 스트리밍 첫 토큰까지
+    condense_deadline_ms: float = float(os.getenv("CONDENSE_DEADLINE_MS", "3000"))
+    hedge_stages: str = os.getenv("HEDGE_STAGES", "embed,search")  # embed, search, llm, aux_llm 중 쉼표 구분
+    hedge_min_ms: float = float(os.getenv("HEDGE_MIN_MS", "50"))
+    hedge_max_ratio: float = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+    breaker_failures: int = int(os.getenv("BREAKER_FAILURES", "5"))
+    breaker_reset_seconds: float = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+    degraded_mode: bool = os.getenv("DEGRADED_MODE", "true").lower() in ("1", "true", "yes")  # 키워드 검색만/인용만 응답으로 대체
+
+    # 기동 예산(ms): 모듈 import 시작 → /ready 200 까지, 넘으면 경고 로그
+    startup_budget_ms: float = float(os.getenv("STARTUP_BUDGET_MS", "10000"))
+    startup_warmup: bool = os.getenv("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes")  # false 면 import 직후 바로 준비 완료
+
     host: str = os.getenv("FLASK_HOST", os.getenv("HOST", "0.0.0.0"))
     port: int = int(os.getenv("FLASK_PORT", os.getenv("PORT", "8000")))
 
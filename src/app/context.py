@@ -0,0 +1,116 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import Any, Dict, List
+import numpy as np
+from .config import settings
+
+# 프롬프트 컨텍스트 조립: 채팅 배포 기준 토큰 수 계산, 중복 청크 제거(shingle + MinHash),
+# 관련도 순으로 토큰 예산 안에 패킹, 대화 히스토리도 토큰 예산으로 자름
+
+_SHINGLE = 5        # 단어 shingle 크기
+_PERMS = 64         # MinHash 해시 함수 수
+_PRIME = (1 << 31) - 1  # a*x + b 가 uint64 범위 안에 들어가도록 31비트 소수
+_rng = np.random.default_rng(0)
+_A = _rng.integers(1, _PRIME, size=_PERMS, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, size=_PERMS, dtype=np.uint64)
+
+_cjk_re = re.compile(r"[^\x00-\x7f]")
+
+# 채팅 배포의 tiktoken 인코딩(배포 이름이 모델 이름이 아니면 o200k_base, 인코딩 파일을 받을 수 없으면 None)
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(settings.context_token_model or settings.aoai_chat)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+# 토큰 수(오프라인이면 ASCII 4자 ≈ 1토큰, 한글 등 비ASCII 1자 ≈ 1토큰으로 보수적으로 추정)
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    wide = len(_cjk_re.findall(text))
+    return wide + (len(text) - wide + 3) // 4
+
+# 앞에서부터 max_tokens 까지만 남김
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    enc = _encoding()
+    if enc is not None:
+        ids = enc.encode(text, disallowed_special=())
+        return text if len(ids) <= max_tokens else enc.decode(ids[:max_tokens])
+    lo, hi = 0, len(text)
+    while lo < hi:  # 추정치 기준 이분 탐색
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+def _clean(text: str) -> str:
+    return " ".join((text or "").split())
+
+# 단어 5-gram shingle 의 MinHash 서명
+def minhash(text: str) -> np.ndarray:
+    words = text.lower().split()
+    grams = {" ".join(words[i:i + _SHINGLE]) for i in range(max(1, len(words) - _SHINGLE + 1))}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little") % _PRIME for g in grams),
+        dtype=np.uint64,
+        count=len(grams),
+    )
+    return ((np.outer(_A, hashes) + _B[:, None]) % _PRIME).min(axis=1)
+
+# 관련도 순서를 유지하며 거의 같은 청크 제거(추정 Jaccard >= threshold)
+def dedup(docs: List[Dict[str, Any]], threshold: float | None = None) -> List[Dict[str, Any]]:
+    threshold = settings.context_dedup_threshold if threshold is None else threshold
+    kept: List[Dict[str, Any]] = []
+    sigs: List[np.ndarray] = []
+    for d in docs:
+        text = _clean(d.get("chunk") or d.get("content", ""))
+        if not text:
+            continue
+        sig = minhash(text)
+        if any(float(np.mean(sig == s)) >= threshold for s in sigs):
+            continue
+        kept.append(d)
+        sigs.append(sig)
+    return kept
+
+# 관련도 순(검색 결과 순서)으로 청크 전체를 넣고, 예산이 모자라면 마지막 청크만 잘라 넣음
+def pack_context(docs: List[Dict[str, Any]], max_tokens: int | None = None) -> str:
+    budget = settings.context_max_tokens if max_tokens is None else max_tokens
+    lines: List[str] = []
+    for d in dedup(docs):
+        text = _clean(d.get("chunk") or d.get("content", ""))
+        line = f"- {d.get('source', '') or '문서'}: {text}"
+        cost = count_tokens(line) + 1  # 줄바꿈
+        if cost <= budget:
+            lines.append(line)
+            budget -= cost
+            continue
+        if budget >= settings.context_min_tokens:
+            lines.append(truncate_tokens(line, budget - 1))
+        break
+    return "\n".join(lines)
+
+# 최근 메시지부터 예산 안에 들어가는 만큼만 유지(순서는 그대로)
+def trim_history(history: List[Dict[str, str]], max_tokens: int | None = None) -> List[Dict[str, str]]:
+    budget = settings.history_max_tokens if max_tokens is None else max_tokens
+    kept: List[Dict[str, str]] = []
+    for m in reversed(history):
+        # 세션 저장소 메시지는 저장 시 계산한 tokens 재사용
+        cost = (m.get("tokens") or count_tokens(m.get("content") or "")) + 4  # 메시지당 role/구분자 오버헤드
+        if cost > budget:
+            break
+        kept.append(m)
+        budget -= cost
+    return kept[::-1]
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+_ws_re = re.compile(r"\s+")
+
+# 캐시 키용 질의 정규화(대소문자/공백/전각 문자 차이 무시)
+def normalize_query(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    return _ws_re.sub(" ", text).strip().lower()
+
+# 질의 임베딩 캐시: 프로세스 내 LRU + (선택) sqlite 디스크 계층, TTL 만료
+class EmbeddingCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 86400, path: str = ""):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._mem: "OrderedDict[str, tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB, created REAL)"
+            )
+            self._db.commit()
+
+    # 디스크 계층 사용 여부(비동기 경로는 이때만 스레드에서 조회/저장)
+    @property
+    def persistent(self) -> bool:
+        return self._db is not None
+
+    @staticmethod
+    def key(query: str, deployment: str) -> str:
+        raw = f"{deployment}\x00{normalize_query(query)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    # 메모리 → sqlite 순으로 조회(디스크 적중은 메모리로 올림). record=False 면 적중/미스 통계에 넣지 않음(예열용)
+    def get(self, query: str, deployment: str, record: bool = True) -> Optional[List[float]]:
+        key = self.key(query, deployment)
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit and not self._expired(hit[0]):
+                self._mem.move_to_end(key)
+                self.hits += record
+                return hit[1]
+            if hit:
+                del self._mem[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vec, created FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[1]):
+                    vec = array("f", row[0]).tolist()
+                    self._put_mem(key, row[1], vec)
+                    self.hits += record
+                    self.disk_hits += record
+                    return vec
+
+            self.misses += record
+            return None
+
+    def _put_mem(self, key: str, created: float, vec: List[float]) -> None:
+        self._mem[key] = (created, vec)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
+
+    def put(self, query: str, deployment: str, vec: List[float]) -> None:
+        key = self.key(query, deployment)
+        now = time.time()
+        with self._lock:
+            self._put_mem(key, now, list(vec))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vec, created) VALUES (?, ?, ?)",
+                    (key, array("f", vec).tobytes(), now),
+                )
+                self._db.commit()
+
+    # 캐시 조회 후 없으면 embed_fn 호출 결과를 저장
+    def get_or_embed(
+        self, query: str, deployment: str, embed_fn: Callable[[str], List[float]]
+    ) -> List[float]:
+        vec = self.get(query, deployment)
+        if vec is None:
+            vec = embed_fn(query)
+            self.put(query, deployment, vec)
+        return vec
+
+    # 자주 묻는 질문 파일(한 줄에 한 질문, 또는 {"question": ...} JSONL)로 캐시 예열
+    # 이미 캐시(메모리 또는 sqlite)에 있는 질문은 다시 임베딩하지 않음(재시작 시 디스크에서 메모리로만 올림)
+    def warm(
+        self,
+        path: str,
+        deployment: str,
+        embed_many: Callable[[List[str]], List[List[float]]],
+        batch_size: int = 16,
+    ) -> int:
+        questions: List[str] = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("{"):
+                    line = (json.loads(line).get("question") or "").strip()
+                if line and self.get(line, deployment, record=False) is None:
+                    questions.append(line)
+
+        # 중복 제거(정규화 기준)
+        todo = list({normalize_query(q): q for q in questions}.values())
+        for i in range(0, len(todo), batch_size):
+            batch = todo[i:i + batch_size]
+            for q, vec in zip(batch, embed_many(batch)):
+                self.put(q, deployment, vec)
+        return len(todo)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._mem),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,217 @@
+import asyncio
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, List
+from .config import settings
+
+# 임베딩 서비스: 동시에 들어온 단건 요청을 짧은 시간 창(window) 동안 모아 배치로 호출하고,
+# RPM/TPM 예산 안에서 배치를 병렬 실행하며 429/5xx 응답은 지터를 둔 지수 백오프로 재시도한다
+# (재시도는 이 계층에서만, 임베딩 SDK 클라이언트는 max_retries=0).
+# 호출자가 마감 시각(deadline, time.monotonic 기준)을 넘기면 그 시각을 넘기는 백오프/재시도는 하지 않고
+# 마지막 오류를 그대로 올린다 - 마감 후에도 아무도 읽지 않을 결과를 위해 RPM/TPM 예산을 쓰지 않도록.
+# 대량 임베딩(색인/캐시 예열/일괄 질의)은 별도 풀에서 실행해 /ask 의 단건 배치 앞에 쌓이지 않게 한다.
+
+_HIST_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# 토큰 수 추정(문자 4개 ≈ 1토큰)
+def estimate_tokens(texts: List[str]) -> int:
+    return sum(len(t) // 4 + 1 for t in texts)
+
+def _status(e: Exception):
+    return getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+
+# 재시도할 오류(429 요청 한도 초과, 5xx) 여부와 Retry-After(초)
+def _retryable(e: Exception) -> tuple[bool, float | None]:
+    status = _status(e)
+    if not isinstance(status, int) or not (status == 429 or status >= 500):
+        return False, None
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return True, float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return True, None
+
+# 분당 요청 수/토큰 수 예산(토큰 버킷, 0 이면 무제한)
+class RateBudget:
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm, self.tpm = rpm, tpm
+        self._req = float(rpm)
+        self._tok = float(tpm)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        dt, self._last = now - self._last, now
+        if self.rpm:
+            self._req = min(self.rpm, self._req + dt * self.rpm / 60)
+        if self.tpm:
+            self._tok = min(self.tpm, self._tok + dt * self.tpm / 60)
+
+    def acquire(self, tokens: int) -> None:
+        if self.tpm:
+            tokens = min(tokens, self.tpm)  # 한도보다 큰 배치도 언젠가는 통과
+        while True:
+            with self._lock:
+                self._refill()
+                ok_req = not self.rpm or self._req >= 1
+                ok_tok = not self.tpm or self._tok >= tokens
+                if ok_req and ok_tok:
+                    if self.rpm:
+                        self._req -= 1
+                    if self.tpm:
+                        self._tok -= tokens
+                    return
+                wait = 0.0
+                if not ok_req:
+                    wait = max(wait, (1 - self._req) * 60 / self.rpm)
+                if not ok_tok:
+                    wait = max(wait, (tokens - self._tok) * 60 / self.tpm)
+            time.sleep(min(wait, 1.0))
+
+class EmbeddingService:
+    def __init__(
+        self,
+        embed_many: Callable[[List[str]], List[List[float]]],
+        window_ms: float = 5,
+        max_batch: int = 16,
+        max_parallel: int = 4,
+        bulk_parallel: int = 2,
+        rpm: int = 0,
+        tpm: int = 0,
+        max_retries: int = 5,
+    ):
+        self._embed_many = embed_many
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.budget = RateBudget(rpm, tpm)
+        self._queue: "queue.Queue[tuple[str, Future, float | None]]" = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="embed")
+        self._bulk_pool = ThreadPoolExecutor(max_workers=max(1, bulk_parallel), thread_name_prefix="embed-bulk")
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.retries_429 = 0
+        self.retries_5xx = 0
+        self.hist: Dict[int, int] = {b: 0 for b in _HIST_BUCKETS}
+        threading.Thread(target=self._dispatch, daemon=True, name="embed-dispatch").start()
+
+    # 단건 임베딩(다른 동시 요청과 묶여 배치로 실행), deadline 이 지나면 더 재시도하지 않음
+    def embed(self, text: str, deadline: float | None = None) -> List[float]:
+        return self.submit(text, deadline).result()
+
+    def submit(self, text: str, deadline: float | None = None) -> Future:
+        fut: Future = Future()
+        self._queue.put((text, fut, deadline))
+        return fut
+
+    async def aembed(self, text: str, deadline: float | None = None) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text, deadline))
+
+    # 대량 임베딩(색인/예열/일괄 질의용): 별도 풀에서 배치로 나눠 병렬 실행, 입력 순서 유지
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.max_batch] for i in range(0, len(texts), self.max_batch)]
+        out: List[List[float]] = []
+        for vecs in self._bulk_pool.map(self._call, batches):
+            out.extend(vecs)
+        return out
+
+    # 첫 요청 도착 후 window 동안(또는 max_batch 가 찰 때까지) 모아서 한 번에 실행
+    def _dispatch(self) -> None:
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(items) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._pool.submit(self._run, items)
+            except RuntimeError:
+                # 인터프리터 종료 중(풀 종료)에도 대기 중인 요청이 멈추지 않도록 직접 실행
+                self._run(items)
+
+    # 마감이 지난 요청은 호출에서 빼고, 배치의 마감은 남은 요청 중 가장 늦은 것(하나라도 없으면 없음)
+    def _run(self, items: List[tuple]) -> None:
+        now = time.monotonic()
+        live = []
+        for text, fut, deadline in items:
+            if deadline is not None and deadline <= now:
+                fut.set_exception(TimeoutError("embedding deadline passed before dispatch"))
+            else:
+                live.append((text, fut, deadline))
+        if not live:
+            return
+        deadlines = [d for _, _, d in live]
+        try:
+            vecs = self._call([t for t, _, _ in live], None if None in deadlines else max(deadlines))
+            for (_, fut, _), vec in zip(live, vecs):
+                fut.set_result(vec)
+        except Exception as e:
+            for _, fut, _ in live:
+                fut.set_exception(e)
+
+    # 예산 확보 후 호출, 429/5xx 는 Retry-After 또는 full-jitter 지수 백오프로 재시도(deadline 을 넘기는 대기는 하지 않음)
+    def _call(self, texts: List[str], deadline: float | None = None) -> List[List[float]]:
+        self._record(len(texts))
+        for attempt in range(self.max_retries + 1):
+            self.budget.acquire(estimate_tokens(texts))
+            try:
+                return self._embed_many(texts)
+            except Exception as e:
+                retry, retry_after = _retryable(e)
+                if not retry or attempt >= self.max_retries:
+                    raise
+                pause = retry_after or random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+                if deadline is not None and time.monotonic() + pause >= deadline:
+                    raise
+                with self._lock:
+                    if _status(e) == 429:
+                        self.retries_429 += 1
+                    else:
+                        self.retries_5xx += 1
+                time.sleep(pause)
+        raise RuntimeError("unreachable")
+
+    def _record(self, size: int) -> None:
+        with self._lock:
+            self.batches += 1
+            for b in _HIST_BUCKETS:
+                if size <= b:
+                    self.hist[b] += 1
+                    break
+            else:
+                self.hist[_HIST_BUCKETS[-1]] += 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "retries_429": self.retries_429,
+            "retries_5xx": self.retries_5xx,
+            "batch_size_hist": {f"le_{b}": n for b, n in self.hist.items()},
+        }
+
+# 프로세스 공용 임베딩 서비스
+@lru_cache(maxsize=None)
+def get_embed_service() -> EmbeddingService:
+    from .clients import get_embeddings
+
+    return EmbeddingService(
+        get_embeddings().embed_documents,
+        window_ms=settings.embed_batch_window_ms,
+        max_batch=settings.embed_max_batch,
+        max_parallel=settings.embed_max_parallel,
+        bulk_parallel=settings.embed_bulk_parallel,
+        rpm=settings.embed_rpm,
+        tpm=settings.embed_tpm,
+        max_retries=settings.embed_max_retries,
+    )
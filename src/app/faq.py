@@ -0,0 +1,215 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .config import settings
+from .answer_cache import chunk_key
+from .rag_chain import generate_answer
+from .retriever import _embed_model, embed_query, retrieve
+
+# FAQ 사전 계산 계층: 자주 묻는 질문 목록의 답변/인용을 미리 생성해 두고,
+# 질문 벡터가 FAQ 질문과 충분히 유사하면(FAQ_THRESHOLD) 검색/LLM 없이 바로 반환한다.
+# - 빌드: python -m src.app.faq build faq.txt [--out .faq_index.npz]
+# - 갱신: 질문별로 다시 검색해 청크 집합이 바뀐(색인이 갱신된) 항목만 다시 생성
+#         (서버 백그라운드 FAQ_REFRESH_SECONDS 주기 또는 python -m src.app.faq refresh 를 스케줄러로)
+# 저장 형식: npz 한 파일(vectors + meta JSON) - 교체는 os.replace 로 원자적
+
+log = logging.getLogger(__name__)
+
+_WORKERS = 4
+_RELOAD_SECONDS = 30
+
+# 질문 목록 파일: 한 줄에 한 질문 또는 {"question", "k"?} JSONL, # 주석
+def read_questions(path: str) -> List[Dict[str, Any]]:
+    items: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line) if line.startswith("{") else {"question": line}
+            if (item.get("question") or "").strip():
+                items.append({"question": item["question"].strip(), "k": int(item.get("k") or 5)})
+    return items
+
+def _unit(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat / np.where(norms == 0, 1.0, norms)
+
+class FaqIndex:
+    def __init__(self, entries: List[Dict[str, Any]] | None = None, vectors: np.ndarray | None = None, model: str = ""):
+        self.model = model
+        self._lock = threading.Lock()
+        self.mtime = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._set(entries or [], vectors)
+
+    # 항목과 벡터 행렬을 한 번에 교체(조회 중인 요청은 이전 스냅샷 사용)
+    def _set(self, entries: List[Dict[str, Any]], vectors: np.ndarray | None) -> None:
+        mat = np.zeros((0, 0), dtype=np.float32) if vectors is None or not len(entries) else _unit(np.asarray(vectors, dtype=np.float32))
+        self._data: Tuple[List[Dict[str, Any]], np.ndarray] = (list(entries), mat)
+
+    @property
+    def entries(self) -> List[Dict[str, Any]]:
+        return self._data[0]
+
+    @classmethod
+    def load(cls, path: str) -> "FaqIndex":
+        if not path or not os.path.exists(path):
+            return cls(model=_embed_model())
+        with np.load(path) as z:
+            meta = json.loads(str(z["meta"]))
+            index = cls(meta["entries"], z["vectors"], meta["model"])
+        index.mtime = os.path.getmtime(path)
+        return index
+
+    def save(self, path: str) -> None:
+        entries, mat = self._data
+        meta = {"model": self.model, "saved": time.time(), "entries": entries}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, vectors=mat, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+        os.replace(tmp, path)
+        self.mtime = os.path.getmtime(path)
+
+    # 다른 프로세스(CLI/다른 인스턴스)가 파일을 갱신했으면 다시 읽음
+    def reload_if_changed(self, path: str) -> bool:
+        if not path or not os.path.exists(path) or os.path.getmtime(path) == self.mtime:
+            return False
+        fresh = FaqIndex.load(path)
+        with self._lock:
+            self.model, self.mtime = fresh.model, fresh.mtime
+            self._data = fresh._data
+        return True
+
+    # 가장 유사한 FAQ 항목(임계값 이상일 때만). 임베딩 모델이 다르면 비교하지 않음
+    def lookup(self, qvec: List[float], threshold: float | None = None) -> Optional[Tuple[Dict[str, Any], float]]:
+        entries, mat = self._data
+        if not entries or self.model != _embed_model():
+            return None
+        threshold = settings.faq_threshold if threshold is None else threshold
+        q = np.asarray(qvec, dtype=np.float32)
+        sims = mat @ (q / (np.linalg.norm(q) or 1.0))
+        best = int(np.argmax(sims))
+        if sims[best] >= threshold:
+            self.hits += 1
+            return entries[best], float(sims[best])
+        self.misses += 1
+        return None
+
+    # 질문별 FAQ 항목 생성/교체
+    def upsert(self, built: List[Tuple[Dict[str, Any], List[float]]]) -> None:
+        with self._lock:
+            entries, mat = self._data
+            pos = {e["question"]: i for i, e in enumerate(entries)}
+            entries = list(entries)
+            rows = list(mat) if len(mat) else []
+            for entry, vec in built:
+                v = _unit(np.asarray([vec], dtype=np.float32))[0]
+                if entry["question"] in pos:
+                    entries[pos[entry["question"]]] = entry
+                    rows[pos[entry["question"]]] = v
+                else:
+                    pos[entry["question"]] = len(entries)
+                    entries.append(entry)
+                    rows.append(v)
+            self.model = _embed_model()
+            self._set(entries, np.asarray(rows, dtype=np.float32))
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+faqIndex = FaqIndex.load(settings.faq_index)
+
+# 한 질문의 답변/인용 생성(/ask 와 같은 검색 → 생성 경로, 히스토리 없음)
+def build_entry(question: str, k: int = 5) -> Tuple[Dict[str, Any], List[float]]:
+    from .pipeline import build_citations
+
+    docs, _ = retrieve(question, k=k)
+    answer = generate_answer(question, docs)
+    entry = {
+        "question": question,
+        "k": k,
+        "answer": answer,
+        "citations": build_citations(docs),
+        "ckey": chunk_key(docs),
+        "built": time.time(),
+    }
+    return entry, embed_query(question)
+
+def build(index: FaqIndex, items: List[Dict[str, Any]], workers: int = _WORKERS) -> int:
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="faq") as pool:
+        built = list(pool.map(lambda it: build_entry(it["question"], it["k"]), items))
+    index.upsert(built)
+    return len(built)
+
+# 색인 변경 감지: 다시 검색한 청크 집합이 빌드 당시와 다른 항목(임베딩 모델이 바뀌었으면 전부)만 재생성
+def stale_items(index: FaqIndex) -> List[Dict[str, Any]]:
+    if index.model != _embed_model():
+        return [{"question": e["question"], "k": e["k"]} for e in index.entries]
+    stale = []
+    for e in index.entries:
+        docs, _ = retrieve(e["question"], k=e["k"])
+        if chunk_key(docs) != e["ckey"]:
+            stale.append({"question": e["question"], "k": e["k"]})
+    return stale
+
+def refresh(index: FaqIndex, path: str) -> int:
+    index.reload_if_changed(path)
+    stale = stale_items(index)
+    if stale:
+        build(index, stale)
+        index.save(path)
+    return len(stale)
+
+# 서버 백그라운드 갱신: 파일 변경(CLI/다른 인스턴스)은 _RELOAD_SECONDS 마다 반영,
+# interval 마다 바뀐 항목 재생성(여러 인스턴스가 같은 파일을 쓰면 한 곳에서만 interval 지정)
+def start_refresh(path: str, interval: float) -> None:
+    def loop():
+        last = time.time()
+        while True:
+            time.sleep(_RELOAD_SECONDS)
+            try:
+                faqIndex.reload_if_changed(path)
+                if interval > 0 and time.time() - last >= interval:
+                    last = time.time()
+                    n = refresh(faqIndex, path)
+                    if n:
+                        log.info("faq refreshed %d entries", n)
+            except Exception:
+                log.exception("faq refresh failed")
+
+    threading.Thread(target=loop, daemon=True, name="faq-refresh").start()
+
+def main():
+    parser = argparse.ArgumentParser(description="precomputed FAQ answers")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="질문 목록으로 답변/인용/질문 벡터 생성")
+    b.add_argument("questions", help="한 줄에 한 질문 또는 {question, k?} JSONL")
+    b.add_argument("--out", default=None)
+    b.add_argument("--workers", type=int, default=_WORKERS)
+    r = sub.add_parser("refresh", help="색인이 바뀌어 검색 결과가 달라진 항목만 다시 생성")
+    r.add_argument("--index", default=None)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    if args.cmd == "build":
+        path = args.out or settings.faq_index or ".faq_index.npz"
+        index = FaqIndex.load(path)
+        n = build(index, read_questions(args.questions), args.workers)
+        index.save(path)
+    else:
+        path = args.index or settings.faq_index or ".faq_index.npz"
+        index = FaqIndex.load(path)
+        n = refresh(index, path)
+    print(json.dumps({"updated": n, "size": len(index.entries), "seconds": round(time.perf_counter() - t0, 1)}), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import re
+from typing import Any, Dict, Iterator, List, Tuple
+from pypdf import PdfReader
+
+# Azure 포털 "RAG" 템플릿(SplitSkill) 기본값과 맞춘 청크 크기/겹침(문자 수)
+CHUNK_CHARS = 2000
+CHUNK_OVERLAP = 500
+
+_ws_re = re.compile(r"[ \t\u00a0]+")
+# 절 제목 예) "10.3.3.1. Segmentation descriptor", "9.7 Splice Commands"
+_section_re = re.compile(r"^(\d+(?:\.\d+)*\.?)\s+([A-Z][^\n]{2,80})$", re.MULTILINE)
+
+# docs 폴더 아래 PDF 목록
+def iter_doc_files(root: str) -> List[str]:
+    out = []
+    for base, _, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith(".pdf"):
+                out.append(os.path.join(base, name))
+    return sorted(out)
+
+# PDF 페이지를 하나씩 읽어 (페이지 번호, 텍스트) 반환
+def iter_pdf_pages(path: str) -> Iterator[Tuple[int, str]]:
+    reader = PdfReader(path)
+    for i, page in enumerate(reader.pages, start=1):
+        text = page.extract_text() or ""
+        yield i, _ws_re.sub(" ", text).strip()
+
+# 고정 길이 + 겹침 분할(가능하면 공백/줄바꿈 경계에서 자름), (시작 위치, 텍스트) 목록
+def split_spans(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[Tuple[int, str]]:
+    if len(text.strip()) <= size:
+        return [(0, text.strip())] if text.strip() else []
+    out, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            cut = max(text.rfind("\n", start, end), text.rfind(" ", start, end))
+            if cut > start + size // 2:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            out.append((start, chunk))
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return out
+
+def split_text(text: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    return [c for _, c in split_spans(text, size, overlap)]
+
+# 페이지 내 절 제목 위치 목록
+def find_sections(text: str) -> List[Tuple[int, str]]:
+    return [(m.start(), f"{m.group(1).rstrip('.')} {m.group(2).strip()}") for m in _section_re.finditer(text)]
+
+# 페이지 텍스트 해시(청크 파라미터 포함 - 분할 방식이 바뀌면 재색인)
+# 이전 페이지에서 이어받은 절 제목도 포함: 앞 페이지 끝의 절이 바뀌면 이 페이지 청크의 section 도 다시 씀
+# (이어받은 절이 없으면 예전 형식 그대로라 기존 manifest 가 통째로 무효화되지 않음)
+def page_hash(text: str, section: str = "", size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> str:
+    raw = f"{size}:{overlap}:{text}" if not section else f"{size}:{overlap}:{section}\x00{text}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+# 페이지 한 장을 인덱스 문서(chunk/source/path/page/section) 단위로 변환
+# section 은 청크 시작 위치 직전의 절 제목(페이지에 없으면 이전 페이지에서 이어받은 값)
+def chunk_page(
+    path: str, page_no: int, text: str, section: str = "",
+    size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP,
+) -> Tuple[List[Dict[str, Any]], str]:
+    source = os.path.basename(path)
+    heads = find_sections(text)
+    out = []
+    for start, chunk in split_spans(text, size, overlap):
+        cur = section
+        for pos, title in heads:
+            if pos > start:
+                break
+            cur = title
+        out.append({"chunk": chunk, "source": source, "path": path, "page": page_no, "section": cur})
+    last = heads[-1][1] if heads else section
+    return out, last
+
+# PDF 한 개를 인덱스 문서 단위로 변환
+def iter_chunks(
+    path: str, size: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP
+) -> Iterator[Dict[str, Any]]:
+    section = ""
+    for page_no, text in iter_pdf_pages(path):
+        docs, section = chunk_page(path, page_no, text, section, size, overlap)
+        yield from docs
@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List
+from ..config import settings
+from ..clients import get_search_client
+from ..embed_service import get_embed_service
+from .chunker import chunk_page, iter_doc_files, iter_pdf_pages, page_hash
+
+# docs/ PDF → 청크(chunk/source/path/page/section) → 임베딩(text_vector) → Azure AI Search 업로드
+# 임베딩은 공용 임베딩 서비스의 대량 풀(EMBED_MAX_BATCH/EMBED_BULK_PARALLEL/EMBED_RPM/EMBED_TPM)로 호출하고,
+# 페이지별 내용 해시 manifest 를 유지해 바뀐 페이지만 다시 임베딩/업로드한다.
+# 실행: python -m src.app.indexing.ingest --docs docs [--dry-run] [--full]
+
+# 인덱스 키 규칙(문자/숫자/_-=)에 맞는 청크 ID
+def chunk_id(path: str, page: int, seq: int) -> str:
+    parent = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+    return f"{parent}_p{page}_c{seq}"
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+# 대상 인덱스 스키마에 있는 필드만 업로드(포털 템플릿 인덱스에 page/section 이 없을 수 있음)
+def index_fields() -> set:
+    from azure.search.documents.indexes import SearchIndexClient
+    from azure.core.credentials import AzureKeyCredential
+
+    client = SearchIndexClient(settings.search_endpoint, AzureKeyCredential(settings.search_key))
+    return {f.name for f in client.get_index(settings.search_index).fields}
+
+class Ingestor:
+    def __init__(self, manifest_path: str, dry_run: bool = False):
+        self.manifest_path = manifest_path
+        self.manifest = load_manifest(manifest_path)
+        self.dry_run = dry_run
+        self.fields = None if dry_run else index_fields()
+        self.pending: List[Dict[str, Any]] = []      # 업로드 대기 청크
+        self.pending_pages: List[tuple] = []          # (path, page, hash, ids) - 업로드 후 manifest 반영
+        self.stale: List[str] = []                    # 삭제할 이전 청크 ID
+        self.stats = {"pages_total": 0, "pages_changed": 0, "chunks_uploaded": 0, "chunks_deleted": 0}
+
+    # 바뀐 페이지만 청크로 만들어 대기열에 추가
+    def ingest_file(self, path: str) -> None:
+        entry = self.manifest["files"].setdefault(path, {"pages": {}})
+        old_pages = entry["pages"]
+        seen, section = set(), ""
+        for page_no, text in iter_pdf_pages(path):
+            self.stats["pages_total"] += 1
+            seen.add(str(page_no))
+            h = page_hash(text, section)  # section: 이전 페이지에서 이어받은 절 제목
+            docs, section = chunk_page(path, page_no, text, section)
+            prev = old_pages.get(str(page_no))
+            if prev and prev["hash"] == h:
+                continue
+
+            self.stats["pages_changed"] += 1
+            ids = []
+            for seq, d in enumerate(docs):
+                d["chunk_id"] = chunk_id(path, page_no, seq)
+                d["parent_id"] = d["chunk_id"].split("_p")[0]
+                d["title"] = d["source"]
+                ids.append(d["chunk_id"])
+            if prev:
+                self.stale.extend(i for i in prev["chunk_ids"] if i not in ids)
+            self.pending.extend(docs)
+            self.pending_pages.append((path, str(page_no), h, ids))
+            if len(self.pending) >= settings.ingest_upload_batch:
+                self.flush()
+
+        # 문서에서 사라진 페이지 정리
+        for page_no in [p for p in old_pages if p not in seen]:
+            self.stale.extend(old_pages[page_no]["chunk_ids"])
+            self.pending_pages.append((path, page_no, None, []))
+
+    # 사라진 파일의 청크 전체 삭제
+    def remove_missing(self, current: List[str]) -> None:
+        for path in [p for p in self.manifest["files"] if p not in current]:
+            for page_no, meta in self.manifest["files"][path]["pages"].items():
+                self.stale.extend(meta["chunk_ids"])
+                self.pending_pages.append((path, page_no, None, []))
+
+    # 임베딩(동시성 제한 배치) → 일괄 업로드 → 이전 청크 삭제 → manifest 저장
+    def flush(self) -> None:
+        docs, self.pending = self.pending, []
+        pages, self.pending_pages = self.pending_pages, []
+        stale, self.stale = self.stale, []
+        if self.dry_run:
+            self.stats["chunks_uploaded"] += len(docs)
+            self.stats["chunks_deleted"] += len(stale)
+            return
+
+        # 임베딩 서비스가 배치 분할/병렬 실행/RPM·TPM 예산/429 백오프를 처리
+        vecs = get_embed_service().embed_many([d["chunk"] for d in docs])
+        for d, v in zip(docs, vecs):
+            d["text_vector"] = v
+
+        client = get_search_client()
+        key = settings.search_key_field
+        for i in range(0, len(docs), settings.ingest_upload_batch):
+            body = [{k: v for k, v in d.items() if k in self.fields} for d in docs[i:i + settings.ingest_upload_batch]]
+            results = client.merge_or_upload_documents(documents=body)
+            failed = [r.key for r in results if not r.succeeded]
+            if failed:
+                raise RuntimeError(f"upload failed for {len(failed)} chunks: {failed[:5]}")
+        for i in range(0, len(stale), settings.ingest_upload_batch):
+            client.delete_documents(documents=[{key: s} for s in stale[i:i + settings.ingest_upload_batch]])
+
+        self.stats["chunks_uploaded"] += len(docs)
+        self.stats["chunks_deleted"] += len(stale)
+        files = self.manifest["files"]
+        for path, page_no, h, ids in pages:
+            if h is None:
+                files.get(path, {"pages": {}})["pages"].pop(page_no, None)
+                if path in files and not files[path]["pages"]:
+                    files.pop(path)
+            else:
+                files.setdefault(path, {"pages": {}})["pages"][page_no] = {"hash": h, "chunk_ids": ids}
+        save_manifest(self.manifest_path, self.manifest)
+
+def main():
+    parser = argparse.ArgumentParser(description="docs/ PDF ingestion into Azure AI Search")
+    parser.add_argument("--docs", default="docs")
+    parser.add_argument("--manifest", default=settings.ingest_manifest)
+    parser.add_argument("--dry-run", action="store_true", help="바뀐 페이지/청크 수만 출력")
+    parser.add_argument("--full", action="store_true", help="manifest 무시하고 전체 재색인")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    ing = Ingestor(args.manifest, dry_run=args.dry_run)
+    if args.full:
+        for entry in ing.manifest["files"].values():
+            for meta in entry["pages"].values():
+                meta["hash"] = ""
+    files = iter_doc_files(args.docs)
+    for path in files:
+        ing.ingest_file(path)
+    ing.remove_missing(files)
+    ing.flush()
+    print(json.dumps({**ing.stats, "seconds": round(time.perf_counter() - t0, 2)}))
+
+if __name__ == "__main__":
+    main()
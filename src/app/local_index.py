@@ -0,0 +1,254 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, List, Sequence
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from .indexing.chunker import iter_chunks, iter_doc_files
+
+# Azure AI Search 없이 동작하는 로컬 하이브리드 검색 엔진(BM25 + 밀집 벡터, RRF 융합)
+# 빌드: python -m src.app.local_index build --docs docs --out .local_index
+
+RRF_K = 60  # Azure 하이브리드 검색과 같은 RRF 상수
+
+_token_re = re.compile(r"[0-9a-z_]+|[가-힣]+")
+
+# BM25/해시 임베딩 공용 토크나이저(영문·숫자 단어 + 한글 어절 및 음절 bigram)
+def tokenize(text: str) -> List[str]:
+    out = []
+    for tok in _token_re.findall((text or "").lower()):
+        out.append(tok)
+        if "가" <= tok[0] <= "힣" and len(tok) > 2:
+            out.extend(tok[i:i + 2] for i in range(len(tok) - 1))
+    return out
+
+# 오프라인용 해시 임베딩(토큰 + 문자 3-gram feature hashing, L2 정규화)
+class HashEmbeddings(Embeddings):
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _vec(self, text: str) -> List[float]:
+        v = np.zeros(self.dim, dtype=np.float32)
+        toks = tokenize(text)
+        grams = [t[i:i + 3] for t in toks for i in range(max(1, len(t) - 2))]
+        for feat in toks + grams:
+            h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+            v[h % self.dim] += 1.0 if (h >> 63) == 0 else -1.0
+        n = float(np.linalg.norm(v))
+        return (v / n if n else v).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vec(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vec(text)
+
+# RRF(Reciprocal Rank Fusion): 여러 순위 목록을 하나로 합침
+def rrf_fuse(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> Dict[int, float]:
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            scores[idx] = scores.get(idx, 0.0) + 1.0 / (k + rank + 1)
+    return scores
+
+def _top_k(scores: np.ndarray, k: int) -> List[int]:
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])].tolist()
+
+# BM25 키워드 인덱스(용어별 posting: 문서 번호, 빈도)
+class BM25Index:
+    def __init__(self, postings: Dict[str, tuple], doc_len: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        self.postings = postings
+        self.doc_len = doc_len
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+        self.k1, self.b = k1, b
+        n = len(doc_len)
+        self.idf = {
+            t: math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5)) for t, (ids, _) in postings.items()
+        }
+        self._norm = k1 * (1 - b + b * doc_len / (self.avgdl or 1.0))
+
+    @classmethod
+    def build(cls, texts: List[str]) -> "BM25Index":
+        post: Dict[str, tuple] = {}
+        lens = []
+        tmp: Dict[str, tuple] = {}
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lens.append(sum(counts.values()))
+            for t, c in counts.items():
+                ids, tfs = tmp.setdefault(t, ([], []))
+                ids.append(i)
+                tfs.append(c)
+        for t, (ids, tfs) in tmp.items():
+            post[t] = (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+        return cls(post, np.asarray(lens, dtype=np.float32))
+
+    def scores(self, query: str) -> np.ndarray:
+        out = np.zeros(len(self.doc_len), dtype=np.float32)
+        for t in set(tokenize(query)):
+            hit = self.postings.get(t)
+            if hit is None:
+                continue
+            ids, tfs = hit
+            out[ids] += self.idf[t] * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+        return out
+
+    def save(self, path: str) -> None:
+        terms = sorted(self.postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, t in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(self.postings[t][0])
+        ids = np.concatenate([self.postings[t][0] for t in terms]) if terms else np.zeros(0, np.int32)
+        tfs = np.concatenate([self.postings[t][1] for t in terms]) if terms else np.zeros(0, np.float32)
+        np.savez(path, terms=np.asarray(terms), offsets=offsets, ids=ids, tfs=tfs, doc_len=self.doc_len)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        z = np.load(path)
+        terms, offsets, ids, tfs = z["terms"], z["offsets"], z["ids"], z["tfs"]
+        post = {
+            str(t): (ids[offsets[i]:offsets[i + 1]], tfs[offsets[i]:offsets[i + 1]])
+            for i, t in enumerate(terms)
+        }
+        return cls(post, z["doc_len"])
+
+# 로컬 인덱스 = 문서 메타(JSON) + BM25(npz) + 정규화된 벡터 행렬(npy, mmap 로드)
+class LocalRetriever:
+    def __init__(self, docs: List[Dict[str, Any]], bm25: BM25Index, vectors: np.ndarray, meta: Dict[str, Any]):
+        self.docs = docs
+        self.bm25 = bm25
+        self.vectors = vectors
+        self.meta = meta
+
+    # embedder 를 주면 인덱스를 빌드한 임베딩 모델/차원과 같은지 확인(다르면 질의마다 행렬 곱 shape 오류가 나므로 기동 시 실패)
+    @classmethod
+    def load(cls, root: str, embedder: str | None = None) -> "LocalRetriever":
+        with open(os.path.join(root, "docs.json"), "r", encoding="utf-8") as f:
+            docs = json.load(f)
+        with open(os.path.join(root, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        bm25 = BM25Index.load(os.path.join(root, "bm25.npz"))
+        vectors = np.load(os.path.join(root, "vectors.npy"), mmap_mode="r")
+        built = meta.get("embedder")
+        if embedder is not None and built != embedder:
+            raise RuntimeError(
+                f"local index {root} was built with EMBEDDER={built}, but EMBEDDER={embedder}: "
+                f"rebuild the index with EMBEDDER={embedder} (python -m src.app.local_index build)"
+            )
+        dim = vectors.shape[1] if vectors.ndim == 2 else 0
+        expected = HashEmbeddings().dim if built == "hash" else None
+        if len(vectors) and (dim != meta.get("dim", dim) or (expected is not None and dim != expected)):
+            raise RuntimeError(
+                f"local index {root} has {dim}-dim vectors (meta {meta.get('dim')}, expected {expected or meta.get('dim')}): "
+                f"rebuild the index with EMBEDDER={built}"
+            )
+        return cls(docs, bm25, vectors, meta)
+
+    # 질의 벡터 차원 확인(같은 EMBEDDER 라도 Azure 임베딩 배포가 바뀐 경우)
+    def _query_vec(self, qvec: List[float]) -> np.ndarray:
+        q = np.asarray(qvec, dtype=np.float32)
+        if q.shape != (self.vectors.shape[1],):
+            raise RuntimeError(
+                f"query embedding has {q.size} dims but the local index has {self.vectors.shape[1]}: "
+                f"rebuild the index with the current EMBEDDER/embedding deployment"
+            )
+        return q / (np.linalg.norm(q) or 1.0)
+
+    # 하이브리드 검색: BM25 순위 + 벡터 순위를 RRF로 융합(Azure와 동일 방식)
+    def search(self, query: str, k: int = 8, qvec: List[float] | None = None) -> List[Dict[str, Any]]:
+        ranked = [_top_k(self.bm25.scores(query), k)]
+        if qvec is not None and len(self.vectors):
+            ranked.append(_top_k(self.vectors @ self._query_vec(qvec), k))
+
+        fused = rrf_fuse(ranked)
+        return [self._doc(i, fused[i]) for i in sorted(fused, key=fused.get, reverse=True)[:k]]
+
+    def keyword_search(self, query: str, k: int = 8) -> List[Dict[str, Any]]:
+        scores = self.bm25.scores(query)
+        return [self._doc(i, scores[i]) for i in _top_k(scores, k)]
+
+    def vector_search(self, qvec: List[float], k: int = 8) -> List[Dict[str, Any]]:
+        if not len(self.vectors):
+            return []
+        sims = self.vectors @ self._query_vec(qvec)
+        return [self._doc(i, sims[i]) for i in _top_k(sims, k)]
+
+    # score: Azure 의 @search.score 에 대응(하이브리드는 RRF, 키워드는 BM25, 벡터는 코사인)
+    def _doc(self, i: int, score: float) -> Dict[str, Any]:
+        d = self.docs[i]
+        return {"content": d["chunk"], "source": d["source"], "path": d["path"], "score": float(score)}
+
+    # 로컬 검색은 수 ms 이내라 비동기 버전도 그대로 동기 호출
+    async def asearch(self, query: str, k: int = 8, qvec: List[float] | None = None) -> List[Dict[str, Any]]:
+        return self.search(query, k=k, qvec=qvec)
+
+    async def akeyword_search(self, query: str, k: int = 8) -> List[Dict[str, Any]]:
+        return self.keyword_search(query, k)
+
+    async def avector_search(self, qvec: List[float], k: int = 8) -> List[Dict[str, Any]]:
+        return self.vector_search(qvec, k)
+
+# docs 폴더의 PDF로 로컬 인덱스 빌드
+def build_index(docs_dir: str, out_dir: str, embeddings: Embeddings, embedder: str, batch_size: int = 32) -> Dict[str, Any]:
+    docs = [c for path in iter_doc_files(docs_dir) for c in iter_chunks(path)]
+    texts = [d["chunk"] for d in docs]
+
+    vecs: List[List[float]] = []
+    for i in range(0, len(texts), batch_size):
+        vecs.extend(embeddings.embed_documents(texts[i:i + batch_size]))
+    mat = np.asarray(vecs, dtype=np.float32).reshape(len(texts), -1)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    mat /= np.where(norms == 0, 1.0, norms)
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "docs.json"), "w", encoding="utf-8") as f:
+        json.dump(docs, f, ensure_ascii=False)
+    BM25Index.build(texts).save(os.path.join(out_dir, "bm25.npz"))
+    np.save(os.path.join(out_dir, "vectors.npy"), mat)
+    meta = {"embedder": embedder, "dim": int(mat.shape[1]) if len(mat) else 0, "count": len(docs)}
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    return meta
+
+def main():
+    parser = argparse.ArgumentParser(description="local retrieval index")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="docs 폴더 PDF로 인덱스 빌드")
+    b.add_argument("--docs", default="docs")
+    b.add_argument("--out", default=None)
+    b.add_argument("--embedder", choices=["hash", "azure"], default=None)
+    q = sub.add_parser("query", help="로컬 인덱스 검색(지연 측정)")
+    q.add_argument("question")
+    q.add_argument("--k", type=int, default=5)
+    q.add_argument("--index", default=None)
+    args = parser.parse_args()
+
+    from .config import settings
+    from .clients import get_embeddings
+
+    if args.cmd == "build":
+        if args.embedder:
+            settings.embedder = args.embedder
+        meta = build_index(args.docs, args.out or settings.local_index_dir, get_embeddings(), settings.embedder)
+        print(json.dumps(meta))
+    else:
+        r = LocalRetriever.load(args.index or settings.local_index_dir, settings.embedder)
+        qvec = get_embeddings().embed_query(args.question)
+        t0 = time.perf_counter()
+        hits = r.search(args.question, k=args.k, qvec=qvec)
+        ms = (time.perf_counter() - t0) * 1000
+        for h in hits:
+            print(f"- {h['source']}: {(h['content'] or '')[:100]!r}")
+        print(f"search_ms={ms:.2f}")
+
+if __name__ == "__main__":
+    main()
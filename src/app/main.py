@@ -1,57 +1,260 @@
-from flask import Flask, request, jsonify
+import threading
+import time
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from .config import settings
-from .retriever import search_hybrid
-from .rag_chain import generate_answer
+from .startup import readiness
+from .retriever import retrieve, embedCache, warm_embed_cache
+from .condense import condense_question
+from .answer_cache import chunk_key, history_key
+from .pipeline import (
+    UnknownSessionError, answerCache, degraded_answer, faq_lookup, generate_once, parse_ask, build_citations, remember,
+    sse_event, stats_metrics,
+    stream_once,
+)
+from .resilience import error_status, stats as resilience_stats
+from .faq import faqIndex, start_refresh
+from .sessions import sessionStore
+from .embed_service import get_embed_service
+from .batch import jsonl_line, parse_batch, run_batch
+from .metrics import begin_request, end_request, observe_cache, observe_request, render, server_timing, start_profiler, stage
 
 app = Flask(__name__)
 CORS(app)
 
+# 클라이언트 생성/첫 연결/프롬프트 로드를 백그라운드로 예열(끝나면 /ready 200)
+readiness.mark_imported()
+readiness.start()
+
+# 자주 묻는 질문으로 임베딩 캐시 예열(기동을 막지 않도록 백그라운드)
+if settings.embed_cache_warm_file:
+    threading.Thread(
+        target=warm_embed_cache, args=(settings.embed_cache_warm_file,), daemon=True
+    ).start()
+
+# FAQ 인덱스 파일 변경 반영 및 (FAQ_REFRESH_SECONDS) 색인 변경 시 재생성
+if settings.faq_index:
+    start_refresh(settings.faq_index, settings.faq_refresh_seconds)
+
+# 샘플링 프로파일러(PROFILER=true 일 때만)
+profiler = start_profiler(settings.profiler_interval_ms) if settings.profiler else None
+
+# 요청별 단계 시간 수집 시작
+@app.before_request
+def begin_timing():
+    g.t0 = time.perf_counter()
+    g.timing = begin_request()
+
+# Server-Timing 헤더 추가 및 요청 지표 기록(스트리밍은 헤더 전송 시점까지)
+@app.after_request
+def finish_timing(resp):
+    if "timing" not in g:
+        return resp
+    total = time.perf_counter() - g.t0
+    resp.headers["Server-Timing"] = server_timing(end_request(g.timing), total)
+    route = request.url_rule.rule if request.url_rule else "other"
+    observe_request(route, resp.status_code, total)
+    if "X-Cache" in resp.headers:
+        observe_cache(resp.headers["X-Cache"])
+    return resp
+
 #헬스체크용 - 서버 올리고 나서 정상적으로 작동하는지 확인
 @app.get("/health")
 def health():
-    return jsonify({"status": "ok"})
+    return jsonify({
+        "status": "ok",
+        "embed_cache": embedCache.stats(),
+        "answer_cache": answerCache.stats(),
+        "faq": faqIndex.stats(),
+        "embed_service": get_embed_service().stats(),
+        "startup": {"ready": readiness.ready, "ready_ms": readiness.ready_ms, "budget_ms": readiness.budget_ms},
+        "circuits": resilience_stats(),
+    })
+
+# 준비 상태 확인용(App Service 상태 검사/로드밸런서) - 예열이 끝나기 전에는 503
+@app.get("/ready")
+def ready():
+    return jsonify(readiness.status()), 200 if readiness.ready else 503
+
+# Prometheus 지표
+@app.get("/metrics")
+def metrics():
+    return Response(render(stats_metrics()), mimetype="text/plain; version=0.0.4")
+
+# 프로파일러 샘플(collapsed stack, ?reset=1 이면 조회 후 초기화)
+@app.get("/debug/profile")
+def debug_profile():
+    if profiler is None:
+        return jsonify({"error": "profiler disabled (PROFILER=true)"}), 404
+    return Response(profiler.collapsed(reset=request.args.get("reset") == "1"), mimetype="text/plain")
+
+# 요청 본문 파싱: 잘못된 JSON/파라메터는 400, 다른 인스턴스에서 이어진 세션이면 409(클라이언트가 히스토리와 함께 재시도)
+def _parse_request():
+    payload = request.get_json(force=True, silent=True)
+    if payload is None and request.get_data().strip() not in (b"", b"null"):
+        return None, (jsonify({"error": "invalid JSON body"}), 400)
+    try:
+        return parse_ask({} if payload is None else payload), None
+    except UnknownSessionError:
+        return None, (jsonify({"error": "unknown_session"}), 409)
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
 
 # UI에서 호출하는 질문 처리 API
 @app.post("/ask")
 def ask():
     try:
         # JSON으로 요청 파라메터 파싱
-        payload = request.get_json(force=True) or {}
-        question = (payload.get("question") or "").strip()  # 질문
-        k = int(payload.get("k") or 5)  # 검색 결과 개수
-        history = payload.get("history") or []  # 대화 히스토리(최대 8개)
+        req, error = _parse_request()
+        if error:
+            return error
+        question, history = req.question, req.history
 
         if not question:
             return jsonify({"error": "question required"}), 400
 
-        # 1) 검색 (하이브리드)
+        # 0) FAQ 사전 계산 답변(자주 묻는 질문은 검색/LLM 없이 바로 반환)
+        faq = faq_lookup(req)
+        if faq:
+            entry, sim = faq
+            remember(req, entry["answer"])
+            resp = jsonify({"answer": entry["answer"], "citations": entry["citations"]})
+            resp.headers["X-Cache"] = "FAQ"
+            resp.headers["X-Cache-Similarity"] = f"{sim:.4f}"
+            return resp
+
+        # 1) 검색 (하이브리드, 후속 질문은 독립 질의로 재작성 후 검색)
         try:
-            docs = search_hybrid(question, k=k)
+            docs, qvec = retrieve(condense_question(question, history), k=req.k)
         except Exception as e:
-            return jsonify({"error": f"search_failed: {e}"}), 500
+            return jsonify({"error": f"search_failed: {e}"}), error_status(e)
 
-        # 2) 생성 (LLM)
+        # 2) 답변 캐시 조회 (유사 질문 + 동일 검색 결과면 LLM 호출 생략)
+        ckey, hkey = chunk_key(docs), history_key(history[-8:])
+        if not req.no_cache and qvec is not None:
+            with stage("cache"):
+                hit = answerCache.lookup(qvec, ckey, hkey)
+            if hit:
+                entry, sim = hit
+                remember(req, entry["answer"])
+                resp = jsonify({"answer": entry["answer"], "citations": entry["citations"], "k": len(docs)})
+                resp.headers["X-Cache"] = "HIT"
+                resp.headers["X-Cache-Similarity"] = f"{sim:.4f}"
+                return resp
+
+        # 3) 생성 (LLM, 같은 질문이 동시에 오면 한 번만 생성해 함께 받음)
         try:
-            answer = generate_answer(question, docs, history=history)
+            answer = generate_once(req, docs, qvec, ckey, hkey)
         except Exception as e:
-            return jsonify({"error": f"llm_failed: {e}"}), 500
-
-        # 3) 인용 정보 구성
-        citations = [
-            {
-                "source": d.get("source"),
-                "path": d.get("path"),
-                "url": d.get("url"),
-            }
-            for d in docs
-        ]
-        # 4) 응답 반환
-        return jsonify({"answer": answer, "citations": citations})
+            # LLM 장애(마감 초과/브레이커 열림 포함)면 검색된 문서만 안내하는 대체 답변(세션/캐시에 남기지 않음)
+            fallback = degraded_answer(docs, e)
+            if fallback is None:
+                return jsonify({"error": f"llm_failed: {e}"}), error_status(e)
+            resp = jsonify({"answer": fallback, "citations": build_citations(docs), "k": len(docs), "degraded": "llm"})
+            resp.headers["X-Degraded"] = "llm"
+            return resp
+
+        # 4) 인용 정보 구성
+        citations = build_citations(docs)
+        remember(req, answer)
+
+        # 5) 응답 반환
+        resp = jsonify({"answer": answer, "citations": citations, "k": len(docs)})  # k: 실제로 넘긴 청크 수(적응형 k)
+        resp.headers["X-Cache"] = "BYPASS" if req.no_cache else "MISS"
+        return resp
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# 스트리밍 질문 처리 API (SSE: citations → token* → done)
+@app.post("/ask/stream")
+def ask_stream():
+    req, error = _parse_request()
+    if error:
+        return error
+    question, history = req.question, req.history
+
+    if not question:
+        return jsonify({"error": "question required"}), 400
+
+    # FAQ 사전 계산 답변이 있으면 검색 없이 캐시 적중과 같은 방식으로 전송
+    faq = hit = faq_lookup(req)
+    if not faq:
+        # 검색은 스트림 시작 전에 수행해 실패 시 일반 오류 응답으로 반환
+        try:
+            docs, qvec = retrieve(condense_question(question, history), k=req.k)
+        except Exception as e:
+            return jsonify({"error": f"search_failed: {e}"}), error_status(e)
+
+        ckey, hkey = chunk_key(docs), history_key(history[-8:])
+        with stage("cache"):
+            hit = None if req.no_cache or qvec is None else answerCache.lookup(qvec, ckey, hkey)
+
+    def events():
+        # 캐시 적중 시 저장된 답변을 한 번에 전송
+        if hit:
+            entry, _ = hit
+            remember(req, entry["answer"])
+            yield sse_event("citations", entry["citations"])
+            yield sse_event("token", {"t": entry["answer"]})
+            yield sse_event("done", {})
+            return
+
+        # 인용을 먼저 보내고 답변 토큰을 이어서 전송
+        citations = build_citations(docs)
+        yield sse_event("citations", citations)
+        parts = []
+        try:
+            for token in stream_once(req, docs, qvec, ckey, hkey):
+                parts.append(token)
+                yield sse_event("token", {"t": token})
+        except Exception as e:
+            # 토큰을 하나도 못 받았으면 문서 안내로 대체, 도중에 끊겼으면 오류 이벤트
+            fallback = None if parts else degraded_answer(docs, e)
+            if fallback is None:
+                yield sse_event("error", {"error": f"llm_failed: {e}"})
+            else:
+                yield sse_event("token", {"t": fallback})
+                yield sse_event("done", {"degraded": "llm"})
+            return
+        remember(req, "".join(parts))
+        yield sse_event("done", {})
+
+    resp = Response(stream_with_context(events()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"  # 프록시 버퍼링 방지
+    resp.headers["X-Cache"] = "FAQ" if faq else "HIT" if hit else ("BYPASS" if req.no_cache else "MISS")
+    if not faq:
+        resp.headers["X-Retrieval-K"] = str(len(docs))
+    return resp
+
+# 서버 측 세션 조회/삭제(UI 재접속·다른 인스턴스에서 대화 복원, 채팅 삭제)
+@app.get("/session/<sid>")
+def get_session(sid: str):
+    return jsonify({"session_id": sid, "messages": [
+        {"role": m["role"], "content": m["content"]} for m in sessionStore.history(sid)
+    ]})
+
+@app.delete("/session/<sid>")
+def delete_session(sid: str):
+    sessionStore.delete(sid)
+    return jsonify({"session_id": sid, "deleted": True})
+
+# 일괄 질의 API: JSONL 또는 {"items": [...]} 를 받아 끝나는 순서대로 JSONL 스트리밍
+@app.post("/ask/batch")
+def ask_batch():
+    try:
+        items, concurrency, skip = parse_batch(request.get_data())
+    except ValueError as e:
+        return jsonify({"error": f"invalid batch: {e}"}), 400
+    if len(items) > settings.batch_max_items:
+        return jsonify({"error": f"too many items (max {settings.batch_max_items})"}), 413
+
+    lines = (jsonl_line(r) for r in run_batch(items, concurrency, skip))
+    resp = Response(stream_with_context(lines), mimetype="application/x-ndjson")
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
 # 메인
 if __name__ == "__main__":
     # 서버 실행
-    app.run(host=settings.host, port=settings.port)
\ No newline at end of file
+    app.run(host=settings.host, port=settings.port)
@@ -0,0 +1,192 @@
+import contextlib
+import sys
+import threading
+import time
+from collections import Counter as _Counter
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 질문 처리 단계별 지연/토큰/검색 문서 수 계측
+# - 프로세스 누적: Prometheus 텍스트 형식(/metrics)
+# - 요청 단위: Server-Timing 헤더(브라우저 개발자 도구 Network > Timing 에서 확인)
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+_TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+def _fmt_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+# 누적 히스토그램(라벨 조합별 버킷 카운트/합계/개수)
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name, self.help, self.buckets = name, help, buckets
+        self._data: Dict[tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            d = self._data.get(key)
+            if d is None:
+                d = self._data[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    d[0][i] += 1
+                    break
+            d[1] += value
+            d[2] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._data.items()):
+                acc = 0
+                for b, c in zip(self.buckets, counts):
+                    acc += c
+                    le = _fmt_labels(key, 'le="%s"' % b)
+                    out.append(f"{self.name}_bucket{le} {acc}")
+                le = _fmt_labels(key, 'le="+Inf"')
+                out.append(f"{self.name}_bucket{le} {n}")
+                out.append(f"{self.name}_sum{_fmt_labels(key)} {total}")
+                out.append(f"{self.name}_count{_fmt_labels(key)} {n}")
+        return out
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._data: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._data[key] = self._data.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._data.items()):
+                out.append(f"{self.name}{_fmt_labels(key)} {v}")
+        return out
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Latency of each ask pipeline stage", _LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram("rag_request_seconds", "Latency until response headers, by route", _LATENCY_BUCKETS)
+REQUESTS = Counter("rag_requests_total", "Requests by route and status")
+RETRIEVED_DOCS = Histogram("rag_retrieved_docs", "Documents returned by retrieval", _COUNT_BUCKETS)
+LLM_TOKENS = Histogram("rag_llm_tokens", "Prompt/completion tokens per LLM call", _TOKEN_BUCKETS)
+CACHE_RESULTS = Counter("rag_answer_cache_requests_total", "Answer cache result per request")
+COALESCED = Counter("rag_coalesced_calls_total", "Calls served by an identical in-flight call, by layer")
+RESILIENCE = Counter("rag_resilience_events_total", "Hedged calls, deadline timeouts, circuit opens/rejections and degraded fallbacks")
+
+_REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, REQUESTS, RETRIEVED_DOCS, LLM_TOKENS, CACHE_RESULTS, COALESCED, RESILIENCE]
+
+# 현재 요청의 단계별 누적 시간(초). 요청 밖(색인, 예열 등)에서는 None
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("rag_timings", default=None)
+
+def begin_request():
+    return _timings.set({})
+
+def current_timings() -> Optional[Dict[str, float]]:
+    return _timings.get()
+
+def end_request(token) -> Dict[str, float]:
+    timings = _timings.get() or {}
+    _timings.reset(token)
+    return timings
+
+def record_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+# 단계 타이머: with stage("embed"): ...
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+def observe_docs(n: int) -> None:
+    RETRIEVED_DOCS.observe(n)
+
+# LangChain 응답의 usage_metadata(input_tokens/output_tokens) 기록
+def observe_usage(usage: Optional[dict]) -> None:
+    if not usage:
+        return
+    LLM_TOKENS.observe(usage.get("input_tokens", 0), kind="prompt")
+    LLM_TOKENS.observe(usage.get("output_tokens", 0), kind="completion")
+
+def observe_cache(result: str) -> None:
+    CACHE_RESULTS.inc(result=result.lower())
+
+def observe_request(route: str, status: int, seconds: float) -> None:
+    REQUEST_SECONDS.observe(seconds, route=route)
+    REQUESTS.inc(route=route, status=str(status))
+
+# Server-Timing 헤더 값(단계별 ms + 전체)
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    parts = [f"{name};dur={sec * 1000:.1f}" for name, sec in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+# Prometheus 텍스트. extra 는 캐시/임베딩 서비스 통계(이름이 _total 로 끝나면 counter, 아니면 gauge)
+def render(extra: Dict[str, float] | None = None) -> str:
+    lines: List[str] = []
+    for m in _REGISTRY:
+        lines.extend(m.render())
+    for name, v in (extra or {}).items():
+        lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+        lines.append(f"{name} {v}")
+    return "\n".join(lines) + "\n"
+
+# 샘플링 프로파일러(PROFILER=true): 모든 스레드의 스택을 주기적으로 수집해 collapsed stack 형식으로 제공
+# (flamegraph.pl / speedscope 로 바로 시각화 가능)
+class StackSampler:
+    def __init__(self, interval_ms: float = 10):
+        self.interval = interval_ms / 1000
+        self.samples: _Counter = _Counter()
+        self._lock = threading.Lock()
+        self._self_id: Optional[int] = None
+
+    def start(self) -> None:
+        t = threading.Thread(target=self._loop, daemon=True, name="stack-sampler")
+        t.start()
+        self._self_id = t.ident
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for tid, frame in frames.items():
+                    if tid == self._self_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]})")
+                        frame = frame.f_back
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self, reset: bool = False) -> str:
+        with self._lock:
+            out = "\n".join(f"{stack} {n}" for stack, n in self.samples.most_common())
+            if reset:
+                self.samples.clear()
+        return out + "\n"
+
+profiler: Optional[StackSampler] = None
+
+def start_profiler(interval_ms: float) -> StackSampler:
+    global profiler
+    if profiler is None:
+        profiler = StackSampler(interval_ms)
+        profiler.start()
+    return profiler
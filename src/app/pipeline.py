@@ -0,0 +1,222 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from .config import settings
+from .answer_cache import AnswerCache
+from .condense import condenseCache, is_standalone
+from .embed_cache import normalize_query
+from .embed_service import get_embed_service
+from .faq import faqIndex
+from .metrics import stage
+from .rag_chain import agenerate_answer, astream_answer, generate_answer, stream_answer
+from .resilience import degraded, llmGuard, stats as resilience_stats
+from .retriever import aembed_query, embed_query, embedCache
+from .sessions import sessionStore
+from .singleflight import SingleFlight, StreamFlight
+from .startup import readiness
+from .summarizer import summarizer
+
+log = logging.getLogger(__name__)
+
+# 의미 기반 답변 캐시(질문 벡터 유사도 + 동일 청크 집합) - Flask/ASGI 공용
+answerCache = AnswerCache(
+    maxsize=settings.answer_cache_size,
+    ttl=settings.answer_cache_ttl,
+    threshold=settings.answer_cache_threshold,
+)
+
+# 이어지는 대화(resume)인데 이 인스턴스가 세션을 모름(다른 호스트/재시작) - 409 unknown_session
+class UnknownSessionError(LookupError):
+    pass
+
+# /ask 요청 파라메터
+@dataclass
+class AskRequest:
+    question: str
+    k: int = 5
+    history: List[Dict[str, str]] = field(default_factory=list)
+    no_cache: bool = False
+    session_id: str = ""
+
+# 요청 검증 실패는 ValueError(→ 400): 객체가 아닌 본문, 문자열이 아닌 질문, 양의 정수가 아닌 k, 목록이 아닌 히스토리
+def parse_ask(payload: Dict[str, Any]) -> AskRequest:
+    if not isinstance(payload, dict):
+        raise ValueError("request body must be a JSON object")
+    question, k, history = payload.get("question"), payload.get("k"), payload.get("history")
+    if question is not None and not isinstance(question, str):
+        raise ValueError("question must be a string")
+    try:
+        k = 5 if k is None else int(k)
+    except (TypeError, ValueError):
+        raise ValueError("k must be a positive integer") from None
+    if k <= 0:
+        raise ValueError("k must be a positive integer")
+    if history is not None and not isinstance(history, list):
+        raise ValueError("history must be a list")
+    req = AskRequest(
+        question=(question or "").strip(),  # 질문
+        k=k,  # 검색 결과 개수
+        history=history or [],  # 대화 히스토리(최대 8개, session_id 가 없거나 409 후 재시도할 때만)
+        no_cache=bool(payload.get("no_cache")),  # 답변 캐시 우회 여부
+        session_id=str(payload.get("session_id") or "")[:64],  # 서버 측 세션 ID
+    )
+    # 세션 ID 가 있으면 히스토리는 서버 저장소에서 가져옴(요청에는 새 질문만).
+    # 이어지는 대화(resume)인데 세션이 없으면 UnknownSessionError, 클라이언트가 히스토리를 붙여 다시 보내면 그걸로 세션을 채움
+    if req.session_id:
+        stored = sessionStore.history(req.session_id)
+        if not stored and req.history:
+            sessionStore.seed(req.session_id, req.history[-8:])
+            stored = sessionStore.history(req.session_id)
+        elif not stored and payload.get("resume"):
+            raise UnknownSessionError(req.session_id)
+        req.history = stored
+    return req
+
+# 세션이 있으면 이번 질문/답변을 저장하고, 히스토리가 길어졌으면 백그라운드 요약 예약
+def remember(req: AskRequest, answer: str) -> None:
+    if req.session_id and answer:
+        sess = sessionStore.append(req.session_id, req.question, answer)
+        summarizer.maybe_schedule(req.session_id, sess)
+
+# 비동기 경로용: 세션 조회/저장(sqlite)과 토큰 계산은 이벤트 루프를 막지 않도록 스레드에서
+async def aparse_ask(payload: Dict[str, Any]) -> AskRequest:
+    if isinstance(payload, dict) and payload.get("session_id"):
+        return await asyncio.to_thread(parse_ask, payload)
+    return parse_ask(payload)
+
+async def aremember(req: AskRequest, answer: str) -> None:
+    if req.session_id and answer:
+        await asyncio.to_thread(remember, req, answer)
+
+# FAQ 사전 계산 답변 조회(맥락 없이 이해되는 질문만, 질문 임베딩은 이후 검색과 캐시 공유)
+def faq_lookup(req: AskRequest):
+    if req.no_cache or not faqIndex.entries or not is_standalone(req.question, req.history):
+        return None
+    try:
+        qvec = embed_query(req.question)
+    except Exception:
+        return None  # 임베딩 장애 시 FAQ 생략(검색 단계에서 키워드 검색으로 대체)
+    with stage("faq"):
+        return faqIndex.lookup(qvec)
+
+async def afaq_lookup(req: AskRequest):
+    if req.no_cache or not faqIndex.entries or not is_standalone(req.question, req.history):
+        return None
+    try:
+        qvec = await aembed_query(req.question)
+    except Exception:
+        return None
+    with stage("faq"):
+        return faqIndex.lookup(qvec)
+
+# 같은 질문 + 히스토리 + 검색 결과의 동시 생성은 LLM 한 번으로 합침(스트리밍은 토큰을 함께 받음)
+generateFlight = SingleFlight("generate")
+streamFlight = StreamFlight("generate_stream")
+
+def _flight_key(req: AskRequest, ckey: str, hkey: str) -> tuple:
+    return normalize_query(req.question), hkey, ckey
+
+# 답변 생성 후 답변 캐시 저장(합쳐진 요청 중 실제로 생성한 쪽에서 한 번만)
+# LLM 호출은 마감 시간(LLM_DEADLINE_MS, 스트리밍은 첫 토큰 LLM_TTFT_DEADLINE_MS)과 서킷 브레이커 적용
+def generate_once(req: AskRequest, docs: List[Dict[str, Any]], qvec: Optional[List[float]], ckey: str, hkey: str) -> str:
+    def run() -> str:
+        answer = llmGuard.call(lambda: generate_answer(req.question, docs, history=req.history))
+        if qvec is not None:
+            answerCache.store(qvec, ckey, hkey, answer, build_citations(docs))
+        return answer
+
+    return generateFlight.do(_flight_key(req, ckey, hkey), run)
+
+async def agenerate_once(req: AskRequest, docs: List[Dict[str, Any]], qvec: Optional[List[float]], ckey: str, hkey: str) -> str:
+    async def run() -> str:
+        answer = await llmGuard.acall(lambda: agenerate_answer(req.question, docs, history=req.history))
+        if qvec is not None:
+            answerCache.store(qvec, ckey, hkey, answer, build_citations(docs))
+        return answer
+
+    return await generateFlight.ado(_flight_key(req, ckey, hkey), run)
+
+def stream_once(req: AskRequest, docs: List[Dict[str, Any]], qvec: Optional[List[float]], ckey: str, hkey: str) -> Iterator[str]:
+    def produce() -> Iterator[str]:
+        parts = []
+        for token in llmGuard.stream(
+            lambda: stream_answer(req.question, docs, history=req.history), settings.llm_ttft_deadline_ms
+        ):
+            parts.append(token)
+            yield token
+        if qvec is not None:
+            answerCache.store(qvec, ckey, hkey, "".join(parts), build_citations(docs))
+
+    return streamFlight.stream(_flight_key(req, ckey, hkey), produce)
+
+def astream_once(req: AskRequest, docs: List[Dict[str, Any]], qvec: Optional[List[float]], ckey: str, hkey: str) -> AsyncIterator[str]:
+    async def produce() -> AsyncIterator[str]:
+        parts = []
+        async for token in llmGuard.astream(
+            lambda: astream_answer(req.question, docs, history=req.history), settings.llm_ttft_deadline_ms
+        ):
+            parts.append(token)
+            yield token
+        if qvec is not None:
+            answerCache.store(qvec, ckey, hkey, "".join(parts), build_citations(docs))
+
+    return streamFlight.astream(_flight_key(req, ckey, hkey), produce)
+
+# 인용 정보 구성
+def build_citations(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "source": d.get("source"),
+            "path": d.get("path"),
+            "url": d.get("url"),
+        }
+        for d in docs
+    ]
+
+# LLM 장애 시 대체 답변: 검색된 문서 목록(출처 + 앞부분)만 안내(DEGRADED_MODE 가 아니면 None)
+_SNIPPET_CHARS = 200
+
+def degraded_answer(docs: List[Dict[str, Any]], error: BaseException) -> Optional[str]:
+    if not settings.degraded_mode or not docs:
+        return None
+    log.warning("llm unavailable, citations-only answer: %s", error)
+    degraded("citations_only")
+    lines = ["지금은 답변 생성 서비스가 응답하지 않아, 질문과 관련된 문서만 안내합니다.", ""]
+    for i, d in enumerate(docs, 1):
+        text = " ".join((d.get("chunk") or d.get("content") or "").split())
+        snippet = text[:_SNIPPET_CHARS] + ("…" if len(text) > _SNIPPET_CHARS else "")
+        lines.append(f"{i}. **{d.get('source') or d.get('path') or '문서'}** - {snippet}")
+    return "\n".join(lines)
+
+# SSE 이벤트 한 건 직렬화
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# /metrics 에 함께 내보낼 캐시/임베딩 서비스 통계
+def stats_metrics() -> Dict[str, float]:
+    e, a, s = embedCache.stats(), answerCache.stats(), get_embed_service().stats()
+    c, f = condenseCache.stats(), faqIndex.stats()
+    return {
+        "rag_embed_cache_entries": e["size"],
+        "rag_embed_cache_hits_total": e["hits"],
+        "rag_embed_cache_disk_hits_total": e["disk_hits"],
+        "rag_embed_cache_misses_total": e["misses"],
+        "rag_answer_cache_entries": a["size"],
+        "rag_answer_cache_hits_total": a["hits"],
+        "rag_answer_cache_misses_total": a["misses"],
+        "rag_faq_entries": f["size"],
+        "rag_faq_hits_total": f["hits"],
+        "rag_faq_misses_total": f["misses"],
+        "rag_condense_cache_entries": c["size"],
+        "rag_condense_cache_hits_total": c["hits"],
+        "rag_condense_cache_misses_total": c["misses"],
+        "rag_embed_queue_depth": s["queue_depth"],
+        "rag_embed_batches_total": s["batches"],
+        "rag_embed_retries_429_total": s["retries_429"],
+        "rag_embed_retries_5xx_total": s["retries_5xx"],
+        **{f"rag_circuit_open_{name}": int(g["state"] != "closed") for name, g in resilience_stats().items()},
+        "rag_ready": int(readiness.ready),
+        "rag_startup_seconds": (readiness.ready_ms or 0) / 1000,
+    }
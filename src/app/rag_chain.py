@@ -1,32 +1,31 @@
+import asyncio
 import os
-from typing import List, Dict, Any
-from langchain_openai import AzureChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Dict, Any, Iterator, AsyncIterator
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
 from .config import settings
+from .clients import get_llm
+from .context import pack_context, trim_history
+from .metrics import observe_usage, record_stage, stage
+
+if TYPE_CHECKING:
+    from langchain_openai import AzureChatOpenAI
+
+# prompts load(처음 사용할 때 한 번 읽음)
+@lru_cache(maxsize=None)
+def load_prompt(name: str) -> str:
+    with open(os.path.join(os.path.dirname(__file__), "prompts", name), "r", encoding="utf-8") as f:
+        return f.read()
+
+# 문서 출처 조회(중복 제거 후 관련도 순으로 토큰 예산만큼 패킹)
+def build_context(docs: List[Dict[str, Any]], max_tokens: int | None = None) -> str:
+    return pack_context(docs, max_tokens)
+
+# LLM 생성(요청마다 새 클라이언트, 벤치마크 비교용 - 평소에는 공용 get_llm() 사용)
+def make_llm() -> "AzureChatOpenAI":
+    from langchain_openai import AzureChatOpenAI
 
-# prompts load
-SYSTEM = open(
-    os.path.join(os.path.dirname(__file__), "prompts", "system_ko.md"),
-    "r",
-    encoding="utf-8",
-).read()
-
-# 문서 출처 조회
-def build_context(docs: List[Dict[str, Any]], max_chars: int = 1800) -> str:
-    lines, used = [], 0
-    for d in docs:
-        text = d.get("chunk") or d.get("content", "") or ""
-        src = d.get("source", "") or "문서"
-        snippet = (text.strip().replace("\n", " "))[:400]
-        line = f"- {src}: {snippet}"
-        if used + len(line) > max_chars:
-            break
-        lines.append(line)
-        used += len(line)
-    return "\n".join(lines)
-
-# LLM 생성
-def make_llm() -> AzureChatOpenAI:
     return AzureChatOpenAI(
         azure_endpoint=settings.aoai_endpoint,
         api_key=settings.aoai_key,
@@ -35,21 +34,26 @@ def make_llm() -> AzureChatOpenAI:
         temperature=0.2,
     )
 
-# 답변 생성
-def generate_answer(
+# LLM 입력 메시지 구성
+def build_messages(
     question: str,
     docs: List[Dict[str, Any]],
-    llm: AzureChatOpenAI | None = None,
     history: List[Dict[str, str]] | None = None,
-) -> str:
-    llm = llm or make_llm()
-    ctx = build_context(docs)   
+) -> List[BaseMessage]:
+    with stage("context"):
+        ctx = build_context(docs)
 
     # SYSTEM 프롬프트 구성
-    messages = [SystemMessage(content=SYSTEM)]
+    messages: List[BaseMessage] = [SystemMessage(content=load_prompt("system_ko.md"))]
+
+    # 이전 대화 요약(서버 세션) 반영
+    history = history or []
+    for m in history:
+        if m.get("role") == "summary" and m.get("content"):
+            messages.append(SystemMessage(content=f"이전 대화 요약:\n{m['content']}"))
 
-    # 최근 히스토리(최대 8개) 반영
-    for m in (history or [])[-8:]:
+    # 최근 히스토리(최대 8개, HISTORY_MAX_TOKENS 이내) 반영
+    for m in trim_history([m for m in history if m.get("role") != "summary"][-8:]):
         role = (m.get("role") or "").lower()
         content = m.get("content") or ""
         if role == "user":
@@ -59,6 +63,79 @@ def generate_answer(
 
     # 최종 질문과 문서 출처 반영
     messages.append(HumanMessage(content=f"질문: {question}\n\n참고 자료:\n{ctx}"))
+    return messages
+
+# 답변 생성
+def generate_answer(
+    question: str,
+    docs: List[Dict[str, Any]],
+    llm: "AzureChatOpenAI | None" = None,
+    history: List[Dict[str, str]] | None = None,
+) -> str:
+    llm = llm or get_llm()
+    messages = build_messages(question, docs, history)
 
     # LLM 호출 
-    return llm.invoke(messages).content
\ No newline at end of file
+    with stage("llm"):
+        resp = llm.invoke(messages)
+    observe_usage(resp.usage_metadata)
+    return resp.content
+
+# 답변 스트리밍 생성(토큰 단위로 yield)
+def stream_answer(
+    question: str,
+    docs: List[Dict[str, Any]],
+    llm: "AzureChatOpenAI | None" = None,
+    history: List[Dict[str, str]] | None = None,
+) -> Iterator[str]:
+    llm = llm or get_llm()
+    messages = build_messages(question, docs, history)
+
+    # 첫 토큰까지(llm_ttft)와 전체 스트림(llm) 시간을 따로 기록
+    t0, first = time.perf_counter(), True
+    try:
+        for chunk in llm.stream(messages):
+            observe_usage(chunk.usage_metadata)  # 마지막 청크에만 usage 포함(stream_usage)
+            if chunk.content:
+                if first:
+                    record_stage("llm_ttft", time.perf_counter() - t0)
+                    first = False
+                yield chunk.content
+    finally:
+        record_stage("llm", time.perf_counter() - t0)
+
+# 답변 생성(비동기)
+async def agenerate_answer(
+    question: str,
+    docs: List[Dict[str, Any]],
+    llm: "AzureChatOpenAI | None" = None,
+    history: List[Dict[str, str]] | None = None,
+) -> str:
+    llm = llm or get_llm()
+    messages = await asyncio.to_thread(build_messages, question, docs, history)  # tiktoken 패킹은 스레드에서
+    with stage("llm"):
+        resp = await llm.ainvoke(messages)
+    observe_usage(resp.usage_metadata)
+    return resp.content
+
+# 답변 스트리밍 생성(비동기)
+async def astream_answer(
+    question: str,
+    docs: List[Dict[str, Any]],
+    llm: "AzureChatOpenAI | None" = None,
+    history: List[Dict[str, str]] | None = None,
+) -> AsyncIterator[str]:
+    llm = llm or get_llm()
+    messages = await asyncio.to_thread(build_messages, question, docs, history)
+
+    t0, first = time.perf_counter(), True
+    try:
+        async for chunk in llm.astream(messages):
+            observe_usage(chunk.usage_metadata)
+            if chunk.content:
+                if first:
+                    record_stage("llm_ttft", time.perf_counter() - t0)
+                    first = False
+                yield chunk.content
+    finally:
+        record_stage("llm", time.perf_counter() - t0)
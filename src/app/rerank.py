@@ -0,0 +1,120 @@
+import logging
+import os
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Protocol
+import numpy as np
+from .config import settings
+
+# 재순위(rerank): 검색에서 후보를 넉넉히(RERANK_CANDIDATES) 가져와 CPU 점수기로 다시 매기고
+# 상위 k 개만 LLM 에 넘긴다. 같은 예산이면 더 관련 있는 청크가, 더 적은 청크로 프롬프트에 들어간다.
+# - RERANK_MODE=fusion: 후보 집합 안 BM25 + 질의어 커버리지 + 검색 순위(하이브리드 RRF, 벡터 유사도 반영) 가중 합
+# - RERANK_MODE=onnx: RERANK_MODEL_DIR 의 cross-encoder(model.onnx + tokenizer.json, int8 양자화 권장)
+#   onnxruntime/tokenizers 가 없거나 로드에 실패하면 fusion 으로 대체
+# - RERANK_BUDGET_MS 를 넘기면 남은 후보는 점수 없이 검색 순서대로 뒤에 붙임
+
+log = logging.getLogger(__name__)
+
+_W_BM25, _W_COVERAGE, _W_RANK = 0.4, 0.3, 0.3
+_K1, _B = 1.2, 0.75
+
+# 후보 배치 점수기(docs 순서 = 검색 순위)
+class Scorer(Protocol):
+    batch_size: Optional[int]  # None 이면 후보 전체를 한 번에
+
+    def score(self, query: str, docs: List[Dict[str, Any]]) -> np.ndarray: ...
+
+def _text(d: Dict[str, Any]) -> str:
+    return d.get("chunk") or d.get("content") or ""
+
+def _unit_max(x: np.ndarray) -> np.ndarray:
+    m = float(x.max()) if len(x) else 0.0
+    return x / m if m > 0 else x
+
+# 어휘 + 순위 융합 점수(질의어 × 후보 행렬로 한 번에 계산)
+class FusionScorer:
+    batch_size = None
+
+    def score(self, query: str, docs: List[Dict[str, Any]]) -> np.ndarray:
+        from .local_index import RRF_K, tokenize
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        n = len(docs)
+        rank = _unit_max(1.0 / (RRF_K + np.arange(n) + 1))
+        if not terms or not n:
+            return rank
+
+        counts = [Counter(tokenize(_text(d))) for d in docs]
+        tf = np.array([[c.get(t, 0) for t in terms] for c in counts], dtype=np.float32)
+        dl = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+
+        norm = _K1 * (1 - _B + _B * dl / (dl.mean() or 1.0))
+        bm25 = (tf * (_K1 + 1) / (tf + norm[:, None])) @ idf
+        coverage = ((tf > 0) @ idf) / (idf.sum() or 1.0)
+        return _W_BM25 * _unit_max(bm25) + _W_COVERAGE * coverage + _W_RANK * rank
+
+# cross-encoder(ONNX) 점수: (질문, 청크) 쌍을 배치로 토크나이즈해 logit 의 sigmoid 를 점수로 사용
+class OnnxScorer:
+    batch_size = 8
+
+    def __init__(self, model_dir: str, max_length: int = 512):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), opts, providers=["CPUExecutionProvider"]
+        )
+        self.inputs = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+
+    def score(self, query: str, docs: List[Dict[str, Any]]) -> np.ndarray:
+        enc = self.tokenizer.encode_batch([(query, _text(d)) for d in docs])
+        feed = {
+            "input_ids": np.array([e.ids for e in enc], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in enc], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in enc], dtype=np.int64),
+        }
+        logits = self.session.run(None, {k: v for k, v in feed.items() if k in self.inputs})[0]
+        logits = logits[:, -1] if logits.ndim == 2 else logits
+        return 1 / (1 + np.exp(-logits))
+
+# 설정에 따른 점수기(off 이면 None)
+@lru_cache(maxsize=None)
+def get_scorer() -> Optional[Scorer]:
+    if settings.rerank_mode == "onnx":
+        try:
+            return OnnxScorer(settings.rerank_model_dir)
+        except Exception:
+            log.exception("onnx reranker unavailable, falling back to fusion scorer")
+            return FusionScorer()
+    if settings.rerank_mode == "fusion":
+        return FusionScorer()
+    return None
+
+# 검색에서 가져올 후보 수(재순위를 쓰지 않으면 k 그대로)
+def rerank_candidates(k: int) -> int:
+    return max(k, settings.rerank_candidates) if get_scorer() is not None else k
+
+# 후보를 점수 순으로 정렬해 상위 top_n 반환(score 는 재순위 점수로 교체).
+# 예산을 넘기면 점수를 매긴 후보 뒤에 나머지를 검색 순서대로(score=None)
+def rerank(query: str, docs: List[Dict[str, Any]], top_n: int, budget_ms: float | None = None) -> List[Dict[str, Any]]:
+    scorer = get_scorer()
+    if scorer is None or len(docs) <= 1:
+        return docs[:top_n]
+    budget = (settings.rerank_budget_ms if budget_ms is None else budget_ms) / 1000
+    size = scorer.batch_size or len(docs)
+    t0 = time.perf_counter()
+    scores: List[float] = []
+    for i in range(0, len(docs), size):
+        if i and time.perf_counter() - t0 > budget:
+            break
+        scores.extend(np.asarray(scorer.score(query, docs[i:i + size]), dtype=np.float32).tolist())
+    order = sorted(range(len(scores)), key=lambda i: -scores[i]) + list(range(len(scores), len(docs)))
+    return [{**docs[i], "score": scores[i] if i < len(scores) else None} for i in order[:top_n]]
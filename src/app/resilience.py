@@ -0,0 +1,285 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional
+from .config import settings
+from .metrics import RESILIENCE
+
+# 외부 호출(임베딩/검색/채팅) 복원력 계층: Azure 지연·스로틀링이 요청 전체를 붙잡지 않도록
+# - 마감 시간(deadline): 호출별 상한(*_DEADLINE_MS). 넘기면 DeadlineExceeded
+# - 헤지(hedge): 최근 지연 p95 를 넘도록 응답이 없으면 같은 호출을 한 번 더 보내 먼저 끝난 쪽 사용
+#   (HEDGE_STAGES 에 포함된 호출만, 전체 호출의 HEDGE_MAX_RATIO 이내로 - 스로틀링 중 부하 증폭 방지)
+# - 서킷 브레이커: 연속 BREAKER_FAILURES 회 실패하면 BREAKER_RESET_SECONDS 동안 즉시 거절(CircuitOpenError),
+#   이후 한 건만 시험(half-open)해 성공하면 닫고 실패하면 다시 엶
+# 대체 응답(키워드 검색만, 인용만 있는 답변)은 호출하는 쪽(retriever/pipeline)에서 DEGRADED_MODE 에 따라 처리
+
+log = logging.getLogger(__name__)
+
+_WINDOW = 256       # p95 계산에 쓰는 최근 성공 지연 수
+_MIN_SAMPLES = 20   # 이보다 적으면 헤지하지 않음
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+# 서비스 상태와 무관한 요청 오류(4xx, 단 408/429 제외)는 브레이커 실패로 세지 않음
+def _counts_as_failure(e: BaseException) -> bool:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status not in (408, 429))
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failures: int = 5, reset_seconds: float = 30):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._streak = 0
+        self._opened = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    # 호출 전 확인: 열려 있으면 거절, 재시도 시간이 지났으면 한 건만 시험 호출 허용
+    def before(self) -> None:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self._opened >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+        RESILIENCE.inc(event="rejected", call=self.name)
+        raise CircuitOpenError(f"{self.name} circuit open")
+
+    # 시험 호출이 결과 없이 끝남(요청 취소 등) - 다음 호출이 다시 시험
+    def release(self) -> None:
+        with self._lock:
+            self._probing = False
+
+    def success(self) -> None:
+        with self._lock:
+            self._streak = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                log.info("%s circuit closed", self.name)
+            self.state = self.CLOSED
+
+    def failure(self, e: BaseException) -> None:
+        with self._lock:
+            self._probing = False
+            if not _counts_as_failure(e):
+                return
+            self._streak += 1
+            if self.state == self.HALF_OPEN or self._streak >= self.failures:
+                if self.state != self.OPEN:
+                    RESILIENCE.inc(event="opened", call=self.name)
+                    log.warning("%s circuit opened after %d failures: %s", self.name, self._streak, e)
+                self.state = self.OPEN
+                self._opened = time.monotonic()
+
+# 최근 성공 호출 지연(초) 창에서 p95
+class LatencyWindow:
+    def __init__(self, size: int = _WINDOW):
+        self._samples: "deque[float]" = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        samples = sorted(self._samples)
+        if len(samples) < _MIN_SAMPLES:
+            return None
+        return samples[int(0.95 * (len(samples) - 1))]
+
+# 가드 스레드에서도 요청별 단계 시간이 기록되도록 현재 context 를 복사해 실행
+_pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix="guard")
+
+def _submit(fn, *args):
+    return _pool.submit(contextvars.copy_context().run, fn, *args)
+
+_END = object()
+
+class Guard:
+    def __init__(self, name: str, deadline_ms: float = 0, hedge: bool = False):
+        self.name = name
+        self.deadline = deadline_ms / 1000 if deadline_ms > 0 else None
+        self.hedge = hedge
+        self.breaker = CircuitBreaker(name, settings.breaker_failures, settings.breaker_reset_seconds)
+        self.latency = LatencyWindow()
+        self.calls = 0
+        self.hedges = 0
+
+    # 헤지까지 기다릴 시간(초). 표본이 적거나 헤지 예산을 다 썼으면 None
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or self.hedges >= settings.hedge_max_ratio * self.calls:
+            return None
+        p95 = self.latency.p95()
+        return None if p95 is None else max(p95, settings.hedge_min_ms / 1000)
+
+    def _begin(self) -> tuple:
+        self.breaker.before()
+        self.calls += 1
+        t0 = time.perf_counter()
+        end = t0 + self.deadline if self.deadline else None
+        delay = self.hedge_delay()
+        return t0, end, None if delay is None else t0 + delay
+
+    def _ok(self, t0: float) -> None:
+        self.latency.add(time.perf_counter() - t0)
+        self.breaker.success()
+
+    def _fail(self, e: BaseException) -> None:
+        if isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+            self.breaker.release()
+            return
+        if isinstance(e, DeadlineExceeded):
+            RESILIENCE.inc(event="deadline", call=self.name)
+        self.breaker.failure(e)
+
+    def _hedged(self) -> None:
+        self.hedges += 1
+        RESILIENCE.inc(event="hedged", call=self.name)
+
+    def _timeout(self, end: Optional[float], hedge_at: Optional[float]) -> Optional[float]:
+        now = time.perf_counter()
+        marks = [t - now for t in (end, hedge_at) if t is not None]
+        return max(0.0, min(marks)) if marks else None
+
+    def _expired(self) -> DeadlineExceeded:
+        return DeadlineExceeded(f"{self.name} exceeded {self.deadline * 1000:.0f} ms")
+
+    # 동기 호출(헤지한 경우 늦게 끝난 쪽은 스레드에서 마저 끝나고 결과는 버림)
+    def call(self, fn: Callable[[], Any]) -> Any:
+        t0, end, hedge_at = self._begin()
+        pending, error = {_submit(fn)}, None
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=self._timeout(end, hedge_at), return_when=FIRST_COMPLETED)
+                for f in done:
+                    if f.exception() is None:
+                        self._ok(t0)
+                        return f.result()
+                    error = f.exception()
+                if not pending:
+                    break
+                if end is not None and time.perf_counter() >= end:
+                    raise self._expired()
+                if hedge_at is not None and time.perf_counter() >= hedge_at:
+                    hedge_at = None
+                    self._hedged()
+                    pending.add(_submit(fn))
+            raise error
+        except BaseException as e:
+            self._fail(e)
+            raise
+
+    # 비동기 호출(헤지한 경우 늦은 쪽은 취소)
+    async def acall(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        t0, end, hedge_at = self._begin()
+        pending, error = {asyncio.ensure_future(fn())}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=self._timeout(end, hedge_at), return_when=asyncio.FIRST_COMPLETED)
+                for f in done:
+                    if f.exception() is None:
+                        self._ok(t0)
+                        return f.result()
+                    error = f.exception()
+                if not pending:
+                    break
+                if end is not None and time.perf_counter() >= end:
+                    raise self._expired()
+                if hedge_at is not None and time.perf_counter() >= hedge_at:
+                    hedge_at = None
+                    self._hedged()
+                    pending.add(asyncio.ensure_future(fn()))
+            raise error
+        except BaseException as e:
+            self._fail(e)
+            raise
+        finally:
+            for f in pending:
+                f.cancel()
+
+    # 스트리밍: 첫 청크까지 first_ms 마감(헤지 없음), 이후는 그대로 전달
+    def stream(self, gen_fn: Callable[[], Iterator[str]], first_ms: float = 0) -> Iterator[str]:
+        self.breaker.before()
+        self.calls += 1
+        t0 = time.perf_counter()
+        try:
+            it = iter(gen_fn())
+            try:
+                first = _submit(next, it, _END).result(timeout=first_ms / 1000 if first_ms > 0 else None)
+            except FutureTimeout:
+                raise DeadlineExceeded(f"{self.name} first token exceeded {first_ms:.0f} ms") from None
+            if first is not _END:
+                yield first
+                yield from it
+        except GeneratorExit:
+            self._ok(t0)  # 첫 청크 이후 소비자가 끊음(호출 자체는 성공)
+            raise
+        except BaseException as e:
+            self._fail(e)
+            raise
+        self._ok(t0)
+
+    async def astream(self, gen_fn: Callable[[], AsyncIterator[str]], first_ms: float = 0) -> AsyncIterator[str]:
+        self.breaker.before()
+        self.calls += 1
+        t0 = time.perf_counter()
+        try:
+            it = gen_fn().__aiter__()
+            try:
+                first = await asyncio.wait_for(it.__anext__(), first_ms / 1000 if first_ms > 0 else None)
+            except StopAsyncIteration:
+                first = _END
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"{self.name} first token exceeded {first_ms:.0f} ms") from None
+            if first is not _END:
+                yield first
+                async for chunk in it:
+                    yield chunk
+        except GeneratorExit:
+            self._ok(t0)  # 첫 청크 이후 소비자가 끊음(호출 자체는 성공)
+            raise
+        except BaseException as e:
+            self._fail(e)
+            raise
+        self._ok(t0)
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.latency.p95()
+        return {
+            "state": self.breaker.state,
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+        }
+
+_HEDGE = {s.strip() for s in settings.hedge_stages.split(",") if s.strip()}
+
+embedGuard = Guard("embed", settings.embed_deadline_ms, hedge="embed" in _HEDGE)
+searchGuard = Guard("search", settings.search_deadline_ms, hedge="search" in _HEDGE)
+llmGuard = Guard("llm", settings.llm_deadline_ms, hedge="llm" in _HEDGE)
+auxGuard = Guard("aux_llm", settings.condense_deadline_ms, hedge="aux_llm" in _HEDGE)
+
+GUARDS = [embedGuard, searchGuard, llmGuard, auxGuard]
+
+# 서비스 불가(브레이커 열림/마감 초과)면 503, 그 밖의 오류는 500
+def error_status(e: BaseException) -> int:
+    return 503 if isinstance(e, (CircuitOpenError, DeadlineExceeded)) else 500
+
+def degraded(kind: str) -> None:
+    RESILIENCE.inc(event="degraded", call=kind)
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {g.name: g.stats() for g in GUARDS}
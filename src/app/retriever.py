@@ -1,43 +1,342 @@
-from typing import List, Dict, Any
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.search.documents.models import VectorizedQuery
-from langchain_openai import AzureOpenAIEmbeddings
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Protocol, Tuple
 from .config import settings
+from .clients import get_search_client, get_async_search_client
+from .embed_cache import EmbeddingCache, normalize_query
+from .embed_service import get_embed_service
+from .metrics import observe_docs, stage
+from .rerank import rerank, rerank_candidates
+from .resilience import degraded, embedGuard, searchGuard
+from .singleflight import SingleFlight
 
-# SearchClient 생성 및 초기화
-searchClient = SearchClient(
-    settings.search_endpoint,
-    settings.search_index,
-    AzureKeyCredential(settings.search_key),
-)
+log = logging.getLogger(__name__)
 
-# Embedding 모델 초기화
-openAiembedding = AzureOpenAIEmbeddings(
-    azure_endpoint=settings.aoai_endpoint,
-    api_key=settings.aoai_key,
-    azure_deployment=settings.aoai_embed,
-    api_version=settings.aoai_api_version,
+# 질의 임베딩 캐시(LRU + 선택적 sqlite)
+embedCache = EmbeddingCache(
+    maxsize=settings.embed_cache_size,
+    ttl=settings.embed_cache_ttl,
+    path=settings.embed_cache_path,
 )
 
+# 캐시 키에 쓰는 임베딩 모델 식별자(해시 임베딩과 Azure 배포 벡터가 섞이지 않도록)
+def _embed_model() -> str:
+    return "hash" if settings.embedder == "hash" else settings.aoai_embed
+
+# 같은 질의의 동시 임베딩/검색은 한 번만 실행(single-flight)
+embedFlight = SingleFlight("embed")
+retrieveFlight = SingleFlight("retrieve")
+
+# 질의 벡터화(캐시 우선, 마감 시간/헤지/서킷 브레이커 적용)
+def embed_query(query: str) -> List[float]:
+    model = _embed_model()
+    with stage("embed"):
+        return embedFlight.do(
+            EmbeddingCache.key(query, model),
+            lambda: embedCache.get_or_embed(query, model, _embed_guarded),
+        )
+
+# 재시도는 임베딩 서비스가 맡고, 가드의 마감 시각을 넘겨 그 뒤로는 재시도하지 않게 함
+def _embed_deadline():
+    return time.monotonic() + embedGuard.deadline if embedGuard.deadline else None
+
+def _embed_guarded(query: str) -> List[float]:
+    deadline = _embed_deadline()
+    return embedGuard.call(lambda: get_embed_service().embed(query, deadline))
+
+# 질의 벡터화(비동기, 캐시 우선). sqlite 디스크 계층은 이벤트 루프를 막지 않도록 스레드에서
+async def aembed_query(query: str) -> List[float]:
+    model = _embed_model()
+    with stage("embed"):
+        if embedCache.persistent:
+            vec = await asyncio.to_thread(embedCache.get, query, model)
+        else:
+            vec = embedCache.get(query, model)
+        if vec is None:
+            vec = await embedFlight.ado(EmbeddingCache.key(query, model), lambda: _aembed_and_store(query, model))
+    return vec
+
+async def _aembed_and_store(query: str, model: str) -> List[float]:
+    deadline = _embed_deadline()
+    vec = await embedGuard.acall(lambda: get_embed_service().aembed(query, deadline))
+    if embedCache.persistent:
+        await asyncio.to_thread(embedCache.put, query, model, vec)
+    else:
+        embedCache.put(query, model, vec)
+    return vec
+
+# 자주 묻는 질문 파일로 임베딩 캐시 예열
+def warm_embed_cache(path: str) -> int:
+    return embedCache.warm(path, _embed_model(), get_embed_service().embed_many)
+
+# 여러 질문의 임베딩을 배치로 미리 계산해 캐시에 저장(일괄 질의용), 새로 계산한 개수 반환
+def prefetch_embeddings(queries: List[str]) -> int:
+    model = _embed_model()
+    missing = list(dict.fromkeys(q for q in queries if embedCache.get(q, model) is None))
+    if missing:
+        with stage("embed_batch"):
+            vecs = get_embed_service().embed_many(missing)
+        for q, vec in zip(missing, vecs):
+            embedCache.put(q, model, vec)
+    return len(missing)
+
+# 검색 엔진 인터페이스(Azure AI Search / 로컬 인덱스)
+# search: 키워드+벡터 하이브리드, keyword_search/vector_search: 병렬 검색 모드에서 쓰는 단일 경로
+class Retriever(Protocol):
+    def search(self, query: str, k: int = 8, qvec: List[float] | None = None) -> List[Dict[str, Any]]: ...
+
+    def keyword_search(self, query: str, k: int = 8) -> List[Dict[str, Any]]: ...
+
+    def vector_search(self, qvec: List[float], k: int = 8) -> List[Dict[str, Any]]: ...
+
+    async def asearch(self, query: str, k: int = 8, qvec: List[float] | None = None) -> List[Dict[str, Any]]: ...
+
+    async def akeyword_search(self, query: str, k: int = 8) -> List[Dict[str, Any]]: ...
+
+    async def avector_search(self, qvec: List[float], k: int = 8) -> List[Dict[str, Any]]: ...
+
+# 검색 결과를 사용하기 편하게 가공
+def _to_doc(r) -> Dict[str, Any]:
+    return {
+        "content": r.get("chunk"),      # 문서 내용
+        "source":  r.get("source"),     # 문서 출처
+        "path":    r.get("path"),       # 문서 경로
+        "score":   r.get("@search.score"),  # 관련도 점수(하이브리드는 RRF 점수, 적응형 k 에 사용)
+    }
+
+# Azure AI Search 하이브리드 검색
+class AzureRetriever:
+    def _query(self, query: str | None, k: int, qvec: List[float] | None) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {
+            "search_text": query,                   # 키워드 검색 조건(None 이면 벡터 전용)
+            "select": ["chunk", "source", "path"],  # 반환 필드
+            "top": k,                               # 최대 검색 개수
+        }
+        if qvec is not None:
+            from azure.search.documents.models import VectorizedQuery
+
+            # 벡터 검색 조건
+            kwargs["vector_queries"] = [VectorizedQuery(vector=qvec, k_nearest_neighbors=k, fields="text_vector")]
+        return kwargs
+
+    def search(self, query: str, k: int = 8, qvec: List[float] | None = None) -> List[Dict[str, Any]]:
+        return [_to_doc(r) for r in get_search_client().search(**self._query(query, k, qvec))]
+
+    def keyword_search(self, query: str, k: int = 8) -> List[Dict[str, Any]]:
+        return self.search(query, k=k, qvec=None)
+
+    def vector_search(self, qvec: List[float], k: int = 8) -> List[Dict[str, Any]]:
+        return [_to_doc(r) for r in get_search_client().search(**self._query(None, k, qvec))]
+
+    async def asearch(self, query: str, k: int = 8, qvec: List[float] | None = None) -> List[Dict[str, Any]]:
+        results = await get_async_search_client().search(**self._query(query, k, qvec))
+        return [_to_doc(r) async for r in results]
+
+    async def akeyword_search(self, query: str, k: int = 8) -> List[Dict[str, Any]]:
+        return await self.asearch(query, k=k, qvec=None)
+
+    async def avector_search(self, qvec: List[float], k: int = 8) -> List[Dict[str, Any]]:
+        results = await get_async_search_client().search(**self._query(None, k, qvec))
+        return [_to_doc(r) async for r in results]
+
+# 설정(RETRIEVER_BACKEND)에 따라 검색 엔진 선택
+@lru_cache(maxsize=None)
+def get_retriever() -> Retriever:
+    if settings.retriever_backend == "local":
+        from .local_index import LocalRetriever
+
+        return LocalRetriever.load(settings.local_index_dir, settings.embedder)
+    return AzureRetriever()
+
 # 하이브리드 검색
-def search_hybrid(query: str, k: int = 8) -> List[Dict[str, Any]]:
-    qvec = openAiembedding.embed_query(query)   # query 벡터화
-    vectorizedQuery = VectorizedQuery(vector=qvec, k_nearest_neighbors=k, fields="text_vector") # 벡터 검색 조건
-
-    results = searchClient.search(
-        search_text=query,                      # 키워드 검색 조건
-        vector_queries=[vectorizedQuery],       # 벡터 검색 조건
-        select=["chunk", "source", "path"],     # 반환 필드
-        top=k,                                  # 최대 검색 개수
-    )
-
-    # 검색 결과를 사용하기 편하게 가공
-    out: List[Dict[str, Any]] = []
-    for r in results:
-        out.append({
-            "content": r.get("chunk"),      # 문서 내용
-            "source":  r.get("source"),     # 문서 출처
-            "path":    r.get("path")        # 문서 경로
-        })
-    return out
\ No newline at end of file
+def search_hybrid(
+    query: str, k: int = 8, qvec: List[float] | None = None
+) -> List[Dict[str, Any]]:
+    qvec = qvec or embed_query(query)   # query 벡터화(이미 계산된 벡터가 있으면 재사용)
+    with stage("search"):
+        return searchGuard.call(lambda: get_retriever().search(query, k=k, qvec=qvec))
+
+# 하이브리드 검색(비동기)
+async def asearch_hybrid(
+    query: str, k: int = 8, qvec: List[float] | None = None
+) -> List[Dict[str, Any]]:
+    qvec = qvec or await aembed_query(query)
+    with stage("search"):
+        return await searchGuard.acall(lambda: get_retriever().asearch(query, k=k, qvec=qvec))
+
+# 키워드/벡터 결과를 클라이언트 측 RRF 로 융합(같은 청크는 source/path/content 로 식별)
+def fuse_results(legs: List[List[Dict[str, Any]]], k: int) -> List[Dict[str, Any]]:
+    from .local_index import rrf_fuse
+
+    index: Dict[tuple, int] = {}
+    docs: List[Dict[str, Any]] = []
+    rankings = []
+    for leg in legs:
+        ranking = []
+        for d in leg:
+            key = (d.get("source"), d.get("path"), d.get("content"))
+            if key not in index:
+                index[key] = len(docs)
+                docs.append(d)
+            ranking.append(index[key])
+        rankings.append(ranking)
+    fused = rrf_fuse(rankings)
+    return [{**docs[i], "score": fused[i]} for i in sorted(fused, key=fused.get, reverse=True)[:k]]
+
+# 적응형 k(ADAPTIVE_K): 점수가 평탄할 때만 넓힐 수 있도록 최대 ADAPTIVE_K_MAX 개까지 가져옴
+def _fetch_k(k: int) -> int:
+    return max(k, settings.adaptive_k_max) if settings.adaptive_k else k
+
+# 점수 분포(검색 순서, 최고점 대비 비율)로 넘길 개수 결정
+# - 평탄: k 번째 점수도 최고점의 ADAPTIVE_FLAT 이상이면 비슷한 점수가 이어지는 동안 ADAPTIVE_K_MAX 까지 확장
+# - 급락: 앞 문서 대비 ADAPTIVE_GAP 이상 떨어지는 지점에서 자름
+# - 누적: 상위 k 개 점수 합의 ADAPTIVE_MASS 에 도달하면 자름
+# 점수가 없는 문서(재순위 예산 초과분 등)가 나오면 그 앞까지만 판단. 최소 ADAPTIVE_K_MIN 개
+def choose_k(scores: List[Optional[float]], k: int) -> int:
+    n = next((i for i, s in enumerate(scores) if s is None), len(scores))
+    if n == 0 or not scores[0] or scores[0] <= 0:
+        return min(k, len(scores))
+    k_min = min(settings.adaptive_k_min, k, n)
+    s = [x / scores[0] for x in scores[:n]]
+    if k < n and s[k - 1] >= settings.adaptive_flat:
+        cut = k
+        while cut < min(n, settings.adaptive_k_max) and s[cut] >= settings.adaptive_flat:
+            cut += 1
+        return cut
+    base = min(k, n)
+    for i in range(1, base):
+        if s[i] < s[i - 1] * (1 - settings.adaptive_gap):
+            return max(i, k_min)
+    total, acc = sum(s[:base]), 0.0
+    for i in range(base):
+        acc += s[i]
+        if i + 1 >= k_min and acc >= settings.adaptive_mass * total:
+            return i + 1
+    return base
+
+def _adapt(docs: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    if not settings.adaptive_k:
+        return docs[:k]
+    return docs[:choose_k([d.get("score") for d in docs], k)]
+
+# 병렬 검색용 스레드 풀(키워드 검색과 임베딩을 동시에 시작)
+_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="retrieve")
+
+# 풀 스레드에서도 요청별 단계 시간이 기록되도록 현재 context 를 복사해 실행
+def _submit(fn, *args):
+    return _pool.submit(contextvars.copy_context().run, fn, *args)
+
+def _keyword_search(r: Retriever, query: str, k: int) -> List[Dict[str, Any]]:
+    with stage("search_keyword"):
+        return searchGuard.call(lambda: r.keyword_search(query, k))
+
+# 임베딩(또는 벡터 검색)이 실패하면 키워드 검색 결과만으로 응답(DEGRADED_MODE)
+def _keyword_only(e: Exception) -> None:
+    if not settings.degraded_mode:
+        raise e
+    log.warning("vector leg unavailable, keyword-only search: %s", e)
+    degraded("keyword_only")
+
+# 검색 + 질의 벡터 반환. RETRIEVAL_MODE=parallel 이면 키워드 검색을 즉시 시작하고
+# 임베딩을 병렬로 진행, 임베딩이 EMBED_BUDGET_MS 안에 끝나면 벡터 검색 후 RRF 융합,
+# 넘기면 키워드 결과만 반환한다(qvec=None, 임베딩은 백그라운드에서 마저 끝나 캐시에 저장).
+# RERANK_MODE 를 켜면 후보를 RERANK_CANDIDATES 개 가져와 재순위 후 상위 k 개만 반환
+# 임베딩/벡터 검색이 실패하거나 브레이커가 열려 있으면(DEGRADED_MODE) 키워드 결과만 반환
+# 같은 (정규화 질의, k) 검색이 진행 중이면 그 결과를 함께 받음
+def retrieve(query: str, k: int = 8) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    docs, qvec = retrieveFlight.do((normalize_query(query), k), lambda: _retrieve_top(query, k))
+    observe_docs(len(docs))
+    return list(docs), qvec
+
+def _retrieve_top(query: str, k: int) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    top = _fetch_k(k)
+    n = rerank_candidates(top)
+    docs, qvec = _retrieve(query, n)
+    if n > top:
+        with stage("rerank"):
+            docs = rerank(query, docs, top)
+    return _adapt(docs, k), qvec
+
+def _retrieve(query: str, k: int) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    if settings.retrieval_mode != "parallel":
+        try:
+            qvec = embed_query(query)
+        except Exception as e:
+            _keyword_only(e)
+            return _keyword_search(get_retriever(), query, k), None
+        return search_hybrid(query, k=k, qvec=qvec), qvec
+
+    r = get_retriever()
+    kw = _submit(_keyword_search, r, query, k)
+    emb = _submit(embed_query, query)
+    try:
+        qvec = emb.result(timeout=settings.embed_budget_ms / 1000)
+    except FutureTimeout:
+        # 예산 초과(임베딩은 백그라운드에서 계속). 임베딩 자체의 DeadlineExceeded 도 TimeoutError 이므로
+        # 임베딩이 예외로 끝난 경우만 실패로 처리
+        if emb.done() and emb.exception() is not None:
+            _keyword_only(emb.exception())
+        return kw.result(), None
+    except Exception as e:
+        _keyword_only(e)
+        return kw.result(), None
+    try:
+        with stage("search_vector"):
+            vec = searchGuard.call(lambda: r.vector_search(qvec, k))
+    except Exception as e:
+        _keyword_only(e)
+        return kw.result(), None
+    return fuse_results([kw.result(), vec], k), qvec
+
+# 검색 + 질의 벡터 반환(비동기)
+async def aretrieve(query: str, k: int = 8) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    docs, qvec = await retrieveFlight.ado((normalize_query(query), k), lambda: _aretrieve_top(query, k))
+    observe_docs(len(docs))
+    return list(docs), qvec
+
+async def _aretrieve_top(query: str, k: int) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    top = _fetch_k(k)
+    n = rerank_candidates(top)
+    docs, qvec = await _aretrieve(query, n)
+    if n > top:
+        with stage("rerank"):
+            docs = await asyncio.to_thread(rerank, query, docs, top)  # 점수 계산(CPU)은 이벤트 루프 밖에서
+    return _adapt(docs, k), qvec
+
+async def _akeyword_search(r: Retriever, query: str, k: int) -> List[Dict[str, Any]]:
+    with stage("search_keyword"):
+        return await searchGuard.acall(lambda: r.akeyword_search(query, k))
+
+async def _aretrieve(query: str, k: int) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    if settings.retrieval_mode != "parallel":
+        try:
+            qvec = await aembed_query(query)
+        except Exception as e:
+            _keyword_only(e)
+            return await _akeyword_search(get_retriever(), query, k), None
+        return await asearch_hybrid(query, k=k, qvec=qvec), qvec
+
+    r = get_retriever()
+    kw = asyncio.ensure_future(_akeyword_search(r, query, k))
+    emb = asyncio.ensure_future(aembed_query(query))
+    try:
+        qvec = await asyncio.wait_for(asyncio.shield(emb), settings.embed_budget_ms / 1000)
+    except asyncio.TimeoutError:
+        if emb.done() and not emb.cancelled() and emb.exception() is not None:
+            _keyword_only(emb.exception())
+        return await kw, None
+    except Exception as e:
+        _keyword_only(e)
+        return await kw, None
+    try:
+        with stage("search_vector"):
+            vec = await searchGuard.acall(lambda: r.avector_search(qvec, k))
+    except Exception as e:
+        _keyword_only(e)
+        return await kw, None
+    return fuse_results([await kw, vec], k), qvec
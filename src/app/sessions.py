@@ -0,0 +1,160 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from .config import settings
+from .context import count_tokens
+
+# 서버 측 대화 세션 저장소: 세션 ID → 누적 요약 + 아직 요약되지 않은 메시지 목록(+ 메시지별 토큰 수)
+# 프로세스 내 LRU + sqlite 공유 계층(SESSION_DB=memory 면 메모리만). sqlite 를 쓰면 같은 호스트의 여러 워커가
+# 같은 세션을 이어받는다. WAL 은 로컬 디스크에서만 동작하므로 다른 호스트 인스턴스와는 공유하지 않는다.
+# 다른 인스턴스로 넘어간 턴은 409 unknown_session 으로 알리고, 클라이언트가 히스토리를 붙여 한 번 다시 보내면
+# 그 히스토리로 이 인스턴스의 세션을 채운다(seed).
+# 세션 레코드: {"messages": [{"id", "role", "content", "tokens"}], "seq": int,
+#             "summary": str, "summary_tokens": int, "version": int, "updated": float}
+
+def _new_session() -> Dict[str, Any]:
+    return {"messages": [], "seq": 0, "summary": "", "summary_tokens": 0, "version": 0, "updated": time.time()}
+
+class SessionStore:
+    def __init__(self, maxsize: int = 1000, ttl: float = 86400, path: str = "", max_messages: int = 40):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._mem: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path and path != "memory":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")  # 같은 호스트 여러 프로세스 동시 읽기/쓰기(로컬 디스크만)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT, version INTEGER, updated REAL)"
+            )
+
+    # sqlite 사용 여부(비동기 경로는 이때만 스레드에서 조회/저장)
+    @property
+    def persistent(self) -> bool:
+        return self._db is not None
+
+    def _expired(self, sess: Dict[str, Any]) -> bool:
+        return self.ttl > 0 and time.time() - sess["updated"] > self.ttl
+
+    def _put_mem(self, sid: str, sess: Dict[str, Any]) -> None:
+        self._mem[sid] = sess
+        self._mem.move_to_end(sid)
+        while len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
+
+    # sqlite 를 쓰면 버전이 같을 때만 메모리 사본 사용(다른 인스턴스가 갱신했으면 다시 읽음)
+    def _load(self, sid: str) -> Optional[Dict[str, Any]]:
+        mem = self._mem.get(sid)
+        if self._db is not None:
+            row = self._db.execute("SELECT version, data FROM sessions WHERE sid = ?", (sid,)).fetchone()
+            if row is None:
+                self._mem.pop(sid, None)
+                return None
+            if mem is None or mem["version"] != row[0]:
+                mem = {**_new_session(), **json.loads(row[1])}  # 이전 형식 레코드 호환
+        if mem is None or self._expired(mem):
+            return None
+        self._put_mem(sid, mem)
+        return mem
+
+    def _save(self, sid: str, sess: Dict[str, Any]) -> None:
+        sess["version"] += 1
+        sess["updated"] = time.time()
+        self._put_mem(sid, sess)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, version, updated) VALUES (?, ?, ?, ?)",
+                (sid, json.dumps(sess, ensure_ascii=False), sess["version"], sess["updated"]),
+            )
+
+    def get(self, sid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._load(sid)
+
+    # 프롬프트용 히스토리(role/content/tokens). 요약이 있으면 맨 앞에 role=summary 메시지로 포함
+    # 토큰 수는 저장 시 한 번만 계산
+    def history(self, sid: str) -> List[Dict[str, Any]]:
+        sess = self.get(sid)
+        if not sess:
+            return []
+        head = [{"role": "summary", "content": sess["summary"], "tokens": sess["summary_tokens"]}] if sess["summary"] else []
+        return head + list(sess["messages"])
+
+    # 읽기-수정-쓰기를 한 트랜잭션으로(sqlite 를 공유하는 다른 인스턴스와 직렬화)
+    def _update(self, sid: str, fn) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._db is not None:
+                self._db.execute("BEGIN IMMEDIATE")
+            try:
+                sess = fn(self._load(sid))
+                if sess is not None:
+                    self._save(sid, sess)
+            except Exception:
+                if self._db is not None:
+                    self._db.execute("ROLLBACK")
+                raise
+            if self._db is not None:
+                self._db.execute("COMMIT")
+            return sess
+
+    # 질문/답변 한 턴 추가. max_messages 를 넘는 오래된 메시지는 잘라냄
+    def append(self, sid: str, question: str, answer: str) -> Dict[str, Any]:
+        def add(sess):
+            sess = sess or _new_session()
+            for role, content in (("user", question), ("assistant", answer)):
+                sess["seq"] += 1
+                sess["messages"].append({"id": sess["seq"], "role": role, "content": content, "tokens": count_tokens(content)})
+            sess["messages"] = sess["messages"][-self.max_messages:]
+            return sess
+
+        return self._update(sid, add)
+
+    # 이 인스턴스에 없는 세션을 클라이언트가 보낸 히스토리로 채움(이미 있으면 그대로)
+    def seed(self, sid: str, history: List[Dict[str, Any]]) -> None:
+        def fill(sess):
+            if sess is not None:
+                return None
+            sess = _new_session()
+            for m in history:
+                sess["seq"] += 1
+                content = str(m.get("content") or "")
+                sess["messages"].append({"id": sess["seq"], "role": m.get("role"), "content": content, "tokens": count_tokens(content)})
+            sess["messages"] = sess["messages"][-self.max_messages:]
+            return sess
+
+        self._update(sid, fill)
+
+    # 요약 반영: upto_id 이하 메시지를 요약으로 대체(요약 중 추가된 메시지는 유지)
+    def apply_summary(self, sid: str, summary: str, upto_id: int) -> None:
+        def fold(sess):
+            if sess is None:
+                return None
+            sess["messages"] = [m for m in sess["messages"] if m.get("id", 0) > upto_id]
+            sess["summary"], sess["summary_tokens"] = summary, count_tokens(summary)
+            return sess
+
+        self._update(sid, fold)
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._mem.pop(sid, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._mem)}
+
+sessionStore = SessionStore(
+    maxsize=settings.session_store_size,
+    ttl=settings.session_ttl,
+    path=settings.session_db,
+    max_messages=settings.session_max_messages,
+)
@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+from .metrics import COALESCED, stage
+
+# 동시 요청 합치기(single-flight): 같은 키의 작업이 진행 중이면 새로 시작하지 않고 그 결과를 함께 받는다.
+# 공지 직후처럼 같은 질문이 몰릴 때 임베딩/검색/LLM 호출이 질문당 한 번으로 줄어든다.
+# - do/ado: 결과 한 번(스레드/asyncio)
+# - StreamFlight.stream/astream: 토큰 스트림을 생산자 하나가 만들고 모든 구독자가 처음부터 받음
+#   (구독자가 모두 떠나면 생산자를 멈추고 LLM 스트림을 닫음 - 아무도 읽지 않을 토큰은 생성하지 않음)
+# 기다린 쪽은 Server-Timing 에 coalesced 단계로 기록된다.
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Any, Future] = {}
+        self._tasks: Dict[Any, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+        if not leader:
+            COALESCED.inc(layer=self.name)
+            with stage("coalesced"):
+                return fut.result()
+        try:
+            result = fn()
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    # 작업은 별도 task 로 실행해 먼저 온 요청이 취소돼도 기다리는 요청은 결과를 받음
+    async def ado(self, key: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        key = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            return await asyncio.shield(task)
+        COALESCED.inc(layer=self.name)
+        with stage("coalesced"):
+            return await asyncio.shield(task)
+
+# 진행 중인 스트림: 지금까지의 청크 + 완료/오류 상태 + 구독자 수(0 이 되면 cancelled)
+# (비동기 생산자 task 도 보관: 이벤트 루프는 task 를 약한 참조로만 들고 있어 기다리는 쪽이 있어도 GC 될 수 있음)
+class _Stream:
+    def __init__(self, cond):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.cond = cond
+        self.followers = 0
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+
+class StreamFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Any, _Stream] = {}
+        self._lock = threading.Lock()
+
+    # 생산자는 별도 스레드에서 실행(첫 클라이언트가 끊겨도 나머지는 계속 받고, 모두 끊기면 다음 청크에서 멈춤)
+    # 구독자는 합류 시점에 lock 안에서 세어, 마지막 구독자가 떠나는 것과 새 구독자 합류가 엇갈리지 않게 함
+    def stream(self, key: Any, gen_fn: Callable[[], Iterator[str]]) -> Iterator[str]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Stream(threading.Condition())
+                ctx = contextvars.copy_context()
+                threading.Thread(
+                    target=ctx.run, args=(self._produce, key, call, gen_fn), daemon=True, name="stream-flight"
+                ).start()
+            else:
+                COALESCED.inc(layer=self.name)
+            call.followers += 1
+        return self._follow(key, call)
+
+    def _produce(self, key: Any, call: _Stream, gen_fn: Callable[[], Iterator[str]]) -> None:
+        gen = None
+        try:
+            gen = gen_fn()
+            for chunk in gen:
+                if call.cancelled:
+                    break
+                with call.cond:
+                    call.chunks.append(chunk)
+                    call.cond.notify_all()
+        except Exception as e:
+            call.error = e
+        finally:
+            if gen is not None:
+                gen.close()
+            with self._lock:
+                self._release(key, call)
+            with call.cond:
+                call.done = True
+                call.cond.notify_all()
+
+    def _follow(self, key: Any, call: _Stream) -> Iterator[str]:
+        i = 0
+        try:
+            while True:
+                with call.cond:
+                    call.cond.wait_for(lambda: len(call.chunks) > i or call.done)
+                    new, done = call.chunks[i:], call.done
+                i += len(new)
+                yield from new
+                if done:
+                    if call.error is not None:
+                        raise call.error
+                    return
+        finally:
+            with self._lock:
+                call.followers -= 1
+                if call.followers == 0 and not call.done:
+                    call.cancelled = True
+                    self._release(key, call)
+
+    # 진행 중 목록에서 제거(취소 후 같은 키로 새 스트림이 시작됐으면 그대로 둠)
+    def _release(self, key: Any, call: _Stream) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def astream(self, key: Any, gen_fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        key = (id(asyncio.get_running_loop()), key)
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = _Stream(asyncio.Condition())
+            call.task = asyncio.ensure_future(self._aproduce(key, call, gen_fn))
+        else:
+            COALESCED.inc(layer=self.name)
+        call.followers += 1
+        i = 0
+        try:
+            while True:
+                async with call.cond:
+                    await call.cond.wait_for(lambda: len(call.chunks) > i or call.done)
+                    new, done = call.chunks[i:], call.done
+                i += len(new)
+                for chunk in new:
+                    yield chunk
+                if done:
+                    if call.error is not None:
+                        raise call.error
+                    return
+        finally:
+            # 마지막 구독자가 떠나면 생산자 task 취소(LLM 스트림도 함께 닫힘)
+            call.followers -= 1
+            if call.followers == 0 and not call.done:
+                call.cancelled = True
+                self._release(key, call)
+                call.task.cancel()
+
+    async def _aproduce(self, key: Any, call: _Stream, gen_fn: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async for chunk in gen_fn():
+                async with call.cond:
+                    call.chunks.append(chunk)
+                    call.cond.notify_all()
+        except Exception as e:
+            call.error = e
+        finally:
+            self._release(key, call)
+            async with call.cond:
+                call.done = True
+                call.cond.notify_all()
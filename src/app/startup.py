@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from .config import settings
+
+# 기동 준비 상태(readiness): 무거운 SDK import 와 첫 연결(TLS/HTTP2), 프롬프트·토크나이저 로드를
+# 첫 사용자 요청이 아니라 기동 직후 백그라운드에서 끝내고, 끝나면 /ready 가 200 을 반환한다.
+# - /health 는 프로세스 생존 여부(liveness)만, /ready 는 예열 완료 여부(readiness)
+# - 기동 시간(모듈 import 시작 → 예열 완료)이 STARTUP_BUDGET_MS 를 넘으면 경고 로그
+# - import 시간 분석: python -m src.app.startup importtime [--module src.app.asgi]
+# 이 모듈은 앱 모듈보다 먼저 import 되도록 config 와 표준 라이브러리만 가져온다.
+
+log = logging.getLogger(__name__)
+
+_T0 = time.perf_counter()
+_WARM_QUERY = "warm-up"
+_RETRY_SECONDS = 2.0
+_RETRY_MAX_SECONDS = 30.0
+
+# 동기 예열 단계(이름 → 함수). 모두 성공해야 준비 완료
+def _warm_clients() -> None:
+    from .clients import get_aux_llm, get_embeddings, get_llm
+    from .retriever import get_retriever
+
+    get_llm()
+    get_aux_llm()
+    get_embeddings()
+    get_retriever()
+
+def _warm_prompts() -> None:
+    from .context import count_tokens
+    from .rag_chain import load_prompt
+
+    for name in ("system_ko.md", "summary_ko.md", "condense_ko.md"):
+        load_prompt(name)
+    count_tokens(_WARM_QUERY)
+
+def _warm_embed() -> None:
+    from .embed_service import get_embed_service
+
+    get_embed_service().embed(_WARM_QUERY)
+
+def _warm_search() -> None:
+    from .retriever import get_retriever
+
+    get_retriever().keyword_search(_WARM_QUERY, k=1)
+
+# 채팅 배포 호스트와 커넥션만 맺어 둠(토큰 소모 없음, 응답 상태는 보지 않음)
+def _warm_llm() -> None:
+    from .clients import http_client
+
+    http_client().get(settings.aoai_endpoint)
+
+async def _awarm_llm() -> None:
+    from .clients import async_http_client
+
+    await async_http_client().get(settings.aoai_endpoint)
+
+async def _awarm_search() -> None:
+    from .retriever import get_retriever
+
+    await get_retriever().akeyword_search(_WARM_QUERY, k=1)
+
+SYNC_STEPS: Dict[str, Callable[[], None]] = {
+    "clients": _warm_clients,
+    "prompts": _warm_prompts,
+    "embed": _warm_embed,
+    "search": _warm_search,
+    "llm": _warm_llm,
+}
+# ASGI 는 요청 경로가 비동기 클라이언트를 쓰므로 그쪽 커넥션도 예열
+ASYNC_STEPS: Dict[str, Callable[[], Any]] = {
+    "llm_async": _awarm_llm,
+    "search_async": _awarm_search,
+}
+
+class Readiness:
+    def __init__(self, budget_ms: float = 10000):
+        self.budget_ms = budget_ms
+        self.t0 = _T0
+        self.import_ms: Optional[float] = None
+        self.ready_ms: Optional[float] = None
+        self.attempts = 0
+        self.checks: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_ms is not None
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.t0) * 1000, 1)
+
+    # 앱 모듈 import 가 끝난 시점 기록
+    def mark_imported(self) -> None:
+        if self.import_ms is None:
+            self.import_ms = self._elapsed_ms()
+
+    def _record(self, name: str, t0: float, error: BaseException | None) -> bool:
+        check: Dict[str, Any] = {"ok": error is None, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+        if error is not None:
+            check["error"] = f"{type(error).__name__}: {error}"[:200]
+        self.checks[name] = check
+        return error is None
+
+    def _run(self, steps: Dict[str, Callable[[], None]]) -> bool:
+        ok = True
+        for name, fn in steps.items():
+            t0 = time.perf_counter()
+            try:
+                fn()
+                ok = self._record(name, t0, None) and ok
+            except Exception as e:
+                ok = self._record(name, t0, e) and False
+        return ok
+
+    async def _arun(self, steps: Dict[str, Callable[[], Any]]) -> bool:
+        ok = True
+        for name, fn in steps.items():
+            t0 = time.perf_counter()
+            try:
+                await fn()
+                ok = self._record(name, t0, None) and ok
+            except Exception as e:
+                ok = self._record(name, t0, e) and False
+        return ok
+
+    def _done(self, ok: bool) -> bool:
+        self.attempts += 1
+        if not ok:
+            failed = [n for n, c in self.checks.items() if not c["ok"]]
+            log.warning("warm-up attempt %d failed: %s", self.attempts, ", ".join(failed))
+            return False
+        self.ready_ms = self._elapsed_ms()
+        log.info("ready in %.0f ms (import %.0f ms)", self.ready_ms, self.import_ms or 0)
+        if self.ready_ms > self.budget_ms:
+            log.warning("startup took %.0f ms, over budget %.0f ms", self.ready_ms, self.budget_ms)
+        return True
+
+    def warm(self) -> bool:
+        self.checks = {}
+        return self._done(self._run(SYNC_STEPS))
+
+    async def awarm(self) -> bool:
+        self.checks = {}
+        ok = await asyncio.to_thread(self._run, SYNC_STEPS)
+        return self._done(await self._arun(ASYNC_STEPS) and ok)
+
+    # 백그라운드 예열(실패하면 지수 백오프로 재시도, 기동은 막지 않음)
+    def start(self) -> None:
+        if not settings.startup_warmup:
+            self._done(True)
+            return
+
+        def loop():
+            delay = _RETRY_SECONDS
+            while not self.warm():
+                time.sleep(delay)
+                delay = min(delay * 2, _RETRY_MAX_SECONDS)
+
+        threading.Thread(target=loop, daemon=True, name="warm-up").start()
+
+    def astart(self) -> None:
+        if not settings.startup_warmup:
+            self._done(True)
+            return
+
+        async def loop():
+            delay = _RETRY_SECONDS
+            while not await self.awarm():
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _RETRY_MAX_SECONDS)
+
+        self._task = asyncio.ensure_future(loop())
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "warming",
+            "import_ms": self.import_ms,
+            "ready_ms": self.ready_ms,
+            "uptime_ms": self._elapsed_ms(),
+            "budget_ms": self.budget_ms,
+            "over_budget": (self.ready_ms or self._elapsed_ms()) > self.budget_ms,
+            "attempts": self.attempts,
+            "checks": self.checks,
+        }
+
+readiness = Readiness(budget_ms=settings.startup_budget_ms)
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+# python -X importtime 출력(self/cumulative μs)을 모듈별로 파싱(예열 스레드는 끄고 import 만 측정)
+def import_times(module: str) -> List[Dict[str, Any]]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env={**os.environ, "STARTUP_WARMUP": "false"},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m:
+            rows.append({
+                "module": m.group(3),
+                "self_ms": int(m.group(1)) / 1000,
+                "cumulative_ms": int(m.group(2)) / 1000,
+            })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="startup profiling / warm-up")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    it = sub.add_parser("importtime", help="앱 모듈 import 시간 상위 모듈 출력")
+    it.add_argument("--module", default="src.app.main")
+    it.add_argument("--top", type=int, default=20)
+    sub.add_parser("warm", help="예열 단계를 한 번 실행하고 단계별 시간 출력")
+    args = parser.parse_args()
+
+    if args.cmd == "importtime":
+        rows = import_times(args.module)
+        total = next((r["cumulative_ms"] for r in rows if r["module"] == args.module), 0.0)
+        print(f"{args.module}: {total:.0f} ms (budget {settings.startup_budget_ms:.0f} ms incl. warm-up)")
+        # 최상위 패키지별 self 시간 합(어떤 의존성이 기동을 느리게 하는지)
+        packages: Dict[str, float] = {}
+        for r in rows:
+            root = r["module"].split(".")[0]
+            packages[root] = packages.get(root, 0.0) + r["self_ms"]
+        for root, ms in sorted(packages.items(), key=lambda x: -x[1])[:args.top]:
+            print(f"{ms:>8.1f} ms  {root}")
+    else:
+        readiness.warm()
+        print(json.dumps(readiness.status(), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+from langchain_core.messages import HumanMessage, SystemMessage
+from .config import settings
+from .clients import get_aux_llm
+from .metrics import stage
+from .rag_chain import load_prompt
+from .sessions import SessionStore, sessionStore
+
+# 대화 누적 요약: 세션의 요약되지 않은 히스토리가 SUMMARY_TRIGGER_TOKENS 를 넘으면
+# 마지막 턴을 뺀 나머지를 이전 요약과 합쳐 새 요약으로 접는다(요청 경로 밖 백그라운드 스레드).
+# 이후 프롬프트에는 요약 + 최근 턴만 들어가 대화가 길어져도 프롬프트 크기가 일정하다.
+
+log = logging.getLogger(__name__)
+
+_KEEP = 2  # 요약하지 않고 남길 최근 메시지 수(질문 + 답변 한 턴)
+
+# 요약할 메시지(마지막 턴 제외)의 토큰 합
+def pending_tokens(sess: Dict[str, Any]) -> int:
+    return sum(m["tokens"] for m in sess["messages"][:-_KEEP])
+
+def summarize(summary: str, messages: List[Dict[str, Any]]) -> str:
+    lines = [f"[{'사용자' if m['role'] == 'user' else '도우미'}] {m['content']}" for m in messages]
+    body = f"이전 요약:\n{summary or '(없음)'}\n\n새 대화:\n" + "\n\n".join(lines)
+    llm = get_aux_llm().bind(max_tokens=settings.summary_max_tokens)
+    with stage("summarize"):
+        return llm.invoke([SystemMessage(content=load_prompt("summary_ko.md")), HumanMessage(content=body)]).content.strip()
+
+class Summarizer:
+    def __init__(self, store: SessionStore, trigger_tokens: int, workers: int = 2):
+        self.store = store
+        self.trigger_tokens = trigger_tokens
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summarize")
+        self._running: set = set()
+        self._lock = threading.Lock()
+
+    # 턴 저장 직후 호출: 임계값을 넘었고 같은 세션 요약이 진행 중이 아니면 예약
+    def maybe_schedule(self, sid: str, sess: Dict[str, Any]) -> bool:
+        if self.trigger_tokens <= 0 or pending_tokens(sess) < self.trigger_tokens:
+            return False
+        with self._lock:
+            if sid in self._running:
+                return False
+            self._running.add(sid)
+        self._pool.submit(self._run, sid)
+        return True
+
+    def _run(self, sid: str) -> None:
+        try:
+            sess = self.store.get(sid)
+            if not sess or len(sess["messages"]) <= _KEEP:
+                return
+            folded = sess["messages"][:-_KEEP]
+            summary = summarize(sess["summary"], folded)
+            if summary:
+                self.store.apply_summary(sid, summary, folded[-1]["id"])
+        except Exception:
+            # 실패해도 히스토리는 HISTORY_MAX_TOKENS 로 잘리므로 다음 턴에 다시 시도
+            log.exception("summarize failed for session %s", sid)
+        finally:
+            with self._lock:
+                self._running.discard(sid)
+
+summarizer = Summarizer(sessionStore, settings.summary_trigger_tokens)
@@ -0,0 +1,90 @@
+import argparse
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_openai import AzureOpenAIEmbeddings
+from src.app.config import settings
+from src.app.clients import http_client
+
+# 요청마다 클라이언트를 새로 만드는 경우 vs 공용 풀 클라이언트 재사용 시 요청당 지연 비교
+# 실행: python -m src.bench.client_reuse --n 50            (로컬 스텁 서버, 오프라인)
+#       python -m src.bench.client_reuse --target azure    (.env 의 실제 Azure OpenAI 엔드포인트)
+
+# 로컬 스텁: Azure OpenAI embeddings 응답 형식만 흉내
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 65536  # 헤더와 본문을 한 번에 전송(Nagle 지연 방지)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = json.dumps({
+            "object": "list",
+            "data": [{"object": "embedding", "index": 0, "embedding": [0.0] * 8}],
+            "model": "stub",
+            "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def _start_stub() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+# 토큰 길이 검사(tiktoken 인코딩 다운로드)는 두 경우 모두 끄고 커넥션 비용만 비교
+def _embeddings(**kwargs) -> AzureOpenAIEmbeddings:
+    return AzureOpenAIEmbeddings(
+        azure_endpoint=settings.aoai_endpoint,
+        api_key=settings.aoai_key,
+        azure_deployment=settings.aoai_embed,
+        api_version=settings.aoai_api_version,
+        check_embedding_ctx_length=False,
+        **kwargs,
+    )
+
+def _measure(make, n: int) -> dict:
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        make().embed_query("splice_info_section")
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="client reuse benchmark")
+    parser.add_argument("--n", type=int, default=50)
+    parser.add_argument("--target", choices=["local", "azure"], default="local")
+    args = parser.parse_args()
+
+    if args.target == "local":
+        settings.aoai_endpoint = _start_stub()
+        settings.aoai_key = settings.aoai_key or "stub"
+
+    # 공용 풀(http_client)을 쓰는 클라이언트 1개를 재사용
+    shared_client = _embeddings(http_client=http_client())
+    shared_client.embed_query("warmup")
+    fresh = _measure(_embeddings, args.n)
+    shared = _measure(lambda: shared_client, args.n)
+    print(json.dumps({
+        "target": args.target,
+        "n": args.n,
+        "fresh_client": fresh,
+        "shared_client": shared,
+        "saved_p50_ms": round(fresh["p50_ms"] - shared["p50_ms"], 3),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+# Azure OpenAI(chat/embeddings)와 Azure AI Search 를 흉내 내는 결정적 로컬 스텁 서버
+# - 같은 입력이면 항상 같은 벡터/검색 결과/답변을 반환
+# - 지연은 프로파일(고정값) 또는 기록된 트레이스(질문별 단계 시간)로 재현
+
+@dataclass
+class FakeProfile:
+    embed_ms: float = 30            # 임베딩 호출 지연
+    search_ms: float = 40           # 검색 호출 지연
+    ttft_ms: float = 300            # 첫 토큰까지 지연
+    tokens_per_sec: float = 80      # 생성 속도
+    completion_tokens: int = 120    # 답변 토큰 수
+    dim: int = 1536                 # 임베딩 차원
+    corpus_size: int = 200          # 검색 대상 청크 수
+    chunk_chars: int = 1500         # 청크 길이
+    jitter: float = 0.0             # 지연 변동 비율(입력 해시로 결정, 0.2 = ±20%)
+    trace: Dict[str, Dict[str, float]] = field(default_factory=dict)  # 질문 → 단계별 ms(재생용)
+
+def _h(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _key(text: str) -> str:
+    return " ".join((text or "").split()).lower()
+
+class FakeAzure:
+    def __init__(self, profile: FakeProfile | None = None):
+        self.profile = profile or FakeProfile()
+        self.calls: Dict[str, int] = {"embeddings": 0, "chat": 0, "search": 0}
+        self._lock = threading.Lock()
+        words = ["splice_insert", "time_signal", "segmentation_descriptor", "PTS", "avail", "광고", "삽입",
+                 "셋톱박스", "채널", "전환", "지연", "버퍼", "디코더", "스트림", "큐", "메시지"]
+        self.corpus = []
+        for i in range(self.profile.corpus_size):
+            rng = np.random.default_rng(i)
+            text = f"[문서 {i}] "
+            while len(text) < self.profile.chunk_chars:
+                text += " ".join(rng.choice(words, 12)) + ". "
+            self.corpus.append({"chunk": text[:self.profile.chunk_chars], "source": f"doc{i % 20}.pdf#page={i}", "path": f"docs/doc{i % 20}.pdf"})
+
+    # 기록된 단계 시간 우선, 없으면 프로파일 값(+ 결정적 jitter)
+    def _delay(self, stage: str, text: str, default_ms: float) -> float:
+        rec = self.profile.trace.get(_key(text))
+        ms = rec.get(stage, default_ms) if rec else default_ms
+        if self.profile.jitter:
+            ms *= 1 + self.profile.jitter * ((_h(stage + text) % 2001) / 1000 - 1)
+        return max(ms, 0) / 1000
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.calls[kind] += 1
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        out = []
+        for t in texts:
+            v = np.random.default_rng(_h(t)).standard_normal(self.profile.dim).astype(np.float32)
+            out.append((v / np.linalg.norm(v)).round(6).tolist())
+        return out
+
+    def search(self, text: Optional[str], top: int) -> List[Dict[str, Any]]:
+        seed = text if text else "vector"
+        order = sorted(range(len(self.corpus)), key=lambda i: _h(f"{seed}:{i}"))[:top]
+        return [{"@search.score": 1.0 / (r + 1), **self.corpus[i]} for r, i in enumerate(order)]
+
+    def answer_tokens(self, question: str) -> List[str]:
+        n = self.profile.completion_tokens
+        return [f"답변{_h(question + str(i)) % 1000} " for i in range(n)]
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        fake = self
+
+        class Handler(_Handler):
+            pass
+
+        Handler.fake = fake
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="fake-azure").start()
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+# 요청 본문의 마지막 사용자 메시지에서 질문 추출("질문: ...\n\n참고 자료:" 형식)
+def _question(messages: List[Dict[str, Any]]) -> str:
+    for m in reversed(messages):
+        if m.get("role") == "user":
+            content = m.get("content") or ""
+            if isinstance(content, list):
+                content = " ".join(p.get("text", "") for p in content if isinstance(p, dict))
+            if content.startswith("질문: "):
+                return content[len("질문: "):].split("\n\n참고 자료:", 1)[0]
+            return content
+    return ""
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 65536  # 헤더와 본문을 한 번에 전송(Nagle 지연 방지)
+    fake: FakeAzure
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if "/embeddings" in self.path:
+            self._embeddings(body)
+        elif "/chat/completions" in self.path:
+            self._chat(body)
+        elif "/docs/search" in self.path:
+            self._search(body)
+        else:
+            self._json(404, {"error": {"code": "NotFound", "message": self.path}})
+
+    def _embeddings(self, body):
+        f = self.fake
+        f._count("embeddings")
+        texts = body.get("input")
+        texts = [texts] if isinstance(texts, str) else [t if isinstance(t, str) else json.dumps(t) for t in texts]
+        time.sleep(f._delay("embed", texts[0], f.profile.embed_ms))
+        data = [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(f.embed(texts))]
+        tokens = sum(len(t) // 4 + 1 for t in texts)
+        self._json(200, {"object": "list", "data": data, "model": "fake",
+                         "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _search(self, body):
+        f = self.fake
+        f._count("search")
+        text = body.get("search")
+        time.sleep(f._delay("search", text or "", f.profile.search_ms))
+        self._json(200, {"value": f.search(text, int(body.get("top") or 5))})
+
+    def _chat(self, body):
+        f = self.fake
+        f._count("chat")
+        q = _question(body.get("messages") or [])
+        tokens = f.answer_tokens(q)
+        prompt_tokens = sum(len(json.dumps(m, ensure_ascii=False)) // 4 for m in body.get("messages") or [])
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        ttft = f._delay("llm_ttft", q, f.profile.ttft_ms)
+        total = f._delay("llm", q, f.profile.ttft_ms + 1000 * len(tokens) / f.profile.tokens_per_sec)
+        per_token = max(total - ttft, 0) / max(len(tokens), 1)
+        base = {"id": "chatcmpl-fake", "created": 0, "model": "fake"}
+
+        if not body.get("stream"):
+            time.sleep(total)
+            self._json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "".join(tokens)}}]})
+            return
+
+        # SSE(chunked) 스트리밍: 첫 토큰까지 ttft, 이후 토큰 간격은 남은 시간을 균등 분배
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(ttft)
+        for i, tok in enumerate(tokens):
+            if i:
+                time.sleep(per_token)
+            self._chunk({**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "finish_reason": None, "delta": {"role": "assistant", "content": tok}}]})
+        self._chunk({**base, "object": "chat.completion.chunk", "choices": [
+            {"index": 0, "finish_reason": "stop", "delta": {}}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._chunk({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _chunk(self, obj) -> None:
+        self._write_chunk(f"data: {json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _json(self, status: int, obj) -> None:
+        data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,310 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+import httpx
+from src.app.config import settings
+from src.bench.fakes import FakeAzure, FakeProfile
+
+# /ask 부하 테스트: 동시성 N 으로 요청을 보내 처리량, 전체/단계별(Server-Timing) p50/p95/p99, 메모리를 JSON 으로 출력
+# 실행:
+#   python -m src.bench.load --concurrency 8 --requests 200 --out bench.json        (로컬 가짜 Azure + 인프로세스 서버)
+#   python -m src.bench.load --server asgi --llm-ttft-ms 500 --tokens-per-sec 40
+#   python -m src.bench.load --url http://localhost:8000 --record trace.jsonl       (실서버 측정 + 트레이스 기록)
+#   python -m src.bench.load --replay trace.jsonl                                    (기록된 질문/단계 지연을 가짜 Azure 로 재생)
+#   python -m src.bench.load compare base.json bench.json --threshold 0.1           (커밋 간 회귀 비교)
+
+DEFAULT_QUESTIONS = [
+    "splice_insert 의 out_of_network_indicator 는 무슨 의미야?",
+    "time_signal 과 segmentation_descriptor 관계 설명해줘",
+    "광고 삽입 시 PTS 조정은 어떻게 해?",
+    "avail_num 과 avails_expected 차이",
+    "채널 전환 지연을 줄이는 방법",
+    "SCTE-35 메시지에서 break_duration 해석",
+    "셋톱박스 디코더 버퍼 설정",
+    "segmentation_type_id 목록 알려줘",
+]
+
+def _pct(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return round(s[min(len(s) - 1, int(len(s) * p))], 3)
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50": _pct(samples, 0.50),
+        "p95": _pct(samples, 0.95),
+        "p99": _pct(samples, 0.99),
+        "mean": round(sum(samples) / len(samples), 3) if samples else 0.0,
+        "max": round(max(samples), 3) if samples else 0.0,
+    }
+
+# "embed;dur=12.3, search;dur=40.1" → {"embed": 12.3, "search": 40.1}
+def parse_server_timing(value: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in (value or "").split(","):
+        name, _, rest = part.strip().partition(";")
+        for attr in rest.split(";"):
+            k, _, v = attr.strip().partition("=")
+            if k == "dur" and name:
+                out[name] = float(v)
+    return out
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except OSError:
+        return 0.0
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def load_questions(path: Optional[str]) -> List[Dict[str, Any]]:
+    if not path:
+        return [{"question": q} for q in DEFAULT_QUESTIONS]
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return [{"question": line.strip()} for line in f if line.strip()]
+
+# 가짜 Azure 에 연결한 API 서버를 현재 프로세스 안에서 실행(메모리 측정이 서버 포함)
+def start_inproc(server: str) -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    if server == "asgi":
+        import uvicorn
+        from src.app.asgi import app
+
+        srv = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=srv.run, daemon=True, name="bench-asgi").start()
+        while not srv.started:
+            time.sleep(0.01)
+    else:
+        from werkzeug.serving import make_server
+        from src.app.main import app
+
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)  # 요청별 접근 로그 끄기
+        srv = make_server("127.0.0.1", port, app, threaded=True)
+        threading.Thread(target=srv.serve_forever, daemon=True, name="bench-flask").start()
+    return f"http://127.0.0.1:{port}"
+
+# /ready 가 200 이 될 때까지 대기(SDK import·예열 시간이 측정에 섞이지 않도록), 기다린 시간(ms) 반환
+# /ready 가 없는 서버(404)는 준비된 것으로 본다
+def wait_ready(url: str, timeout: float = 60.0) -> float:
+    t0 = time.perf_counter()
+    with httpx.Client(timeout=5) as client:
+        while True:
+            try:
+                status = client.get(url.rstrip("/") + "/ready").status_code
+            except httpx.HTTPError:
+                status = 0
+            if status in (200, 404):
+                return round((time.perf_counter() - t0) * 1000, 1)
+            if time.perf_counter() - t0 > timeout:
+                raise SystemExit(f"{url} not ready after {timeout:.0f}s (last /ready status {status})")
+            time.sleep(0.1)
+
+def run_load(
+    url: str,
+    items: List[Dict[str, Any]],
+    concurrency: int,
+    total: int,
+    no_cache: bool = True,
+    paced: bool = False,
+    record: Optional[str] = None,
+) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+    source: Iterator = iter(items) if paced else itertools.islice(itertools.cycle(items), total)
+    client = httpx.Client(
+        timeout=120,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    )
+    t_start = time.perf_counter()
+
+    def one(item: Dict[str, Any]) -> None:
+        # 재생 모드: 기록된 도착 시각(t, 초)에 맞춰 전송(open-loop)
+        if paced and "t" in item:
+            delay = item["t"] - (time.perf_counter() - t_start)
+            if delay > 0:
+                time.sleep(delay)
+        payload = {"question": item["question"], "k": item.get("k", 5), "history": item.get("history", [])}
+        if no_cache:
+            payload["no_cache"] = True
+        t0 = time.perf_counter()
+        try:
+            r = client.post(url.rstrip("/") + "/ask", json=payload)
+            status, timing = r.status_code, parse_server_timing(r.headers.get("server-timing", ""))
+        except httpx.HTTPError as e:
+            status, timing = 0, {"error": str(e)}
+        rec = {
+            "t": round(t0 - t_start, 4),
+            "question": item["question"],
+            "k": payload["k"],
+            "status": status,
+            "total_ms": round((time.perf_counter() - t0) * 1000, 3),
+            "stages": {k: v for k, v in timing.items() if k != "total"},
+        }
+        with lock:
+            results.append(rec)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, source))
+    elapsed = time.perf_counter() - t_start
+    client.close()
+
+    if record:
+        with open(record, "w", encoding="utf-8") as f:
+            for rec in sorted(results, key=lambda r: r["t"]):
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    ok = [r for r in results if r["status"] == 200]
+    stages: Dict[str, List[float]] = {}
+    for r in ok:
+        for name, ms in r["stages"].items():
+            if isinstance(ms, float):
+                stages.setdefault(name, []).append(ms)
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": _summary([r["total_ms"] for r in ok]),
+        "stages_ms": {name: _summary(v) for name, v in sorted(stages.items())},
+    }
+
+# 두 결과 비교: 지연(p50/p95/p99, 단계별 p95)은 증가, 처리량은 감소가 threshold 비율을 넘으면 회귀
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float) -> Dict[str, Any]:
+    rows, regressions = [], []
+
+    def check(name: str, a: float, b: float, higher_is_worse: bool = True) -> None:
+        if not a:
+            return
+        delta = (b - a) / a
+        rows.append({"metric": name, "base": a, "new": b, "delta": round(delta, 4)})
+        if (delta if higher_is_worse else -delta) > threshold:
+            regressions.append(name)
+
+    for p in ("p50", "p95", "p99"):
+        check(f"latency_ms.{p}", base["latency_ms"][p], new["latency_ms"][p])
+    for stage, s in base.get("stages_ms", {}).items():
+        if stage in new.get("stages_ms", {}):
+            check(f"stages_ms.{stage}.p95", s["p95"], new["stages_ms"][stage]["p95"])
+    check("throughput_rps", base["throughput_rps"], new["throughput_rps"], higher_is_worse=False)
+    if base.get("memory_mb", {}).get("peak") and new.get("memory_mb", {}).get("peak"):
+        check("memory_mb.peak", base["memory_mb"]["peak"], new["memory_mb"]["peak"])
+    return {"base": base["meta"].get("commit"), "new": new["meta"].get("commit"),
+            "threshold": threshold, "rows": rows, "regressions": regressions}
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(description="compare two benchmark results")
+        parser.add_argument("cmd")
+        parser.add_argument("base")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, default=0.1)
+        args = parser.parse_args()
+        with open(args.base) as f, open(args.new) as g:
+            report = compare(json.load(f), json.load(g), args.threshold)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        sys.exit(1 if report["regressions"] else 0)
+
+    parser = argparse.ArgumentParser(description="/ask load test")
+    parser.add_argument("--url", default=None, help="대상 서버(생략 시 가짜 Azure + 인프로세스 서버)")
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--questions", default=None, help="질문 파일(.txt 한 줄 하나 또는 .jsonl)")
+    parser.add_argument("--replay", default=None, help="--record 로 기록한 트레이스(.jsonl) 재생")
+    parser.add_argument("--paced", action="store_true", help="재생 시 기록된 도착 시각 유지")
+    parser.add_argument("--record", default=None, help="요청별 결과/단계 시간을 .jsonl 로 기록")
+    parser.add_argument("--cache", action="store_true", help="답변 캐시 사용(기본은 no_cache)")
+    parser.add_argument("--ready-timeout", type=float, default=60, help="측정 전 /ready 200 대기 한도(초)")
+    parser.add_argument("--warmup", type=int, default=None, help="측정 전에 보내고 버릴 요청 수(기본: 동시성 수)")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--embed-ms", type=float, default=30)
+    parser.add_argument("--search-ms", type=float, default=40)
+    parser.add_argument("--llm-ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-sec", type=float, default=80)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+
+    items = load_questions(args.replay or args.questions)
+    profile = FakeProfile(
+        embed_ms=args.embed_ms,
+        search_ms=args.search_ms,
+        ttft_ms=args.llm_ttft_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        completion_tokens=args.completion_tokens,
+        jitter=args.jitter,
+    )
+    if args.replay:
+        # 질문별 기록된 단계 시간으로 가짜 Azure 지연 재현(캐시 적중 전인 첫 기록 사용)
+        for i in items:
+            profile.trace.setdefault(" ".join(i["question"].split()).lower(), i.get("stages", {}))
+
+    fake = None
+    rss_start = _rss_mb()
+    if args.url:
+        url = args.url
+    else:
+        fake = FakeAzure(profile)
+        endpoint = fake.start()
+        settings.aoai_endpoint = settings.search_endpoint = endpoint
+        settings.aoai_key = settings.search_key = "fake"
+        settings.embedder, settings.retriever_backend = "azure", "azure"
+        url = start_inproc(args.server)
+
+    # 기동(예열) 완료 후, 버리는 예열 요청으로 커넥션·지연 창을 채운 다음 측정
+    ready_ms = wait_ready(url, args.ready_timeout)
+    warmup = args.concurrency if args.warmup is None else args.warmup
+    if warmup > 0:
+        run_load(url, items, args.concurrency, warmup, not args.cache)
+    calls_before = dict(fake.calls) if fake else None
+
+    total = len(items) if args.replay else args.requests
+    result = run_load(url, items, args.concurrency, total, not args.cache, args.paced and bool(args.replay), args.record)
+    result["meta"] = {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "target": args.url or f"inproc-{args.server}",
+        "concurrency": args.concurrency,
+        "replay": args.replay,
+        "retrieval_mode": settings.retrieval_mode,
+        "fake": None if args.url else {k: v for k, v in vars(profile).items() if k != "trace"},
+        "fake_calls": {k: v - calls_before.get(k, 0) for k, v in fake.calls.items()} if fake else None,
+        "ready_wait_ms": ready_ms,
+        "warmup_requests": warmup,
+    }
+    if not args.url:
+        # 인프로세스 모드에서만 서버 메모리 측정 가능(ru_maxrss 는 Linux 에서 KB)
+        result["memory_mb"] = {
+            "rss_start": rss_start,
+            "rss_end": _rss_mb(),
+            "peak": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
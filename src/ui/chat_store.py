@@ -0,0 +1,177 @@
+import datetime as dt
+import json
+import os
+import tempfile
+import uuid
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, List, Optional, Tuple
+
+# UI 대화 세션 저장소(Streamlit/Gradio 공용). 세션이 길어지거나 많아져도 한 턴의 비용이 일정하도록
+# - 세션 목록: 최신순 인덱스(OrderedDict) + 라벨 캐시(세션 추가/삭제/제목 변경 때만 다시 만듦)
+# - 메시지 렌더: 메시지별로 렌더된 markdown 을 한 번만 계산해 메시지에 저장
+# - 화면에는 최근 UI_PAGE_SIZE 개만, "이전 메시지 더 보기" 로 한 페이지씩 늘림
+# - 메시지를 메모리에 두는 세션은 UI_MAX_LIVE_SESSIONS 개까지, 넘으면 가장 오래 안 본 세션을
+#   UI_SPILL_DIR 에 JSON 으로 내리고 다시 열 때 읽음
+
+PAGE_SIZE = int(os.getenv("UI_PAGE_SIZE", "20"))
+MAX_LIVE_SESSIONS = int(os.getenv("UI_MAX_LIVE_SESSIONS", "10"))
+SPILL_DIR = os.getenv("UI_SPILL_DIR", os.path.join(tempfile.gettempdir(), "stb-chat"))
+NEW_TITLE = "새 채팅"
+
+def _trim_title(s: str, limit: int = 24) -> str:
+    s = (s or "").strip()
+    return s if len(s) <= limit else s[:limit] + "…"
+
+class ChatStore:
+    def __init__(
+        self,
+        render: Callable[[dict], str],
+        page_size: int = PAGE_SIZE,
+        max_live: int = MAX_LIVE_SESSIONS,
+        spill_dir: str = SPILL_DIR,
+    ):
+        self.render = render
+        self.page_size = page_size
+        self.max_live = max_live
+        self.spill_dir = spill_dir
+        self.sessions: "OrderedDict[str, dict]" = OrderedDict()  # 최신순
+        self._live: "OrderedDict[str, None]" = OrderedDict()     # 메시지를 메모리에 둔 세션(최근 사용 순)
+        self._labels: Optional[List[str]] = None
+        self._uid: Optional[str] = None  # 내릴 때 정함(Gradio 는 초기 State 를 사용자마다 복사하므로)
+
+    # --- 세션 목록 ---
+    def new(self) -> str:
+        sid = str(uuid.uuid4())[:8]
+        self.sessions[sid] = {
+            "title": NEW_TITLE,
+            "created": dt.datetime.now().isoformat(),
+            "messages": [],
+            "session_id": uuid.uuid4().hex,  # 서버 측 대화 세션 ID(히스토리는 서버가 보관)
+            "pages": 1,
+        }
+        self.sessions.move_to_end(sid, last=False)
+        self._labels = None
+        self._touch(sid)
+        return sid
+
+    def get(self, sid: str) -> Optional[dict]:
+        return self.sessions.get(sid)
+
+    def latest(self) -> Optional[str]:
+        return next(iter(self.sessions), None)
+
+    def order(self, limit: int | None = None) -> List[str]:
+        return list(islice(self.sessions, limit))
+
+    # 첫 질문으로 제목 설정(새 채팅일 때만)
+    def set_title(self, sid: str, text: str) -> None:
+        meta = self.sessions[sid]
+        if meta["title"] == NEW_TITLE:
+            meta["title"] = _trim_title(text)
+            self._labels = None
+
+    def label(self, sid: str) -> str:
+        return f"{self.sessions[sid]['title'] or NEW_TITLE} · {sid}"
+
+    def labels(self) -> List[str]:
+        if self._labels is None:
+            self._labels = [self.label(sid) for sid in self.sessions]
+        return self._labels
+
+    def delete(self, sid: str) -> Optional[dict]:
+        meta = self.sessions.pop(sid, None)
+        self._live.pop(sid, None)
+        if meta and meta.get("spilled"):
+            try:
+                os.remove(meta["spilled"])
+            except OSError:
+                pass
+        self._labels = None
+        return meta
+
+    # --- 메시지 ---
+    def messages(self, sid: str) -> List[dict]:
+        meta = self.sessions[sid]
+        if meta["messages"] is None:
+            self._load(sid)
+        self._touch(sid)
+        return meta["messages"]
+
+    def append(self, sid: str, role: str, content: str, citations: list | None = None) -> dict:
+        msg = {"role": role, "content": content, "citations": citations or []}
+        self.messages(sid).append(msg)
+        return msg
+
+    # 스트리밍이 끝난 메시지 내용 확정(렌더 캐시 무효화)
+    def update(self, msg: dict, content: str, citations: list | None = None) -> None:
+        msg["content"] = content
+        msg["citations"] = citations or []
+        msg.pop("md", None)
+
+    def clear(self, sid: str) -> None:
+        self.messages(sid).clear()
+        self.sessions[sid]["pages"] = 1
+
+    # 최근 히스토리(내용이 빈 메시지 제외, 뒤에서부터 limit 개만 봄). 서버가 세션을 모를 때(409) 재시도에만 보냄
+    def history(self, sid: str, limit: int = 8) -> List[dict]:
+        out: List[dict] = []
+        for m in reversed(self.messages(sid)):
+            if len(out) >= limit:
+                break
+            if m["content"]:
+                out.append({"role": m["role"], "content": m["content"]})
+        return out[::-1]
+
+    # 렌더된 markdown(메시지마다 한 번만 계산)
+    def rendered(self, msg: dict) -> str:
+        if "md" not in msg:
+            msg["md"] = self.render(msg)
+        return msg["md"]
+
+    # 화면에 보일 최근 메시지와 숨겨진(이전) 메시지 수
+    def window(self, sid: str) -> Tuple[List[dict], int]:
+        msgs = self.messages(sid)
+        n = self.sessions[sid]["pages"] * self.page_size
+        return msgs[-n:], max(0, len(msgs) - n)
+
+    def more(self, sid: str) -> None:
+        self.sessions[sid]["pages"] += 1
+
+    # 세션을 다시 열면 최근 한 페이지부터
+    def select(self, sid: str) -> None:
+        self.sessions[sid]["pages"] = 1
+        self.messages(sid)
+
+    # --- 디스크로 내리기/읽기 ---
+    def _touch(self, sid: str) -> None:
+        self._live[sid] = None
+        self._live.move_to_end(sid)
+        while len(self._live) > self.max_live:
+            oldest = next(iter(self._live))
+            self._live.pop(oldest)
+            self._spill(oldest)
+
+    def _path(self, sid: str) -> str:
+        if self._uid is None:
+            self._uid = uuid.uuid4().hex
+        return os.path.join(self.spill_dir, self._uid, f"{sid}.json")
+
+    def _spill(self, sid: str) -> None:
+        meta = self.sessions.get(sid)
+        if not meta or not meta["messages"]:
+            return
+        path = self._path(sid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta["messages"], f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+        meta["messages"], meta["spilled"] = None, path
+
+    def _load(self, sid: str) -> None:
+        meta = self.sessions[sid]
+        try:
+            with open(meta["spilled"], "r", encoding="utf-8") as f:
+                meta["messages"] = json.load(f)
+        except (OSError, ValueError):
+            meta["messages"] = []  # 임시 디렉터리가 정리된 경우 등: 빈 대화로(서버 세션 히스토리는 유지)
@@ -1,13 +1,24 @@
 import os
+import sys
 import re
-import time
-import uuid
+import json
 import requests
 import gradio as gr
 
+# `streamlit run src/ui/…`/`python src/ui/…` 처럼 스크립트로 실행해도 저장소 루트 기준(src.…) import 가 되도록
+if not __package__:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.ui.chat_store import ChatStore
+
 API_URL = os.getenv("API_URL", "http://localhost:8000/ask")
+STREAM_URL = os.getenv("API_STREAM_URL", API_URL.rstrip("/") + "/stream")
+SESSION_URL = os.getenv("API_SESSION_URL", API_URL.rstrip("/").rsplit("/ask", 1)[0] + "/session")
 K_TOP = int(os.getenv("RETRIEVAL_TOPK", "5"))
 
+# API 호출용 공유 세션(질문마다 TCP/TLS 연결을 새로 맺지 않음)
+_http = requests.Session()
+
 _anchor_re = re.compile(r"#page=\d+", flags=re.IGNORECASE)
 
 def _sanitize(text: str) -> str:
@@ -36,127 +47,150 @@ def _render_refs(citations: list[dict]) -> str:
             lines.append(f"- 📎 {src}")
     return "\n".join(lines)
 
-def _trim_title(s: str, limit: int = 24) -> str:
-    s = (s or "").strip()
-    return s if len(s) <= limit else s[:limit] + "…"
-
-def _default_session():
-    sid = str(uuid.uuid4())[:8]
-    return sid, {"title": "새 채팅", "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "messages": []}
-
-def _choices_from_sessions(sessions: dict):
-    """세션 최신순으로 라벨(제목 · SID) 리스트와 기본 선택 라벨을 반환"""
-    items = sorted(sessions.items(), key=lambda kv: kv[1].get("created", ""), reverse=True)
-    labels = [f"{meta.get('title') or '새 채팅'} · {sid}" for sid, meta in items]
-    value = labels[0] if labels else None
-    return labels, value
-
-def _label_for(sessions: dict, sid: str) -> str:
-    meta = sessions.get(sid, {})
-    return f"{meta.get('title') or '새 채팅'} · {sid}"
+def _iter_sse(resp):
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+# 메시지 한 건의 markdown(ChatStore 가 메시지마다 한 번만 호출해 저장)
+def _render(msg: dict) -> str:
+    if msg["role"] != "assistant":
+        return msg["content"]
+    return _sanitize(msg["content"]) + _render_refs(msg.get("citations") or [])
+
+# 챗봇에 넘길 최근 메시지(한 페이지씩), 이전 메시지가 남아 있으면 더 보기 버튼 표시
+def _view(store: ChatStore, sid: str):
+    msgs, hidden = store.window(sid)
+    chat = [{"role": m["role"], "content": store.rendered(m)} for m in msgs]
+    more = gr.update(visible=hidden > 0, value=f"⬆ 이전 메시지 더 보기 ({hidden}개)")
+    return chat, more
+
+# 스트리밍 API 호출: 요청에는 세션 ID 와 새 질문만(히스토리는 서버 세션에서).
+# 서버가 세션을 모르면(409 unknown_session: 다른 인스턴스/재시작) 최근 히스토리를 붙여 한 번만 재시도
+def _post_stream(payload: dict, history: list) -> requests.Response:
+    r = _http.post(STREAM_URL, json=payload, stream=True, timeout=120)
+    if r.status_code == 409 and history:
+        r.close()
+        r = _http.post(STREAM_URL, json={**payload, "history": history}, stream=True, timeout=120)
+    r.raise_for_status()
+    return r
+
+# 서버 세션 정리(실패해도 서버 TTL 로 만료)
+def _forget(sess: dict | None):
+    if not sess or not sess.get("session_id"):
+        return
+    try:
+        _http.delete(f"{SESSION_URL}/{sess['session_id']}", timeout=5)
+    except requests.RequestException:
+        pass
 
-def _parse_sid(choice_label: str, sessions: dict) -> str | None:
+def _parse_sid(choice_label: str, store: ChatStore) -> str | None:
     if not choice_label:
         return None
     if "·" in choice_label:
         maybe_sid = choice_label.split("·")[-1].strip()
-        if maybe_sid in sessions:
+        if store.get(maybe_sid):
             return maybe_sid
-    return choice_label if choice_label in sessions else None
+    return choice_label if store.get(choice_label) else None
 
 # ---------------- Callbacks ----------------
-def respond(message: str, messages: list[dict], sessions: dict, current_choice: str):
-    sid = _parse_sid(current_choice, sessions)
+def respond(message: str, store: ChatStore, current_choice: str):
+    sid = _parse_sid(current_choice, store)
     if not sid:
         # 방어적으로 새 세션 만듦
-        sid, sess = _default_session()
-        sessions[sid] = sess
+        sid = store.new()
+    sess = store.get(sid)
+    store.set_title(sid, message)
 
-    history = (messages or [])[-8:]
+    # ← 핵심: 제목이 바뀌었을 수 있으므로 choices와 value를 같이 갱신(라벨 목록은 바뀔 때만 다시 만듦)
+    radio = gr.update(choices=store.labels(), value=store.label(sid))
 
+    history = store.history(sid)  # 409 재시도에 쓸 히스토리(이번 질문 전까지)
+    store.append(sid, "user", message)
+    reply = store.append(sid, "assistant", "")
+    chat, more = _view(store, sid)
+
+    answer, citations = "", []
     try:
-        r = requests.post(
-            API_URL, json={"question": message, "k": K_TOP, "history": history}, timeout=120
-        )
-        r.raise_for_status()
-        data = r.json()
-        answer = _sanitize((data.get("answer") or "").strip() or "_(빈 응답)_")
-        refs = _render_refs(data.get("citations", []))
-        reply = answer + refs
+        with _post_stream(
+            {"question": message, "k": K_TOP, "session_id": sess["session_id"], "resume": bool(history)}, history
+        ) as r:
+            for event, data in _iter_sse(r):
+                if event == "citations":
+                    citations = data
+                elif event == "token":
+                    answer += data.get("t", "")
+                    chat[-1]["content"] = _sanitize(answer)
+                    yield "", chat, store, radio, more
+                elif event == "error":
+                    raise RuntimeError(data.get("error"))
+        store.update(reply, answer.strip() or "_(빈 응답)_", citations)
     except Exception as e:
-        reply = f"❌ 요청 실패: {e}"
-
-    new_messages = (messages or []) + [
-        {"role": "user", "content": message},
-        {"role": "assistant", "content": reply},
-    ]
-
-    sess = sessions.get(sid, {"title": "새 채팅", "created": "", "messages": []})
-    if sess.get("title") == "새 채팅":
-        sess["title"] = _trim_title(message)
-    sess["messages"] = new_messages
-    sessions[sid] = sess
-
-    # ← 핵심: 제목이 바뀌었을 수 있으므로 choices와 value를 같이 갱신
-    labels, _ = _choices_from_sessions(sessions)
-    current_label = _label_for(sessions, sid)
-
-    return "", new_messages, sessions, gr.update(choices=labels, value=current_label)
-
-def new_chat(sessions: dict, current_choice: str):
-    cur_sid = _parse_sid(current_choice, sessions)
-    if cur_sid:
-        cur = sessions.get(cur_sid)
-        if cur and not cur.get("messages"):
-            labels, _ = _choices_from_sessions(sessions)
-            return sessions, gr.update(choices=labels, value=_label_for(sessions, cur_sid)), []
-
-    sid, sess = _default_session()
-    sessions[sid] = sess
-    labels, _ = _choices_from_sessions(sessions)
-    return sessions, gr.update(choices=labels, value=_label_for(sessions, sid)), []
-
-def select_chat(choice_label: str, sessions: dict):
-    sid = _parse_sid(choice_label, sessions)
+        store.update(reply, f"❌ 요청 실패: {e}")
+
+    chat[-1]["content"] = store.rendered(reply)
+    yield "", chat, store, radio, more
+
+def new_chat(store: ChatStore, current_choice: str):
+    cur_sid = _parse_sid(current_choice, store)
+    cur = store.get(cur_sid) if cur_sid else None
+    sid = cur_sid if cur and cur["messages"] == [] else store.new()
+    chat, more = _view(store, sid)
+    return store, gr.update(choices=store.labels(), value=store.label(sid)), chat, more
+
+def select_chat(choice_label: str, store: ChatStore):
+    sid = _parse_sid(choice_label, store)
     if not sid:
-        return gr.update(), []
-    msgs = sessions[sid].get("messages", [])
+        return gr.update(), [], gr.update(visible=False)
+    store.select(sid)
+    chat, more = _view(store, sid)
     # 선택값만 바꾸면 됨(choices는 유지)
-    return gr.update(value=_label_for(sessions, sid)), msgs
+    return gr.update(value=store.label(sid)), chat, more
 
-def delete_chat(sessions: dict, current_choice: str):
-    sid = _parse_sid(current_choice, sessions)
-    if sid and sid in sessions:
-        sessions.pop(sid, None)
+def show_more(store: ChatStore, current_choice: str):
+    sid = _parse_sid(current_choice, store)
+    if not sid:
+        return [], gr.update(visible=False)
+    store.more(sid)
+    return _view(store, sid)
 
-    if not sessions:
-        sid, sess = _default_session()
-        sessions[sid] = sess
+def delete_chat(store: ChatStore, current_choice: str):
+    sid = _parse_sid(current_choice, store)
+    if sid:
+        _forget(store.delete(sid))
 
-    labels, _ = _choices_from_sessions(sessions)
     # 최신 세션으로 이동
-    latest_label = labels[0]
-    latest_sid = _parse_sid(latest_label, sessions)
-    msgs = sessions[latest_sid].get("messages", []) if latest_sid else []
-
-    return sessions, gr.update(choices=labels, value=latest_label), msgs
-
-def clear_session_messages(sessions: dict, current_choice: str):
-    sid = _parse_sid(current_choice, sessions)
-    if sid in sessions:
-        sessions[sid]["messages"] = []
-        return sessions, [], gr.update(value=_label_for(sessions, sid))
-    return sessions, [], gr.update()
+    latest_sid = store.latest() or store.new()
+    store.select(latest_sid)
+    chat, more = _view(store, latest_sid)
+    return store, gr.update(choices=store.labels(), value=store.label(latest_sid)), chat, more
+
+def clear_session_messages(store: ChatStore, current_choice: str):
+    sid = _parse_sid(current_choice, store)
+    if sid:
+        _forget(store.get(sid))
+        store.clear(sid)
+        return store, [], gr.update(value=store.label(sid)), gr.update(visible=False)
+    return store, [], gr.update(), gr.update(visible=False)
 
 # ---------------- UI ----------------
-init_sid, init_sess = _default_session()
-init_sessions = {init_sid: init_sess}
-init_labels, init_value = _choices_from_sessions(init_sessions)
+init_store = ChatStore(_render)
+init_sid = init_store.new()
+init_labels, init_value = init_store.labels(), init_store.label(init_sid)
 
 with gr.Blocks(title="KT STB 개발 도우미") as demo:
     gr.Markdown("## 🛠️ KT STB 개발 도우미\nKT OIPF / olleh tv / SCTE-35 / Cue-Tone 문서 기반 개발 도움 챗봇")
 
-    sessions_state = gr.State(init_sessions)
+    sessions_state = gr.State(init_store)
 
     with gr.Row(equal_height=True):
         with gr.Column(scale=1, min_width=280):
@@ -167,6 +201,7 @@ with gr.Blocks(title="KT STB 개발 도우미") as demo:
                 btn_del = gr.Button("✖ 삭제", variant="stop")
 
         with gr.Column(scale=4):
+            btn_more = gr.Button("⬆ 이전 메시지 더 보기", size="sm", visible=False)
             chatbot = gr.Chatbot(type="messages", height=520, label="대화", value=[])
             msg = gr.Textbox(placeholder="무엇을 도와드릴까요? 예) Mosaic Window 예제", lines=3, autofocus=True)
             with gr.Row():
@@ -177,37 +212,44 @@ with gr.Blocks(title="KT STB 개발 도우미") as demo:
     btn_new.click(
         new_chat,
         inputs=[sessions_state, session_radio],
-        outputs=[sessions_state, session_radio, chatbot],
+        outputs=[sessions_state, session_radio, chatbot, btn_more],
     )
 
     session_radio.change(
         select_chat,
         inputs=[session_radio, sessions_state],
-        outputs=[session_radio, chatbot],
+        outputs=[session_radio, chatbot, btn_more],
+    )
+
+    btn_more.click(
+        show_more,
+        inputs=[sessions_state, session_radio],
+        outputs=[chatbot, btn_more],
     )
 
     btn_del.click(
         delete_chat,
         inputs=[sessions_state, session_radio],
-        outputs=[sessions_state, session_radio, chatbot],
+        outputs=[sessions_state, session_radio, chatbot, btn_more],
     )
 
     btn_clear.click(
         clear_session_messages,
         inputs=[sessions_state, session_radio],
-        outputs=[sessions_state, chatbot, session_radio],
+        outputs=[sessions_state, chatbot, session_radio, btn_more],
         queue=False,
     )
 
+    # 대화 내용은 세션 저장소에 있으므로 챗봇 값(전체 대화)을 입력으로 다시 보내지 않음
     msg.submit(
         respond,
-        inputs=[msg, chatbot, sessions_state, session_radio],
-        outputs=[msg, chatbot, sessions_state, session_radio],
+        inputs=[msg, sessions_state, session_radio],
+        outputs=[msg, chatbot, sessions_state, session_radio, btn_more],
     )
     btn_send.click(
         respond,
-        inputs=[msg, chatbot, sessions_state, session_radio],
-        outputs=[msg, chatbot, sessions_state, session_radio],
+        inputs=[msg, sessions_state, session_radio],
+        outputs=[msg, chatbot, sessions_state, session_radio, btn_more],
     )
 
 if __name__ == "__main__":
@@ -1,59 +1,71 @@
 import os
-import uuid
+import sys
 import requests
-import datetime as dt
 import streamlit as st
 import re
+import json
+
+# `streamlit run src/ui/…`/`python src/ui/…` 처럼 스크립트로 실행해도 저장소 루트 기준(src.…) import 가 되도록
+if not __package__:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.ui.chat_store import ChatStore
 
 API_URL = os.getenv("API_URL", "http://localhost:8000/ask")
+STREAM_URL = os.getenv("API_STREAM_URL", API_URL.rstrip("/") + "/stream")
+SESSION_URL = os.getenv("API_SESSION_URL", API_URL.rstrip("/").rsplit("/ask", 1)[0] + "/session")
 K_TOP = int(os.getenv("RETRIEVAL_TOPK", "5"))
 
 st.set_page_config(page_title="KT STB 개발 도우미", layout="wide", initial_sidebar_state="expanded")
 
-# --- 세션 상태 초기화 ---
-if "sessions" not in st.session_state:
-    st.session_state.sessions = {}
-if "current_sid" not in st.session_state:
-    sid = str(uuid.uuid4())[:8]
-    st.session_state.current_sid = sid
-    st.session_state.sessions[sid] = {
-        "title": "새 채팅",
-        "created": dt.datetime.now().isoformat(),
-        "messages": [],
-    }
+# API 호출용 공유 세션(프로세스당 하나, 질문마다 TCP/TLS 연결을 새로 맺지 않음)
+@st.cache_resource
+def api_session() -> requests.Session:
+    return requests.Session()
 
 # --- 세션 조작 ---
 # 새 채팅 세션 생성
 def new_chat():
-    cur = st.session_state.sessions.get(st.session_state.current_sid)
-    if cur and not cur["messages"]:
+    store = st.session_state.store
+    cur = store.get(st.session_state.current_sid)
+    if cur and cur["messages"] == []:
         return
-    sid = str(uuid.uuid4())[:8]
-    st.session_state.sessions[sid] = {
-        "title": "새 채팅",
-        "created": dt.datetime.now().isoformat(),
-        "messages": [],
-    }
-    st.session_state.current_sid = sid
+    st.session_state.current_sid = store.new()
 
-# 채팅 히스토리 세션 선택(활성화 표시)
+# 채팅 히스토리 세션 선택(활성화 표시, 최근 한 페이지부터)
 def select_chat(sid: str):
+    st.session_state.store.select(sid)
     st.session_state.current_sid = sid
 
 # 채팅 히스토리 세션 삭제
 def delete_chat(sid: str):
+    store = st.session_state.store
     was = sid == st.session_state.current_sid
-    st.session_state.sessions.pop(sid, None)
-    if not st.session_state.sessions:
-        new_chat()  #모두 삭제될 경우 새채팅 생성
+    removed = store.delete(sid)
+    if removed:
+        try:
+            api_session().delete(f"{SESSION_URL}/{removed['session_id']}", timeout=5)  # 서버 세션도 정리(실패해도 TTL 로 만료)
+        except requests.RequestException:
+            pass
+    if not store.sessions:
+        st.session_state.current_sid = store.new()  #모두 삭제될 경우 새채팅 생성
         return
     if was:
-        rest = sorted(
-            st.session_state.sessions.items(),
-            key=lambda x: x[1]["created"],
-            reverse=True,
-        )
-        st.session_state.current_sid = rest[0][0]
+        st.session_state.current_sid = store.latest()
+
+# 스트리밍 API 호출: 요청에는 세션 ID 와 새 질문만(히스토리는 서버 세션에서).
+# 서버가 세션을 모르면(409 unknown_session: 다른 인스턴스/재시작) 최근 히스토리를 붙여 한 번만 재시도
+def post_stream(payload: dict, history: list) -> requests.Response:
+    r = api_session().post(STREAM_URL, json=payload, stream=True, timeout=120)
+    if r.status_code == 409 and history:
+        r.close()
+        r = api_session().post(STREAM_URL, json={**payload, "history": history}, stream=True, timeout=120)
+    r.raise_for_status()    # HTTP 오류 발생 시 예외
+    return r
+
+# 이전 메시지 한 페이지 더 보기
+def show_more(sid: str):
+    st.session_state.store.more(sid)
 
 # --- 표시 유틸 ---
 # 답변 텍스트에서 페이지 제거(올바른 페이지 출력X)
@@ -86,80 +98,94 @@ def render_references(citations: list[dict]) -> str:
             lines.append(f"- 📎 {src}")
     return "\n".join(lines)
 
+# 메시지 한 건의 markdown(ChatStore 가 메시지마다 한 번만 호출해 저장)
+def render_message(msg: dict) -> str:
+    if msg["role"] != "assistant":
+        return msg["content"]
+    refs = render_references(msg.get("citations") or [])
+    return sanitize_answer(msg["content"]) + (f"\n\n{refs}" if refs else "")
+
+# --- 세션 상태 초기화 ---
+if "store" not in st.session_state:
+    st.session_state.store = ChatStore(render_message)
+    st.session_state.current_sid = st.session_state.store.new()
+
+# SSE 응답을 (event, data) 단위로 파싱
+def iter_sse(resp):
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
 # --- 메인 영역 ---
+store = st.session_state.store
 sid = st.session_state.current_sid
-session = st.session_state.sessions[sid]
+session = store.get(sid)
 
 st.title("KT STB 개발 도우미")
 
-# 과거 메시지 렌더
-for msg in session["messages"]:
+# 과거 메시지 렌더(최근 한 페이지만, 렌더 결과는 메시지별 캐시)
+visible, hidden = store.window(sid)
+if hidden:
+    st.button(f"⬆ 이전 메시지 더 보기 ({hidden}개)", on_click=show_more, args=(sid,))
+for msg in visible:
     with st.chat_message("user" if msg["role"] == "user" else "assistant"):
-        content = sanitize_answer(msg["content"]) if msg["role"] == "assistant" else msg["content"]
-        st.markdown(content)
-        if msg["role"] == "assistant" and msg.get("citations"):
-            st.markdown(render_references(msg["citations"]))
+        st.markdown(store.rendered(msg))
 
 # 입력 → 백엔드 호출 → 응답 표시
 prompt = st.chat_input("메시지를 입력하세요.")  # 사용자 입력
 if prompt:
-    # 사용자 메시지 저장/표시
-    session["messages"].append({"role": "user", "content": prompt}) #사용자 입력을 세션 message에 user role로 저장.
+    # 사용자 메시지 저장/표시(409 재시도에 쓸 히스토리는 이번 질문 전까지)
+    history = store.history(sid)
+    store.append(sid, "user", prompt) #사용자 입력을 세션 message에 user role로 저장.
     with st.chat_message("user"):
         st.markdown(prompt)
 
     # 첫 질문으로 세션 타이틀 설정
-    if session["title"] == "새 채팅":
-        t = prompt.strip()
-        session["title"] = t if len(t) <= 24 else t[:24] + "…"
-
-    # 최근 대화 일부만 히스토리로 전달
-    hist = [
-        {"role": m["role"], "content": m["content"]}
-        for m in session["messages"][-8:]
-        if m["role"] in ("user", "assistant")
-    ]
+    store.set_title(sid, prompt)
 
     with st.chat_message("assistant"):
-        with st.spinner("답변 생성 중..."):
-            try:
-                # 사용자 입력으로 Flask API 호출(question, k, history)
-                r = requests.post(
-                    API_URL,
-                    json={"question": prompt, "k": K_TOP, "history": hist},
-                    timeout=120,
+        placeholder = st.empty()
+        answer, citations = "", []
+        try:
+            # 스트리밍 API 호출: 인용 → 답변 토큰 순으로 수신하며 즉시 렌더
+            with st.spinner("답변 생성 중..."):
+                r = post_stream(
+                    {"question": prompt, "k": K_TOP, "session_id": session["session_id"], "resume": bool(history)},
+                    history,
                 )
-                r.raise_for_status()    # HTTP 오류 발생 시 예외
-                data = r.json()      # JSON 응답 파싱
-                answer = (data.get("answer") or "").strip() or "_(빈 응답)_"    #질문에 대한 답변 저장
-                citations = data.get("citations", [])                         #질문에 대한 답변의 출처 저장   
-                st.markdown(sanitize_answer(answer))                      #답변 표시
-                if citations:
-                    st.markdown(render_references(citations))             #출처가 있으면 출처 표시
-                session["messages"].append(
-                    {"role": "assistant", "content": answer, "citations": citations}      #답변을 세션 message에 assistant role로 저장.
-                )
-            except Exception as e:
-                err = f"요청 실패: {e}"
-                st.error(err)
-                session["messages"].append(
-                    {"role": "assistant", "content": err, "citations": []}
-                )
-
-# 상태 저장 (사이드바는 아래에서 렌더)
-st.session_state.sessions[sid] = session
+            with r:
+                for event, data in iter_sse(r):
+                    if event == "citations":
+                        citations = data                                  #질문에 대한 답변의 출처 저장
+                    elif event == "token":
+                        answer += data.get("t", "")
+                        placeholder.markdown(sanitize_answer(answer) + "▌")   #받은 토큰까지 표시
+                    elif event == "error":
+                        raise RuntimeError(data.get("error"))
+            answer = answer.strip() or "_(빈 응답)_"
+            msg = store.append(sid, "assistant", answer, citations)      #답변을 세션 message에 assistant role로 저장.
+            placeholder.markdown(store.rendered(msg))                  #답변(+ 출처) 표시
+        except Exception as e:
+            err = f"요청 실패: {e}"
+            st.error(err)
+            store.append(sid, "assistant", err)
 
 # --- 사이드바 (맨 아래로 이동: 같은 런에서 최신 타이틀 반영) ---
 with st.sidebar:
     st.markdown("### 채팅 히스토리")
     st.button("➕ 새 채팅", use_container_width=True, on_click=new_chat)
     st.divider()
-    items = sorted(
-        st.session_state.sessions.items(),
-        key=lambda x: x[1]["created"],
-        reverse=True,
-    )[:30]
-    for sid, meta in items:
+    for sid in store.order(30):
+        meta = store.get(sid)
         is_cur = sid == st.session_state.current_sid
         title = meta["title"] if meta["title"] != "새 채팅" else sid
         c1, c2 = st.columns([1.0, 0.2])